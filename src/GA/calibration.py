@@ -0,0 +1,102 @@
+import copy
+import itertools
+import time
+import numpy as np
+
+from dataclasses import dataclass, replace
+from scipy import stats
+
+from .DNA import DNA, MutationRules
+from .fitness import ODECoilFitness
+from ode_models.simulation import SolverConf
+
+
+"""
+Calibrate the ODE solver settings of the fitness function.
+
+A sample of DNA is scored with a very accurate reference and with every candidate
+setting. A candidate is judged by how much it costs, how far its scores are from the
+reference and how often it changes the outcome of a duel in the selection (versus),
+which is all the GA uses the scores for.
+"""
+
+
+@dataclass
+class CalibrationResult:
+	"""How well a solver setting reproduces the reference scores"""
+
+	solver_conf: SolverConf 	# The candidate setting
+	time: float 				# [s] Mean wall time per evaluation
+	max_error: float 			# [-] Largest absolute error in the efficiency
+	mean_error: float 			# [-] Mean absolute error in the efficiency
+	rank_correlation: float 	# [-] Spearman rank correlation with the reference
+	duel_agreement: float 		# [-] Fraction of the pairs of DNA where the same DNA wins the duel (ties excluded)
+
+
+def sample_DNA(base_dna: DNA, rules: MutationRules, samples: int) -> list[DNA]:
+	"""Return DNA randomized with the rules in the same way as the first generation"""
+	dnas = []
+	for _ in range(samples):
+		dna = DNA(copy.deepcopy(base_dna.DNA))
+		dna.randomize_DNA(rules)
+		dnas.append(dna)
+	return dnas
+
+
+def candidate_confs(base_conf: SolverConf, methods: list[str], rtols: list[float], atols: list[float], max_steps: list[float]) -> list[SolverConf]:
+	"""Return a solver conf for every combination of the settings. Other settings are taken from the base conf"""
+	return [
+		replace(base_conf, method=method, rtol=rtol, atol=atol, max_step=max_step)
+		for method, rtol, atol, max_step in itertools.product(methods, rtols, atols, max_steps)
+	]
+
+
+def duel_agreement(scores: np.ndarray, reference: np.ndarray, tie_tolerance: float=0.0) -> float:
+	"""
+	Return the fraction of the pairs where the scores pick the same winner as the reference.
+	Pairs where the reference scores differ by less than tie_tolerance are ties that any solver may flip
+	"""
+	i, j = np.triu_indices(len(scores), k=1)
+	decided = np.abs(reference[i] - reference[j]) > tie_tolerance
+	i, j = i[decided], j[decided]
+
+	same = np.sign(scores[i] - scores[j]) == np.sign(reference[i] - reference[j])
+	return np.mean(same) if same.size > 0 else 1.0
+
+
+def score_DNA(dnas: list[DNA], max_time: float, solver_conf: SolverConf) -> tuple[np.ndarray, float]:
+	"""Return the fitness of every DNA and the mean wall time per evaluation"""
+	fitness = ODECoilFitness(max_time=max_time, solver_conf=solver_conf)
+
+	start = time.perf_counter()
+	scores = np.array([fitness(dna) for dna in dnas])
+	return scores, (time.perf_counter() - start) / len(dnas)
+
+
+def calibrate(dnas: list[DNA], max_time: float, reference_conf: SolverConf, confs: list[SolverConf], tie_tolerance: float=0.0) -> list[CalibrationResult]:
+	"""Compare every solver conf with the reference on the sample of DNA"""
+	reference, _ = score_DNA(dnas, max_time, reference_conf)
+
+	results = []
+	for conf in confs:
+		scores, eval_time = score_DNA(dnas, max_time, conf)
+		error = np.abs(scores - reference)
+
+		results.append(CalibrationResult(
+			solver_conf=conf,
+			time=eval_time,
+			max_error=np.max(error),
+			mean_error=np.mean(error),
+			rank_correlation=stats.spearmanr(scores, reference)[0] if len(dnas) > 1 else 1.0,
+			duel_agreement=duel_agreement(scores, reference, tie_tolerance)
+		))
+
+	return results
+
+
+def recommend(results: list[CalibrationResult], min_agreement: float=1.0) -> CalibrationResult:
+	"""Return the cheapest result that keeps the duels as the reference decides them, or None"""
+	accepted = [result for result in results if result.duel_agreement >= min_agreement]
+	if not accepted:
+		return None
+	return min(accepted, key=lambda result: result.time)
@@ -1,13 +1,17 @@
 import os
 import math
 
+import numpy as np
+
 from typing import Callable
 from abc import ABC, abstractmethod
 from random import random
 from pathlib import Path
 
 from .DNA import DNA, MutationRules
+from .executor import Executor, SerialExecutor
 from .fitness import FitnessFunction
+from .population import Population
 from .recorder import Recorder
 
 
@@ -22,10 +26,24 @@ class Breeding:
 	def breed(self, gen_score: list[tuple[DNA, float]]):
 		"""Breed DNA with eachother"""
 
+	def breed_population(self, population: Population, scores: np.ndarray) -> Population:
+		"""Breed a new population of the same size. Slow default that breeds one DNA at a time"""
+		gen_score = list(zip(population, scores))
+		children = [self.breed(gen_score) for _ in range(len(population))]
+		genomes = [[child[name] for name in population.genes.names] for child in children]
+		return Population(genes=population.genes, genomes=genomes, shared=population.shared, rng=population.rng)
+
 
 class CrossBreeding(Breeding):
 	"""Breed two parnet DNA with eachother. The offspring takes DNA from both parents with 50% probability"""
 
+	def __init__(self, parent_selection: Callable, population_selection: Callable=None):
+		"""
+		population_selection: Callable 	# Vectorized parent selection for populations, (scores, n, rng) -> indices
+		"""
+		super().__init__(parent_selection)
+		self.population_selection = population_selection
+
 	def breed(self, gen_score: list[tuple[DNA, float]]) -> DNA:
 		parent_A = self.parent_selection(gen_score).DNA
 		parent_B = self.parent_selection(gen_score).DNA
@@ -37,23 +55,35 @@ class CrossBreeding(Breeding):
 
 		return DNA(child)
 
+	def breed_population(self, population: Population, scores: np.ndarray) -> Population:
+		if self.population_selection is None:
+			return super().breed_population(population, scores)
+
+		# Uniform crossover of all children at once
+		n = len(population)
+		parents_A = self.population_selection(scores, n, population.rng)
+		parents_B = self.population_selection(scores, n, population.rng)
+		return population.crossover(parents_A, parents_B)
+
 
 class Evolution:
 	"""Hold data the evolution of the DNA"""
 
 	def __init__(
 		self, 
-		generation: list[DNA], 
+		generation: list[DNA] | Population, 
 		last_gen: int, 
 		fitness_func: FitnessFunction, 
 		breeding_protocol: Breeding, 
-		mutation_rules: MutationRules
+		mutation_rules: MutationRules,
+		executor: Executor=None
 	):
 		self.generation = generation
 		self.last_gen = last_gen
 		self.fitness_func = fitness_func
 		self.breeding_protocol = breeding_protocol
 		self.mutation_rules = mutation_rules
+		self.executor = executor if executor is not None else SerialExecutor()
 
 		self.population = len(generation)
 		self.current_gen = 0
@@ -70,7 +100,12 @@ class Evolution:
 		self.current_gen += 1
 
 		# Calculate the fitness for all DNA in the current generation
-		self.generation_score = [(dna, self.fitness_func(dna)) for dna in self.generation]
+		if isinstance(self.fitness_func, FitnessFunction):
+			scores = self.fitness_func.evaluate_generation(self.generation, self.executor)
+		else:
+			scores = self.executor.map(self.fitness_func, self.generation)
+		self.generation_score = list(zip(self.generation, scores))
+		self.scores = np.asarray(scores, dtype=float)
 
 		# Get the best score and DNA from this generation
 		gen_best = max(self.generation_score, key=lambda x: x[1])
@@ -81,10 +116,17 @@ class Evolution:
 
 		return self.generation_score
 
-	def next_gen(self) -> list[DNA]:
+	def next_gen(self) -> list[DNA] | Population:
 		"""Evolve the next generation"""
 		self.evaluate_gen()
 
+		# Breed and mutate the genome matrix of the population in one go
+		if isinstance(self.generation, Population):
+			new_gen = self.breeding_protocol.breed_population(self.generation, self.scores)
+			new_gen.mutate()
+			self.generation = new_gen
+			return self.generation
+
 		# Breed the next generation
 		new_gen = [self.breeding_protocol.breed(self.generation_score) for _ in range(self.population)]
 
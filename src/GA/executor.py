@@ -0,0 +1,114 @@
+import os
+import math
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from enum import Enum
+from typing import Callable, Iterable
+
+
+class ExecutorEnum(Enum):
+	serial = "serial"
+	thread = "thread"
+	process = "process"
+
+
+class Executor(ABC):
+	"""
+	Evaluate a function over a population.
+	The results are always returned in the same order as the input
+	"""
+
+	@abstractmethod
+	def map(self, func: Callable, items: Iterable) -> list:
+		"""Return [func(item) for item in items]"""
+
+	def close(self):
+		"""Release the workers held by the executor"""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+class SerialExecutor(Executor):
+	"""Evaluate one item at a time in the current process"""
+
+	def map(self, func: Callable, items: Iterable) -> list:
+		return [func(item) for item in items]
+
+
+class ThreadExecutor(Executor):
+	"""
+	Evaluate the items in a pool of threads.
+	Only useful when the function releases the GIL (e.g. heavy numpy work)
+	"""
+
+	def __init__(self, workers: int=None):
+		self.workers = workers or os.cpu_count()
+		self.pool = None
+
+	def map(self, func: Callable, items: Iterable) -> list:
+		# The pool is created once and reused for every generation
+		if self.pool is None:
+			self.pool = ThreadPoolExecutor(max_workers=self.workers)
+		return list(self.pool.map(func, items))
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+
+
+def _init_worker():
+	"""
+	Import the heavy modules once when a worker starts so it is
+	not paid again for every task
+	"""
+	import scipy.integrate
+	import ode_models.coilgun
+	import ode_models.simulation
+
+
+class ProcessExecutor(Executor):
+	"""
+	Evaluate the items in a pool of preforked worker processes.
+	The function and the items must be picklable
+	"""
+
+	def __init__(self, workers: int=None, chunks_per_worker: int=4):
+		self.workers = workers or os.cpu_count()
+		self.chunks_per_worker = chunks_per_worker
+		self.pool = None
+
+	def start(self):
+		"""Start the workers. Called automatically on the first map"""
+		if self.pool is None:
+			self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+	def map(self, func: Callable, items: Iterable) -> list:
+		self.start()
+		items = list(items)
+
+		# Send the items in a few large chunks to keep the pickling overhead low
+		chunksize = max(1, math.ceil(len(items) / (self.workers * self.chunks_per_worker)))
+		return list(self.pool.map(func, items, chunksize=chunksize))
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+
+
+def executor_from_name(name: str, workers: int=None) -> Executor:
+	"""Create an executor from its name"""
+	executor_enum = ExecutorEnum[name]
+
+	if executor_enum == ExecutorEnum.serial:
+		return SerialExecutor()
+	elif executor_enum == ExecutorEnum.thread:
+		return ThreadExecutor(workers=workers)
+	elif executor_enum == ExecutorEnum.process:
+		return ProcessExecutor(workers=workers)
@@ -1,14 +1,21 @@
+import itertools
+import numpy as np
+
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from random import random
 from typing import Callable
 
 from .DNA import DNA
+from .executor import Executor
 from coilgun.coil import Coil, CoilEnum, GeometryCoil, Solenoid
-from coilgun.power_source import ConstantCurrent, ConstantVoltage, PowerSource, PowerSourceEnum
+from coilgun.power_source import CapacitorBank, ConstantCurrent, ConstantVoltage, PowerSource, PowerSourceEnum
 from coilgun.projectile import Projectile1D, MagneticProjectile, FerromageneticProjectile, ProjectileEnum
-from simulation.simulate import CoilgunSimulation, SimulationConf
+from simulation.simulate import CoilgunSimulation, SimulationConf, SummaryRecording
+from simulation.batch import BatchCoilgunSimulation
 
 from ode_models.coilgun import ode_solver_coilgun, calculate_efficiency
-from ode_models.simulation import CoilgunSimulationODE
+from ode_models.simulation import CoilgunSimulationODE, SolverConf
 
 def coil_from_DNA(dna: DNA) -> Coil:
 	"""Create a coil from the DNA"""
@@ -44,6 +51,12 @@ def power_source_from_DNA(dna: DNA) -> PowerSource:
 		return ConstantVoltage(
 			voltage=dna["voltage"]
 		)
+	elif power_enum == PowerSourceEnum.CapacitorBank:
+		return CapacitorBank(
+			capacitance=dna["capacitance"],
+			voltage=dna["voltage"],
+			inductance=dna.DNA.get("inductance", 0.0)
+		)
 	else:
 		raise NoDNAError(f"{dna['PowerType']} is not an implemented power source.")
 
@@ -75,6 +88,15 @@ def projectile_from_DNA(dna: DNA) -> Projectile1D:
 		raise NoDNAError(f"{dna['ProjectileType']} is not an implemented projectile.")
 
 
+def _evaluate_in_batches(evaluate_batch: Callable, generation: list[DNA], executor: Executor) -> list[float]:
+	"""Split the generation into one batch per worker and evaluate the batches with the executor"""
+	batches = np.array_split(np.arange(len(generation)), getattr(executor, "workers", 1))
+	batches = [[generation[i] for i in batch] for batch in batches if len(batch) > 0]
+
+	scores = executor.map(evaluate_batch, batches)
+	return [score for batch_scores in scores for score in batch_scores]
+
+
 class FitnessFunction(ABC):
 	"""A class that calculates the fitness of a population"""
 
@@ -82,12 +104,22 @@ class FitnessFunction(ABC):
 	def __call__(self, dna: DNA) -> float:
 		"""Calculate the fitness of a DNA"""
 
+	def evaluate_generation(self, generation: list[DNA], executor: Executor) -> list[float]:
+		"""Calculate the fitness of every DNA in a generation, in order"""
+		return executor.map(self, generation)
+
+	def statistics(self) -> dict:
+		"""Return statistics about the fitness function that recorders can report"""
+		return {}
+
 
 class CoilFitness(FitnessFunction):
 	"""Calculate the fitness of a coil"""
 
-	def __init__(self, simulation_conf: SimulationConf):
+	def __init__(self, simulation_conf: SimulationConf, batch: bool=False):
 		self.sim_conf = simulation_conf
+		# Simulate a whole generation together with the batch simulation
+		self.batch = batch
 
 	def __call__(self, dna: DNA) -> float:
 		coil = coil_from_DNA(dna)
@@ -101,7 +133,8 @@ class CoilFitness(FitnessFunction):
 			conf=self.sim_conf
 		)
 
-		simulation_data = simulation.run()
+		# Only the start and end velocity and the total energy are needed
+		simulation_data = simulation.run(SummaryRecording())
 
 		# Calculate the efficiency of the coil
 		energy_gain = simulation_data.energy_gain(projectile.mass)
@@ -113,30 +146,314 @@ class CoilFitness(FitnessFunction):
 			n = energy_gain / energy_consumed
 		return n
 
+	def evaluate_batch(self, generation: list[DNA]) -> list[float]:
+		"""Calculate the fitness of many DNA with one batch simulation"""
+		projectiles = [projectile_from_DNA(dna) for dna in generation]
+		simulation = BatchCoilgunSimulation(
+			coils=[coil_from_DNA(dna) for dna in generation],
+			power_sources=[power_source_from_DNA(dna) for dna in generation],
+			projectiles=projectiles,
+			conf=self.sim_conf
+		)
+
+		simulation_data = simulation.run()
+		return simulation_data.efficiency(simulation.mass).tolist()
+
+	def evaluate_generation(self, generation: list[DNA], executor: Executor) -> list[float]:
+		if not self.batch:
+			return super().evaluate_generation(generation, executor)
+		return _evaluate_in_batches(self.evaluate_batch, generation, executor)
+
 
 class ODECoilFitness(FitnessFunction):
 	"""Calculate the fitness of a coil modeled as an ODE"""
 
-	def __init__(self, max_time: float, minimum_solver_steps: int=None):
+	def __init__(self, max_time: float, batch: bool=False, solver_conf: SolverConf=None):
 		self.max_time = max_time
-		self.minimum_solver_steps = minimum_solver_steps
+		# The step size is controlled by the tolerances in the solver conf
+		self.solver_conf = solver_conf
+		# Solve a whole generation together with the batched solver
+		self.batch = batch
 
 	def __call__(self, dna: DNA) -> float:
 		sim = CoilgunSimulationODE.from_DNA(dna)
-		t, x, v, I, V = sim.run(self.max_time, self.minimum_solver_steps)
-
-		v0, v1 = v[0], v[-1]
-		V0, V1 = V[0], V[-1]
+		final_state = sim.run_final(self.max_time, self.solver_conf)
 
 		return calculate_efficiency(
-			v0=v0,
-			v1=v1,
-			V0=V0,
-			V1=V1,
+			v0=final_state.v0,
+			v1=final_state.v,
+			V0=final_state.V0,
+			V1=final_state.V,
 			m=dna["projectile_mass"],
 			C=dna["capacitance"]
 		)
 
+	def evaluate_batch(self, generation: list[DNA]) -> list[float]:
+		"""Calculate the fitness of many DNA with one call to the batched solver"""
+		sims = [CoilgunSimulationODE.from_DNA(dna) for dna in generation]
+		sol = CoilgunSimulationODE.run_batch(sims, self.max_time, self.solver_conf)
+
+		n = calculate_efficiency(
+			v0=np.array([sim.projectile.v0 for sim in sims]),
+			v1=sol.v,
+			V0=np.array([sim.CB.V for sim in sims]),
+			V1=sol.V,
+			m=np.array([sim.projectile.m for sim in sims]),
+			C=np.array([sim.CB.C for sim in sims])
+		)
+		return n.tolist()
+
+	def evaluate_generation(self, generation: list[DNA], executor: Executor) -> list[float]:
+		if not self.batch:
+			return super().evaluate_generation(generation, executor)
+		return _evaluate_in_batches(self.evaluate_batch, generation, executor)
+
+
+def canonical_DNA_key(dna: DNA, float_digits: int=None) -> tuple:
+	"""
+	Return a hashable key for the content of a DNA.
+	If float_digits is given floats are rounded to that many significant digits
+	so that genes that only differ by round off share the same key
+	"""
+	key = []
+	for param in sorted(dna.DNA.keys()):
+		value = dna.DNA[param]
+		if isinstance(value, float) and float_digits is not None:
+			value = float(f"{value:.{float_digits}g}")
+		elif isinstance(value, list):
+			value = tuple(value)
+		key.append((param, value))
+	return tuple(key)
+
+
+class CachedFitness(FitnessFunction):
+	"""
+	Wrap a fitness function in a LRU cache so that DNA
+	that has already been scored is not evaluated again
+	"""
+
+	# Prefix of the statistics
+	name = "cache"
+
+	def __init__(self, fitness_func: FitnessFunction, max_size: int=10000, float_digits: int=None):
+		self.fitness_func = fitness_func
+		self.max_size = max_size
+		self.float_digits = float_digits
+
+		self.cache = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def key(self, dna: DNA) -> tuple:
+		"""Return the key of a DNA in the cache"""
+		return canonical_DNA_key(dna, self.float_digits)
+
+	def _hit(self, dna: DNA, score: float):
+		"""Called when the score of a DNA is taken from the cache"""
+
+	def _new_missing(self) -> dict:
+		"""Return the dict that collects the DNA of a generation that is not in the cache"""
+		return {}
+
+	def _pending(self, key: tuple, missing: dict):
+		"""Return the key in missing whose score a DNA with this key can share, or None"""
+		return key if key in missing else None
+
+	def _lookup(self, key: tuple):
+		"""Return the cached score or None if it is not in the cache"""
+		score = self.cache.get(key)
+		if score is not None:
+			self.cache.move_to_end(key)
+		return score
+
+	def _store(self, key: tuple, score: float):
+		"""Store a score and throw away the least recently used one if the cache is full"""
+		self.cache[key] = score
+		self.cache.move_to_end(key)
+		if len(self.cache) > self.max_size:
+			self.cache.popitem(last=False)
+
+	def __call__(self, dna: DNA) -> float:
+		key = self.key(dna)
+		score = self._lookup(key)
+
+		if score is None:
+			self.misses += 1
+			score = self.fitness_func(dna)
+			self._store(key, score)
+		else:
+			self.hits += 1
+			self._hit(dna, score)
+
+		return score
+
+	def evaluate_generation(self, generation: list[DNA], executor: Executor) -> list[float]:
+		keys = [self.key(dna) for dna in generation]
+
+		# Find the unique DNA that has not been scored before
+		scores = {}
+		missing = self._new_missing()
+		duplicates = []
+		for i, (key, dna) in enumerate(zip(keys, generation)):
+			pending = self._pending(key, missing)
+			if pending is not None:
+				keys[i] = pending
+				duplicates.append((pending, dna))
+				continue
+			if key in scores:
+				self._hit(dna, scores[key])
+				continue
+			score = self._lookup(key)
+			if score is None:
+				missing[key] = dna
+			else:
+				scores[key] = score
+				self._hit(dna, score)
+
+		# Only the missing DNA is sent to the executor
+		if missing:
+			if isinstance(self.fitness_func, FitnessFunction):
+				new_scores = self.fitness_func.evaluate_generation(list(missing.values()), executor)
+			else:
+				new_scores = executor.map(self.fitness_func, list(missing.values()))
+			for key, score in zip(missing.keys(), new_scores):
+				self._store(key, score)
+				scores[key] = score
+
+		# DNA that shares a key with a missing DNA in the same generation reuses its score
+		for key, dna in duplicates:
+			self._hit(dna, scores[key])
+
+		self.misses += len(missing)
+		self.hits += len(generation) - len(missing)
+
+		return [scores[key] for key in keys]
+
+	def statistics(self) -> dict:
+		stats = dict(self.fitness_func.statistics()) if isinstance(self.fitness_func, FitnessFunction) else {}
+		calls = self.hits + self.misses
+		stats[f"{self.name} hits"] = self.hits
+		stats[f"{self.name} misses"] = self.misses
+		stats[f"{self.name} hit rate"] = self.hits / calls if calls > 0 else 0.0
+		return stats
+
+
+class _BinnedDict(dict):
+	"""A dict that also indexes its keys by the bin that bin_key returns for them"""
+
+	def __init__(self, bin_key: Callable):
+		super().__init__()
+		self.bin_key = bin_key
+		self.bins = {}
+
+	def __setitem__(self, key, value):
+		if key not in self:
+			self.bins.setdefault(self.bin_key(key), []).append(key)
+		super().__setitem__(key, value)
+
+
+class SimilarityCachedFitness(CachedFitness):
+	"""
+	Cache the fitness of ODE coilguns by their dimensionless groups instead of their DNA.
+	Designs whose groups agree within a relative tolerance are physically similar and
+	share the same score. A fraction of the hits can be solved again to validate the cache
+	"""
+
+	name = "similarity"
+
+	def __init__(self, fitness_func: ODECoilFitness, tolerance: float=1e-3, max_size: int=10000, validation_rate: float=0.0):
+		super().__init__(fitness_func=fitness_func, max_size=max_size)
+		self.tolerance = tolerance
+		# Fraction of the hits that are also solved to measure the error of the cache
+		self.validation_rate = validation_rate
+
+		self.validations = 0
+		self.max_error = 0.0
+
+	def _bins(self, group: float) -> list:
+		"""
+		Return the bin of a group and the neighbour bin on its nearer side. The bins are twice the
+		tolerance wide on a log scale, so a group within the tolerance of this one is in one of them
+		"""
+		if group is None or group == 0:
+			return [group]
+		u = np.log(abs(group)) / (2*np.log1p(self.tolerance))
+		i = int(np.floor(u))
+		return [(np.sign(group), i), (np.sign(group), i + 1 if u - i >= 0.5 else i - 1)]
+
+	def _bin_keys(self, groups: tuple):
+		"""Return the 2^k bin keys where a design similar to the groups can be stored, for k nonzero groups"""
+		return itertools.product(*(self._bins(group) for group in groups))
+
+	def _home_bin(self, groups: tuple) -> tuple:
+		"""Return the bin key where the groups themselves are stored"""
+		return tuple(self._bins(group)[0] for group in groups)
+
+	def _similar(self, groups: tuple, other: tuple) -> bool:
+		"""Return True if every group is within the relative tolerance of the other one"""
+		for group, other_group in zip(groups, other):
+			if group is None or other_group is None or group == 0 or other_group == 0:
+				if group != other_group:
+					return False
+			elif np.sign(group) != np.sign(other_group):
+				return False
+			elif max(abs(group), abs(other_group)) > (1 + self.tolerance) * min(abs(group), abs(other_group)):
+				return False
+		return True
+
+	def key(self, dna: DNA) -> tuple:
+		sim = CoilgunSimulationODE.from_DNA(dna)
+		return tuple(sim.dimensionless_groups(self.fitness_func.max_time))
+
+	def _lookup(self, groups: tuple):
+		"""Return the score of a cached design that is similar to the groups, or None"""
+		for key in self._bin_keys(groups):
+			entry = self.cache.get(key)
+			if entry is not None and self._similar(groups, entry[0]):
+				self.cache.move_to_end(key)
+				return entry[1]
+		return None
+
+	def _new_missing(self) -> dict:
+		return _BinnedDict(self._home_bin)
+
+	def _pending(self, groups: tuple, missing: '_BinnedDict'):
+		for key in self._bin_keys(groups):
+			for other in missing.bins.get(key, ()):
+				if self._similar(groups, other):
+					return other
+		return None
+
+	def _store(self, groups: tuple, score: float):
+		"""Store the score with the groups in the bin of the groups"""
+		super()._store(self._home_bin(groups), (groups, score))
+
+	def _hit(self, dna: DNA, score: float):
+		if self.validation_rate > 0 and random() < self.validation_rate:
+			self.validate(dna, score)
+
+	def validate(self, dna: DNA, score: float=None) -> float:
+		"""
+		Solve a DNA and return the absolute error of the score in the cache.
+		The largest error is kept in the statistics
+		"""
+		if score is None:
+			score = self._lookup(self.key(dna))
+			if score is None:
+				return 0.0
+
+		error = abs(self.fitness_func(dna) - score)
+		self.validations += 1
+		self.max_error = max(self.max_error, error)
+		return error
+
+	def statistics(self) -> dict:
+		stats = super().statistics()
+		if self.validations > 0:
+			stats[f"{self.name} validations"] = self.validations
+			stats[f"{self.name} max error"] = self.max_error
+		return stats
+
 
 class NoDNAError(Exception):
 	"""Raise when there is no mathing DNA"""
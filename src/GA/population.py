@@ -0,0 +1,163 @@
+import numpy as np
+import yaml
+
+from collections.abc import MutableMapping
+from pathlib import Path
+
+from .DNA import DNA, MutationError, MutationRules
+
+
+"""
+A population of DNA stored as one genome matrix.
+
+Every gene that has a mutation rule is a column of a float matrix with one row per individual,
+the rest of the DNA (e.g. the coil type) is the same for the whole population and is kept once.
+Random initialisation, uniform crossover and mutation are done on the whole matrix at once.
+Indexing a population gives thin DNA views of its rows that work with the code written for DNA.
+"""
+
+
+class GeneIndex:
+	"""The columns of the genome matrix and the mutation rules of every column"""
+
+	def __init__(self, rules: MutationRules):
+		if not rules.is_initialized():
+			raise MutationError
+
+		self.names = tuple(rules.all_rules())
+		self.columns = {name: i for i, name in enumerate(self.names)}
+
+		for name in self.names:
+			if not rules.rule(name).is_initialized():
+				raise MutationError
+
+		self.min = np.array([rules.rule(name).min for name in self.names], dtype=float)
+		self.max = np.array([rules.rule(name).max for name in self.names], dtype=float)
+		self.rate = np.array([rules.rule(name).rate for name in self.names], dtype=float)
+
+	def __len__(self) -> int:
+		return len(self.names)
+
+	def random_genes(self, rng: np.random.Generator, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+		"""Return random values for the genes in the columns cols, uniform between min and max"""
+		return self.min[cols] + rng.random(np.shape(rows)) * (self.max[cols] - self.min[cols])
+
+
+class GenomeRow(MutableMapping):
+	"""A dict like view of one row of a genome matrix together with the shared genes"""
+
+	def __init__(self, genes: GeneIndex, row: np.ndarray, shared: dict):
+		self.genes = genes
+		self.row = row
+		self.shared = shared
+
+	def __getitem__(self, key):
+		if key in self.genes.columns:
+			return float(self.row[self.genes.columns[key]])
+		return self.shared[key]
+
+	def __setitem__(self, key, value):
+		if key not in self.genes.columns:
+			raise KeyError(f"{key} is shared by the population and can not be changed in one DNA")
+		self.row[self.genes.columns[key]] = value
+
+	def __delitem__(self, key):
+		raise KeyError(f"Genes can not be removed from a population, {key}")
+
+	def __iter__(self):
+		yield from self.shared
+		yield from self.genes.names
+
+	def __len__(self) -> int:
+		return len(self.shared) + len(self.genes)
+
+
+class DNAView(DNA):
+	"""DNA that reads and writes its genes in a row of a population"""
+
+	def __init__(self, genes: GeneIndex, row: np.ndarray, shared: dict):
+		super().__init__(DNA=GenomeRow(genes, row, shared))
+
+	def save_DNA(self, dna_file: Path) -> str:
+		with dna_file.open('w') as yaml_file:
+			yaml_dump = yaml.dump(dict(self.DNA), yaml_file)
+		return yaml_dump
+
+
+class Population:
+	"""A population of DNA with all the mutable genes in one matrix"""
+
+	def __init__(
+		self,
+		genes: GeneIndex, 				# Columns of the matrix
+		genomes: np.ndarray, 			# Genome matrix with shape (population, len(genes))
+		shared: dict, 					# The genes without rules, same for every DNA
+		rng: np.random.Generator=None 	# Random generator for breeding and mutation
+	):
+		self.genes = genes
+		self.genomes = np.asarray(genomes, dtype=float)
+		self.shared = shared
+		self.rng = rng if rng is not None else np.random.default_rng()
+
+		if self.genomes.ndim != 2 or self.genomes.shape[1] != len(genes):
+			raise ValueError(f"The genome matrix must have the shape (population, {len(genes)}), got {self.genomes.shape}")
+
+	def __len__(self) -> int:
+		return self.genomes.shape[0]
+
+	def __getitem__(self, i: int) -> DNAView:
+		return DNAView(self.genes, self.genomes[i], self.shared)
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	@classmethod
+	def from_DNA(cls, generation: list[DNA], rules: MutationRules, rng: np.random.Generator=None) -> 'Population':
+		"""
+		Factory method for creating a population from DNA.
+		All DNA must have the genes in the rules and agree on all other genes
+		"""
+		genes = GeneIndex(rules)
+		shared = {param: value for param, value in generation[0].DNA.items() if param not in genes.columns}
+
+		genomes = np.empty((len(generation), len(genes)))
+		for i, dna in enumerate(generation):
+			if not dna.is_initialized() or any(name not in dna.DNA for name in genes.names):
+				raise MutationError
+			if any(dna.DNA.get(param) != value for param, value in shared.items()) or len(dna.DNA) != len(shared) + len(genes):
+				raise ValueError("Only the genes with mutation rules can differ between the DNA in a population")
+			genomes[i] = [np.nan if dna.DNA[name] is None else dna.DNA[name] for name in genes.names]
+
+		return cls(genes=genes, genomes=genomes, shared=shared, rng=rng)
+
+	@classmethod
+	def random(cls, template: DNA, rules: MutationRules, size: int, rng: np.random.Generator=None) -> 'Population':
+		"""Factory method for a population of random DNA from a template, like DNA.randomize_DNA"""
+		population = cls.from_DNA([template], rules, rng=rng)
+		population.genomes = np.repeat(population.genomes, size, axis=0)
+		population.randomize()
+		return population
+
+	def to_DNA(self) -> list[DNA]:
+		"""Return independent copies of all DNA in the population"""
+		return [DNA(dict(dna.DNA)) for dna in self]
+
+	def randomize(self):
+		"""Give every gene in the matrix a random value"""
+		rows, cols = np.indices(self.genomes.shape)
+		self.genomes = self.genes.random_genes(self.rng, rows, cols)
+
+	def mutate(self):
+		"""Mutate every gene with the rate of its rule, like DNA.mutate"""
+		rows, cols = np.nonzero(self.rng.random(self.genomes.shape) < self.genes.rate)
+		self.genomes[rows, cols] = self.genes.random_genes(self.rng, rows, cols)
+
+	def crossover(self, parents_A: np.ndarray, parents_B: np.ndarray) -> 'Population':
+		"""
+		Return the children of the rows parents_A and parents_B. Every child takes each gene
+		from either parent with 50% probability, like CrossBreeding
+		"""
+		from_A = self.rng.random((len(parents_A), len(self.genes))) < 0.5
+		genomes = np.where(from_A, self.genomes[parents_A], self.genomes[parents_B])
+		return Population(genes=self.genes, genomes=genomes, shared=self.shared, rng=self.rng)
@@ -9,6 +9,14 @@ from math import floor
 import matplotlib.pyplot as plt
 
 
+def fitness_statistics(evolution) -> dict:
+	"""Return the statistics of the fitness function used in the evolution"""
+	statistics = getattr(evolution.fitness_func, "statistics", None)
+	if statistics is None:
+		return {}
+	return statistics()
+
+
 class Recorder(ABC):
 	"""Record details about the evolution"""
 
@@ -88,7 +96,11 @@ class CLIInformationRecorder(Recorder):
 
 		time_left = f"{hours:.0f}:{minutes:.0f}:{seconds:.0f}"
 
-		print("\t".join([generation_report, progressbar, average_fitness, best_fitness, time_elapsed, time_left]))
+		# Statistics reported by the fitness function (e.g. cache hits)
+		statistics = fitness_statistics(evolution)
+		statistics_report = [f"{name}: {value:.4g}" if isinstance(value, float) else f"{name}: {value}" for name, value in statistics.items()]
+
+		print("\t".join([generation_report, progressbar, average_fitness, best_fitness, time_elapsed, time_left] + statistics_report))
 
 	def summary(self, evolution):
 		pass
@@ -99,6 +111,7 @@ class FitnessRecorder(CLIInformationRecorder):
 
 	def __init__(self):
 		self.data = []
+		self.statistics = []
 
 	def setup(self, evolution):
 		super().setup(evolution)
@@ -109,6 +122,7 @@ class FitnessRecorder(CLIInformationRecorder):
 		average_score = evolution.average_score()
 		best_score = evolution.best_score
 		self.data.append((average_score, best_score))
+		self.statistics.append(fitness_statistics(evolution))
 
 	def summary(self, evolution):
 		# TODO: Matlab plot and save data
@@ -1,5 +1,7 @@
 from .DNA import DNA
 
+import numpy as np
+
 from random import sample
 
 
@@ -10,3 +12,9 @@ def versus(gen_score: list[tuple[DNA, float]]) -> DNA:
 	# Return the combatant with the highest fittness
 	return max(combatants, key=lambda x: x[1])[0]
 
+def versus_indices(scores: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+	"""Return the indices of n parents after n 1v1 duels between two different individuals, like versus"""
+	first = rng.integers(len(scores), size=n)
+	# Shift the second combatant so that it is never the first one
+	second = (first + rng.integers(1, len(scores), size=n)) % len(scores)
+	return np.where(scores[first] >= scores[second], first, second)
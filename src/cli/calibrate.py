@@ -0,0 +1,139 @@
+import random
+import numpy as np
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from GA.calibration import sample_DNA, candidate_confs, calibrate, recommend
+from GA.DNA import MutationRules
+from ode_models.simulation import SolverConf
+from utils.path import defaults_path
+from .load_objects import read_DNA_from_template, get_solver_conf, parse_args
+
+
+def calibration_parser():
+	"""Return a parser for the calibration program"""
+	parser = ArgumentParser(
+		description='Find the cheapest ODE solver settings that do not change the decisions of the genetic algorithm'
+	)
+	parser.add_argument(
+		'-c', '--conf',
+		default=f"{defaults_path() / 'conf_ode_template.yaml'}",
+		type=str,
+		help="Template file for the simulation configuration. If not provided a default is used"
+	)
+	parser.add_argument(
+		'-d', '--DNA',
+		type=str,
+		help="Template file for the base DNA. If not provided the conf is used"
+	)
+	parser.add_argument(
+		'-r', '--rules',
+		type=str,
+		help="Template file for the mutation rules. If not provided the conf is used"
+	)
+	parser.add_argument(
+		'-n', '--samples',
+		type=int,
+		default=50,
+		help="Number of random DNA to calibrate on"
+	)
+	parser.add_argument(
+		'--seed',
+		type=int,
+		help="Seed for the random DNA"
+	)
+	parser.add_argument(
+		'--methods',
+		type=str,
+		nargs='+',
+		default=["RK45", "DOPRI5", "DOP853", "LSODA", "Radau"],
+		help="Solver methods to try"
+	)
+	parser.add_argument(
+		'--rtols',
+		type=float,
+		nargs='+',
+		default=[1e-3, 1e-4, 1e-5, 1e-6],
+		help="Relative tolerances to try"
+	)
+	parser.add_argument(
+		'--atols',
+		type=float,
+		nargs='+',
+		default=[1e-6, 1e-8],
+		help="Absolute tolerances to try"
+	)
+	parser.add_argument(
+		'--max-steps',
+		type=float,
+		nargs='+',
+		default=[np.inf],
+		help="Largest solver steps to try [s]"
+	)
+	parser.add_argument(
+		'--reference-rtol',
+		type=float,
+		default=1e-10,
+		help="Relative tolerance of the reference solution"
+	)
+	parser.add_argument(
+		'--tie-tolerance',
+		type=float,
+		default=1e-3,
+		help="Duels where the reference efficiencies differ less than this are ties and do not count"
+	)
+	parser.add_argument(
+		'--min-agreement',
+		type=float,
+		default=1.0,
+		help="Smallest fraction of duels that must have the same winner as with the reference"
+	)
+	return parser
+
+def calibration(args: dict):
+	"""Calibrate the solver settings and print the results"""
+	if args.get("seed") is not None:
+		random.seed(args["seed"])
+
+	base_dna = read_DNA_from_template(args["DNA"])
+	rules = MutationRules.read_rules(Path(args["rules"]))
+	dnas = sample_DNA(base_dna, rules, args["samples"])
+
+	# The reference has no early termination, only the solver settings are swept for the candidates
+	reference_conf = SolverConf(method="DOP853", rtol=args["reference_rtol"], atol=args["reference_rtol"] * 1e-2)
+	confs = candidate_confs(get_solver_conf(args), args["methods"], args["rtols"], args["atols"], args["max_steps"])
+
+	results = calibrate(dnas, args["max_time"], reference_conf, confs, args["tie_tolerance"])
+
+	print(f"{'method':>8} {'rtol':>8} {'atol':>8} {'max_step':>9} {'time [ms]':>10} {'max error':>10} {'mean error':>11} {'rank corr':>10} {'duels':>7}")
+	for result in sorted(results, key=lambda result: result.time):
+		conf = result.solver_conf
+		print(
+			f"{conf.method:>8} {conf.rtol:>8.0e} {conf.atol:>8.0e} {conf.max_step:>9.1e} "
+			f"{result.time*1e3:>10.2f} {result.max_error:>10.2e} {result.mean_error:>11.2e} "
+			f"{result.rank_correlation:>10.5f} {result.duel_agreement:>7.4f}"
+		)
+
+	best = recommend(results, args["min_agreement"])
+	if best is None:
+		print(f"No setting kept {args['min_agreement']:.2%} of the duels. Try tighter tolerances")
+	else:
+		conf = best.solver_conf
+		print(
+			f"Recommended: solver_method: {conf.method}, solver_rtol: {conf.rtol:.0e}, "
+			f"solver_atol: {conf.atol:.0e}, solver_max_step: {conf.max_step} "
+			f"({best.time*1e3:.2f} ms per evaluation)"
+		)
+
+def main():
+	parser = calibration_parser()
+
+	# Parse arguments and execute the program
+	args = parse_args(parser.parse_args())
+
+	calibration(args)
+
+
+if __name__ == '__main__':
+	main()
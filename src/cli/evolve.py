@@ -5,10 +5,12 @@ from datetime import datetime
 from GA.evolution import Evolution, CrossBreeding
 from GA.recorder import CheckpointRecorder
 from GA.DNA import DNA, MutationRules
-from GA.fitness import CoilFitness, ODECoilFitness
-from GA.selection import versus
+from GA.executor import executor_from_name, ExecutorEnum
+from GA.fitness import CoilFitness, ODECoilFitness, CachedFitness, SimilarityCachedFitness
+from GA.population import Population
+from GA.selection import versus, versus_indices
 from utils.path import defaults_path, data_path
-from .load_objects import read_DNA_from_template, get_simulation_conf, parse_args
+from .load_objects import read_DNA_from_template, get_simulation_conf, get_solver_conf, parse_args
 
 
 # TODO: Add command line args for settings
@@ -51,43 +53,88 @@ def evolution_parser():
 		type=str,
 		help="Template file for the simulation configuration. If not provided a default is used"
 	)
+	parser.add_argument(
+		'-e', '--executor',
+		type=str,
+		choices=[e.value for e in ExecutorEnum],
+		help="How the fitness of a generation is evaluated. If not provided the conf is used"
+	)
+	parser.add_argument(
+		'-w', '--workers',
+		type=int,
+		help="Number of workers for the thread and process executors. Defaults to the number of cores"
+	)
+	parser.add_argument(
+		'--solver-method',
+		type=str,
+		choices=["RK45", "DOP853", "Radau", "BDF", "LSODA", "DOPRI5", "auto"],
+		help="Method used by the ODE solver. If not provided the conf is used"
+	)
+	parser.add_argument(
+		'--batch',
+		action='store_true',
+		default=None,
+		help="Simulate a whole generation together with the batched solver. The time-stepping simulation needs a field_map_resolution in the conf"
+	)
+	parser.add_argument(
+		'--cache-size',
+		type=int,
+		help="Number of fitness scores to keep in the cache. 0 turns the cache off"
+	)
 	return parser
 
 def evolution(args: dict):
 	"""Evolve"""
 
-	# Setup evoultion object
-	first_generation = [read_DNA_from_template(args["DNA"]) for _ in range(args["population_size"])]
+	# Setup evoultion object, the generations are kept in a genome matrix
 	mutation_rules = MutationRules.read_rules(Path(args["rules"]))
-
-	for dna in first_generation:
-		dna.randomize_DNA(mutation_rules)
+	first_generation = Population.random(read_DNA_from_template(args["DNA"]), mutation_rules, args["population_size"])
 
 	if args["ode"]:
 		fitness_func = ODECoilFitness(
 			max_time=args["max_time"],
-			minimum_solver_steps=args["minimum_solver_steps"]
+			batch=args.get("batch", False),
+			solver_conf=get_solver_conf(args)
 		)
+		# Reuse the score of physically similar designs
+		if args.get("similarity_tolerance") is not None:
+			fitness_func = SimilarityCachedFitness(
+				fitness_func=fitness_func,
+				tolerance=args["similarity_tolerance"],
+				validation_rate=args.get("similarity_validation_rate") or 0.0
+			)
 	else:	
 		simulation_conf = get_simulation_conf(args)
-		fitness_func = CoilFitness(simulation_conf=simulation_conf)
+		fitness_func = CoilFitness(simulation_conf=simulation_conf, batch=args.get("batch", False))
+
+	# Do not score the same DNA twice
+	if (args.get("cache_size") or 0) > 0:
+		fitness_func = CachedFitness(
+			fitness_func=fitness_func,
+			max_size=args["cache_size"],
+			float_digits=args.get("cache_float_digits")
+		)
 	
-	breeding_protocol = CrossBreeding(parent_selection=versus)
+	breeding_protocol = CrossBreeding(parent_selection=versus, population_selection=versus_indices)
+
+	executor = executor_from_name(args.get("executor") or "serial", workers=args.get("workers"))
 
 	evolution = Evolution(
 		generation=first_generation,
 		last_gen=args["generations"],
 		fitness_func=fitness_func,
 		breeding_protocol=breeding_protocol,
-		mutation_rules=mutation_rules
+		mutation_rules=mutation_rules,
+		executor=executor
 	)
 
 	now = datetime.now()
 	output_folder = data_path() / f"evolution_{now.strftime('%d-%m-%Y_%H:%M:%S')}"
 	recorder = CheckpointRecorder(save_every=10, output_folder=output_folder)
 
-	# Evolve
-	evolution.evolve(recorder=recorder)
+	# Evolve (the workers are kept alive for all generations)
+	with executor:
+		evolution.evolve(recorder=recorder)
 
 def main():
 	parser = evolution_parser()
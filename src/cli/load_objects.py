@@ -1,3 +1,4 @@
+import warnings
 import yaml
 
 from pathlib import Path
@@ -5,6 +6,7 @@ from pathlib import Path
 from GA.fitness import coil_from_DNA, power_source_from_DNA, projectile_from_DNA
 from GA.DNA import DNA
 from simulation.simulate import SimulationConf
+from ode_models.simulation import SolverConf
 
 def parse_args(args):
 	"""Parse the arguments from the command line"""
@@ -44,4 +46,45 @@ def get_projectile(args: dict):
 
 def get_simulation_conf(args: dict):
 	"""Get the configuration for a simulation"""
-	return SimulationConf(dt=args["dt"], max_time=args["max_time"])
\ No newline at end of file
+	optional_args = {
+		"field_map_resolution": args.get("field_map_resolution"),
+		"integrator": args.get("integrator"),
+		"rtol": args.get("integrator_rtol"),
+		"atol": args.get("integrator_atol"),
+		"recording": args.get("recording"),
+		"record_every": args.get("record_every")
+	}
+	return SimulationConf(
+		dt=args["dt"],
+		max_time=args["max_time"],
+		**{key: value for key, value in optional_args.items() if value is not None}
+	)
+
+def get_output_steps(args: dict) -> int:
+	"""Get the number of samples of an ODE solution. Old confs name the setting minimum_solver_steps"""
+	if args.get("output_steps") is None and args.get("minimum_solver_steps") is not None:
+		warnings.warn(
+			"minimum_solver_steps is deprecated and only sets the samples of the solution, rename it to output_steps in the conf",
+			FutureWarning
+		)
+		return args["minimum_solver_steps"]
+	return args["output_steps"]
+
+def get_solver_conf(args: dict):
+	"""Get the configuration for the ODE solver. Settings missing in the conf get their default value"""
+	solver_args = {
+		"method": args.get("solver_method"),
+		"rtol": args.get("solver_rtol"),
+		"atol": args.get("solver_atol"),
+		"scaled": args.get("solver_scaled"),
+		"max_step": args.get("solver_max_step"),
+		"jacobian": args.get("solver_jacobian"),
+		"hybrid": args.get("solver_hybrid"),
+		"analytic_tolerance": args.get("solver_analytic_tolerance"),
+		"stiffness_threshold": args.get("solver_stiffness_threshold"),
+		"inductance_table_points": args.get("inductance_table_points"),
+		"stop_current_fraction": args.get("stop_current_fraction"),
+		"stop_exit_fraction": args.get("stop_exit_fraction"),
+		"stop_energy_tolerance": args.get("stop_energy_tolerance")
+	}
+	return SolverConf(**{key: value for key, value in solver_args.items() if value is not None})
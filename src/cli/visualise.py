@@ -1,13 +1,15 @@
 import matplotlib.pyplot as plt
+import numpy as np
 from argparse import ArgumentParser
 from pathlib import Path
 
 from GA.DNA import DNA
-from visualise.coil import draw_coil
+from coilgun.off_axis import off_axis_field
+from visualise.coil import draw_coil, draw_field
 from visualise.simulation import draw_simulation, plot_ode_solution
 from simulation.simulate import CoilgunSimulation
 from utils.path import defaults_path
-from .load_objects import get_coil, get_power_source, get_projectile, get_simulation_conf, parse_args
+from .load_objects import get_coil, get_power_source, get_projectile, get_output_steps, get_simulation_conf, get_solver_conf, parse_args
 
 
 def show_coil(args):
@@ -20,6 +22,13 @@ def show_coil(args):
 	fig, ax = plt.subplots()
 	ax.set_aspect('equal')
 
+	# Draw the field around the coil out to 1.5 times the outer radius and one length before and after it
+	if args.get("field"):
+		r_max = 1.5 * coil.outer_radius()
+		r = np.linspace(0, r_max, 100)
+		z = np.linspace(-coil.length(), 2 * coil.length(), 300)
+		draw_field(off_axis_field(coil, r, z), ax)
+
 	# Draw the coil
 	draw_coil(coil, ax)
 	plt.show()
@@ -40,7 +49,7 @@ def show_simulation(args):
 def show_ode_sim(args):
 	"""Command line interface for showing an ode simulation"""
 	dna = DNA.read_DNA(Path(args["DNA"]))
-	plot_ode_solution(dna, args["max_time"], args["minimum_solver_steps"])
+	plot_ode_solution(dna, args["max_time"], get_output_steps(args), get_solver_conf(args))
 
 def main():
 	parser = ArgumentParser(
@@ -68,6 +77,11 @@ def main():
 		type=str,
 		help="Template file for the coil. If not provided a default is used"
 	)
+	coil_parser.add_argument(
+		'--field',
+		action='store_true',
+		help="Show the magnetic field of the coil at 1 A"
+	)
 
 	# Visualise a simulation
 	sim_parser = subparsers.add_parser(
@@ -1,9 +1,9 @@
 import numpy as np
 
 from abc import ABC, abstractmethod
+from scipy import fft
 
 from utils.constants import mu_0
-from utils.math import sign
 from enum import Enum
 
 
@@ -15,6 +15,9 @@ class CoilEnum(Enum):
 class Coil(ABC):
 	"""Base class for a coil"""
 
+	# Meters per unit of z and of the dimensions of the coil
+	length_unit = 1.0
+
 	@abstractmethod
 	def length(self) -> float:
 		"""Return the lenght of the coil"""
@@ -24,18 +27,42 @@ class Coil(ABC):
 		"""Calculate the resistance in the coil"""
 
 	@abstractmethod
-	def B_field(self, I: float, z: float) -> float:
+	def outer_radius(self) -> float:
+		"""Return the largest radius of the wire, in the same unit as z"""
+
+	@abstractmethod
+	def geometry_key(self) -> tuple:
+		"""Return the parameters that decide the field of the coil. Coils with the same key have the same field"""
+
+	@abstractmethod
+	def loops(self) -> tuple[np.ndarray, np.ndarray]:
+		"""Return the position and radius of every turn of wire, in the same unit as z"""
+
+	def field_step(self, resolution: int) -> float:
+		"""Return the step of a field map with resolution steps over the length of the coil"""
+		return self.length() / resolution
+
+	@abstractmethod
+	def B_field(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
 		"""
 		Calculate the B field at a coordinate z on the center axis of the coil when a current I 
-		flows through the coil. z=0 is the first part of the coil
+		flows through the coil. z=0 is the first part of the coil.
+		I and z can be arrays, they are broadcast against each other
 		"""
 
 	@abstractmethod
-	def B_field_gradiant(self, I: float, z: float) -> float:
+	def B_field_gradiant(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
 		"""
-		Calculate the B field gradient
+		Calculate the B field gradient. I and z can be arrays like in B_field
 		"""
 
+	def field_profile(self, I: float, z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+		"""
+		Return the B field and its gradient at every z. Coils can override this with a faster
+		method for many points, e.g. on a uniform grid
+		"""
+		return self.B_field(I=I, z=z), self.B_field_gradiant(I=I, z=z)
+
 
 class Solenoid(Coil):
 	"""A Solenoid class"""
@@ -54,9 +81,24 @@ class Solenoid(Coil):
 		self.wire_diameter = wire_diameter
 		self.resistivity = resistivity
 
+		# Constants of the field formulas
+		self._R2 = (inner_diameter / 2)**2
+		self._B_scale = mu_0 * N / (2 * L)
+
 	def length(self) -> float:
 		return self.L
 
+	def outer_radius(self) -> float:
+		return self.inner_diameter / 2
+
+	def loops(self) -> tuple[np.ndarray, np.ndarray]:
+		# N loops evenly spread over the length, the current sheet of the on-axis formula
+		z = (np.arange(self.N) + 1/2) * self.L / self.N
+		return z, np.full(self.N, self.inner_diameter / 2)
+
+	def geometry_key(self) -> tuple:
+		return (self.L, self.N, self.inner_diameter)
+
 	def resistance(self) -> float:
 		# Totoal lenght of the wire
 		wire_length = 2 * np.pi * self.inner_diameter * self.N
@@ -65,7 +107,7 @@ class Solenoid(Coil):
 
 		return self.resistivity * wire_length / A
 
-	def B_field(self, I: float, z: float) -> float:
+	def B_field(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
 		"""
 		Calculate the B field from a solenoid.
 		I is the current in the wire and 
@@ -73,25 +115,25 @@ class Solenoid(Coil):
 		e.g. to the left.
 		"""
 		# The formula for the B field of a solenoid
-		# use coordinats centered in the coil
-		z0 = z - self.L / 2
-		R = self.inner_diameter / 2
+		# use coordinats centered in the coil, L/2 - z0 = L - z and L/2 + z0 = z
+		z = np.asarray(z, dtype=float)
+		z1 = self.L - z
 
-		cos_a1 = (self.L / 2 - z0) / np.sqrt(R**2 + (self.L / 2 - z0)**2)
-		cos_a2 = (self.L / 2 + z0) / np.sqrt(R**2 + (self.L / 2 + z0)**2)
+		cos_a1 = z1 / np.sqrt(self._R2 + z1**2)
+		cos_a2 = z / np.sqrt(self._R2 + z**2)
 
-		return mu_0 * self.N * I * (cos_a1 + cos_a2) / (2 * self.L)
+		return self._B_scale * I * (cos_a1 + cos_a2)
 
-	def B_field_gradiant(self, I: float, z: float) -> float:
+	def B_field_gradiant(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
 		# The formula for the B field of a solenoid
 		# use coordinats centered in the coil
-		z0 = z - self.L / 2
-		R = self.inner_diameter / 2
+		z = np.asarray(z, dtype=float)
+		z1 = self.L - z
 
-		d_cos_a1 = -R**2 / (R**2+(self.L / 2 - z0)**2)**(3/2)
-		d_cos_a2 = R**2 / (R**2+(self.L / 2 + z0)**2)**(3/2)
+		d_cos_a1 = -self._R2 / (self._R2 + z1**2)**(3/2)
+		d_cos_a2 = self._R2 / (self._R2 + z**2)**(3/2)
 
-		return mu_0 * self.N * I * (d_cos_a1 + d_cos_a2) / (2 * self.L)
+		return self._B_scale * I * (d_cos_a1 + d_cos_a2)
 
 
 
@@ -103,6 +145,8 @@ class GeometryCoil(Coil):
 	places so it can have a costumized geometry.
 	"""
 
+	length_unit = 1e-3
+
 	def __init__(
 		self, 
 		coils: list[int], 		# Number of coils for every 'circle'
@@ -115,9 +159,34 @@ class GeometryCoil(Coil):
 		self.wire_diameter = wire_diameter
 		self.resistivity = resistivity
 
+		# Position and radius of every turn of wire [m]. The turns in the i:th 'circle'
+		# are placed at z = i * wire_diameter and wound on top of each other
+		circle = np.repeat(np.arange(len(coils)), coils)
+		layer = np.concatenate([np.arange(n) for n in coils]) if len(coils) > 0 else np.zeros(0)
+		self._z = circle * wire_diameter * 1e-3
+		self._a2 = ((inner_diameter + wire_diameter * (2*layer + 1)) / 2 * 1e-3)**2
+
+		# The same turns as layers: which circles have a turn in layer j and the squared radius of the layer [m]
+		layers = np.arange(max(coils, default=0))
+		self._occupied = (np.array(coils)[np.newaxis, :] > layers[:, np.newaxis]).astype(float)
+		self._layer_a2 = ((inner_diameter + wire_diameter * (2*layers + 1)) / 2 * 1e-3)**2
+
 	def length(self) -> float:
 		return self.wire_diameter * len(self.coils)
 
+	def outer_radius(self) -> float:
+		return self.inner_diameter / 2 + self.wire_diameter * max(self.coils, default=0)
+
+	def loops(self) -> tuple[np.ndarray, np.ndarray]:
+		return self._z * 1e3, np.sqrt(self._a2) * 1e3
+
+	def geometry_key(self) -> tuple:
+		return (tuple(self.coils), self.inner_diameter, self.wire_diameter)
+
+	def field_step(self, resolution: int) -> float:
+		# The gradient has a kink at every 'circle', put them on the points of the map
+		return self.wire_diameter / max(1, int(np.ceil(resolution / max(1, len(self.coils)))))
+
 	def resistance(self) -> float:
 		"""Calculate the resistance in the coil"""
 
@@ -134,29 +203,80 @@ class GeometryCoil(Coil):
 		# Resistance of wire
 		return self.resistivity * L / A
 
-	def B_field(self, I: float, z: float) -> float:
+	def _dz(self, z: float | np.ndarray) -> np.ndarray:
+		"""Distance [m] from z [mm] to every turn with shape (*z.shape, turns)"""
+		return self._z - np.asarray(z, dtype=float)[..., np.newaxis] * 1e-3
+
+	def B_field(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
 		"""
 		Calculate the B field at a coordinate z on the center axis of the coil when a current I 
 		flows through the coil. z=0 is the first 'circle'
 		"""
+		# The B field can be calculated using the formula for a current loop summed over every turn
+		dz = self._dz(z)
+		dB = self._a2 / np.power(dz**2 + self._a2, 3/2)
 
-		# The B field can be calculated using the formula for a current loop
-		B = 0
-		# Iterate over one 'circle' at a time
-		for i, n in enumerate(self.coils):
-			# Dist to current circle
-			dz = i * self.wire_diameter - z
-			# Radius for all coils in the current circle
-			a = np.array([self.inner_diameter + self.wire_diameter * (2*i + 1) for i in range(n)]) / 2
-			# Convert to meter
-			a = a * 1e-3
-			dz = dz * 1e-3
+		# Not sure about this sign(dz). It is not how the B field works
+		B = np.sum(np.where(dz >= 0, dB, -dB), axis=-1)
 
-			dB = mu_0 * I * np.sum(a**2 / np.power(dz**2 + a**2, 3/2)) / 2
+		return mu_0 * I * B / 2
 
-			B += sign(dz) * dB 	# Not sure about this sign(dz). It is not how the B field works
+	def B_field_gradiant(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
+		"""
+		Calculate the derivative of B_field with respect to z in [T/m].
+		The jumps from sign(dz) at the turns are not included
+		"""
+		# d/dz of sign(dz) * a^2 / (dz^2 + a^2)^(3/2) where d(dz)/dz = -1
+		dz = self._dz(z)
+		dB = 3 * self._a2 * np.abs(dz) / np.power(dz**2 + self._a2, 5/2)
 
-		return B
+		return mu_0 * I * np.sum(dB, axis=-1) / 2
 
-	def B_field_gradiant(self, I: float, z: float) -> float:
-		raise NotImplementedError
+	def _grid_alignment(self, z: np.ndarray) -> tuple[int, int]:
+		"""
+		Return (k, M) if z is a uniform grid with k steps per wire diameter and
+		z[0] = -M steps, so that every circle is on a point of the grid. Otherwise None
+		"""
+		if z.ndim != 1 or len(z) < 2 or len(self.coils) == 0:
+			return None
+		h = z[1] - z[0]
+		if h <= 0 or not np.allclose(np.diff(z), h, rtol=1e-9, atol=0):
+			return None
+
+		k, M = self.wire_diameter / h, -z[0] / h
+		if abs(k - round(k)) > 1e-6 or abs(M - round(M)) > 1e-6 or round(k) < 1:
+			return None
+		return round(k), round(M)
+
+	def field_profile(self, I: float, z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+		"""
+		Return the B field and its gradient at every z.
+		On a grid aligned with the circles the field of every layer is a convolution of the circles in
+		the layer with the field of a single loop, which is calculated with FFT in O(n log n)
+		"""
+		z = np.asarray(z, dtype=float)
+		alignment = self._grid_alignment(z)
+		if alignment is None:
+			return super().field_profile(I, z)
+		k, M = alignment
+		h = z[1] - z[0]
+
+		# Circles on every k:th point, one row per layer
+		S = (len(self.coils) - 1) * k + 1
+		sources = np.zeros((len(self._layer_a2), S))
+		sources[:, ::k] = self._occupied
+
+		# Single loop kernels at the distance dz = (M - r) * h between a circle and a point r steps after it
+		r = np.arange(-(S - 1), len(z))
+		dz = (M - r) * h * 1e-3
+		a2 = self._layer_a2[:, np.newaxis]
+		kernel_B = np.where(dz >= 0, 1.0, -1.0) * a2 / np.power(dz**2 + a2, 3/2)
+		kernel_dB = 3 * a2 * np.abs(dz) / np.power(dz**2 + a2, 5/2)
+
+		# Convolve and sum over the layers in the frequency domain
+		n = fft.next_fast_len(S + len(r) - 1, real=True)
+		F_sources = fft.rfft(sources, n)
+		B = fft.irfft(np.sum(F_sources * fft.rfft(kernel_B, n), axis=0), n)[S-1:S-1+len(z)]
+		dB = fft.irfft(np.sum(F_sources * fft.rfft(kernel_dB, n), axis=0), n)[S-1:S-1+len(z)]
+
+		return mu_0 * I * B / 2, mu_0 * I * dB / 2
@@ -0,0 +1,129 @@
+import numpy as np
+
+from collections import OrderedDict
+
+from .coil import Coil
+
+
+"""
+Tabulated on-axis field gradients.
+
+The field of a coil is linear in the current, so dB/dz for I=1 is a fixed function of z
+for a given geometry. It is tabulated once over the region where the coil has an influence
+and interpolated linearly, with the exact gradient used outside of the table. The tables
+are shared between all coils with the same geometry, e.g. every simulation of the same DNA.
+"""
+
+# Number of field maps kept in the shared cache
+MAX_FIELD_MAPS = 128
+
+_field_maps = OrderedDict()
+
+
+class FieldMap:
+	"""The unit current field gradient of a coil on a uniform grid"""
+
+	def __init__(
+		self,
+		coil: Coil, 			# Coil to tabulate. It is also used outside of the table
+		z_min: float, 			# Start of the table, in the z unit of the coil
+		step: float, 			# Distance between the points in the table
+		points: int 			# Number of points in the table
+	):
+		self.coil = coil
+		self.z_min = z_min
+		self.step = step
+		self.z = z_min + step * np.arange(points)
+		self.z_max = self.z[-1]
+		# Center of the coil, the batched lookup in simulation.batch falls off like a dipole from it
+		self.center = coil.length() / 2
+
+		_, self.dB = coil.field_profile(I=1, z=self.z)
+		self._dB = self.dB.tolist()
+		self._slope = (np.diff(self.dB) / step).tolist()
+
+	def B_field_gradiant(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
+		"""Interpolate the field gradient. Outside of the table the exact gradient is used"""
+		if isinstance(z, (int, float)):
+			if not self.z_min <= z < self.z_max:
+				return self.coil.B_field_gradiant(I=I, z=z)
+			# Scalar lookup without numpy, it is called once every time step
+			u = (z - self.z_min) / self.step
+			i = min(int(u), len(self._slope) - 1)
+			return I * (self._dB[i] + self._slope[i] * (u - i) * self.step)
+
+		z = np.asarray(z, dtype=float)
+		dB = np.interp(z, self.z, self.dB)
+		outside = (z < self.z_min) | (z > self.z_max)
+		if np.any(outside):
+			dB[outside] = self.coil.B_field_gradiant(I=1, z=z[outside])
+		return I * dB
+
+	def error(self) -> float:
+		"""
+		Estimate the largest interpolation error relative to the peak gradient.
+		The error of linear interpolation is largest between the points, so it is measured at the midpoints
+		"""
+		z_mid = self.z[:-1] + self.step / 2
+		error = np.abs(self.B_field_gradiant(I=1, z=z_mid) - self.coil.B_field_gradiant(I=1, z=z_mid))
+		return np.max(error) / np.max(np.abs(self.dB))
+
+
+class MappedCoil(Coil):
+	"""A coil that uses a field map for the field gradient and the original coil for everything else"""
+
+	def __init__(self, coil: Coil, field_map: FieldMap):
+		self.coil = coil
+		self.field_map = field_map
+		self.length_unit = coil.length_unit
+
+	def length(self) -> float:
+		return self.coil.length()
+
+	def resistance(self) -> float:
+		return self.coil.resistance()
+
+	def outer_radius(self) -> float:
+		return self.coil.outer_radius()
+
+	def geometry_key(self) -> tuple:
+		return self.coil.geometry_key()
+
+	def loops(self) -> tuple[np.ndarray, np.ndarray]:
+		return self.coil.loops()
+
+	def field_step(self, resolution: int) -> float:
+		return self.coil.field_step(resolution)
+
+	def B_field(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
+		return self.coil.B_field(I=I, z=z)
+
+	def B_field_gradiant(self, I: float | np.ndarray, z: float | np.ndarray) -> float | np.ndarray:
+		return self.field_map.B_field_gradiant(I=I, z=z)
+
+
+def field_map(
+	coil: Coil,
+	resolution: int=200, 	# Number of steps in the table over the length of the coil
+	cutoff: float=1e-4 		# The table covers the region where the gradient is larger than cutoff times the peak gradient (roughly)
+) -> FieldMap:
+	"""Return the field map of a coil. Coils with the same geometry share the same map"""
+	key = (type(coil).__name__, coil.geometry_key(), resolution, cutoff)
+	if key in _field_maps:
+		_field_maps.move_to_end(key)
+		return _field_maps[key]
+
+	# Far from the coil the gradient falls off like (radius / distance)^4
+	step = coil.field_step(resolution)
+	margin = np.ceil(coil.outer_radius() * cutoff**(-1/4) / step) * step
+	points = int(round((coil.length() + 2 * margin) / step)) + 1
+
+	_field_maps[key] = FieldMap(coil, z_min=-margin, step=step, points=points)
+	if len(_field_maps) > MAX_FIELD_MAPS:
+		_field_maps.popitem(last=False)
+	return _field_maps[key]
+
+
+def mapped_coil(coil: Coil, resolution: int=200, cutoff: float=1e-4) -> MappedCoil:
+	"""Return the coil with its field gradient taken from the shared field map"""
+	return MappedCoil(coil, field_map(coil, resolution, cutoff))
@@ -0,0 +1,124 @@
+import numpy as np
+
+from collections import OrderedDict
+from scipy import special
+from scipy.interpolate import RegularGridInterpolator
+
+from .coil import Coil
+from utils.constants import mu_0
+
+
+"""
+The magnetic field of a coil off the center axis.
+
+Every turn of wire is a circular current loop with an exact field in terms of the complete
+elliptic integrals K and E. The field of all the loops is summed on a (r, z) grid, a chunk of
+loops at a time to bound the memory. The grids are cached per geometry and can be sampled
+anywhere inside with interpolation, e.g. by force models for projectiles with a finite radius.
+
+Unlike GeometryCoil.B_field this is the physical field of the loops, there is no sign(dz).
+"""
+
+# Largest number of (loop, point) pairs evaluated at once
+MAX_ELEMENTS = 2**22
+
+# Number of field grids kept in the shared cache
+MAX_FIELD_GRIDS = 16
+
+_field_grids = OrderedDict()
+
+
+def loop_field(
+	a: np.ndarray, 			# Radius of every loop [m]
+	z_loop: np.ndarray, 	# Position of every loop [m]
+	r: np.ndarray, 			# Radial coordinate of the points [m]
+	z: np.ndarray, 			# Axial coordinate of the points [m]
+	I: float=1.0, 			# Current in the loops [A]
+	max_elements: int=MAX_ELEMENTS 	# Largest number of (loop, point) pairs evaluated at once
+) -> tuple[np.ndarray, np.ndarray]:
+	"""
+	Return Br and Bz [T] summed over the loops at the points (r, z), which are broadcast together.
+	The field is infinite on the wires
+	"""
+	a = np.asarray(a, dtype=float).ravel()
+	z_loop = np.asarray(z_loop, dtype=float).ravel()
+	r, z = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(z, dtype=float))
+	shape = r.shape
+	r, z = r.ravel(), z.ravel()
+
+	Br = np.zeros(r.size)
+	Bz = np.zeros(r.size)
+	chunk = max(1, max_elements // max(1, r.size))
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		for start in range(0, a.size, chunk):
+			a_i = a[start:start+chunk, np.newaxis]
+			dz = z - z_loop[start:start+chunk, np.newaxis]
+
+			rho2 = a_i**2 + r**2 + dz**2
+			alpha2 = rho2 - 2 * a_i * r
+			beta2 = rho2 + 2 * a_i * r
+			beta = np.sqrt(beta2)
+			m = 1 - alpha2 / beta2
+
+			K = special.ellipk(m)
+			E = special.ellipe(m)
+
+			C = mu_0 * I / (2 * np.pi * alpha2 * beta)
+			Bz += np.sum(C * ((a_i**2 - r**2 - dz**2) * E + alpha2 * K), axis=0)
+			Br += np.sum(C * dz * ((a_i**2 + r**2 + dz**2) * E - alpha2 * K), axis=0)
+
+		# Br = 0 on the axis
+		Br = np.divide(Br, r, out=np.zeros_like(Br), where=r > 0)
+
+	return Br.reshape(shape), Bz.reshape(shape)
+
+
+class OffAxisField:
+	"""Br and Bz of a coil for I=1 on a (r, z) grid, in the units of the coil"""
+
+	def __init__(
+		self,
+		coil: Coil, 			# Coil to calculate the field of
+		r: np.ndarray, 			# Increasing radial coordinates of the grid, in the z unit of the coil
+		z: np.ndarray, 			# Increasing axial coordinates of the grid, in the z unit of the coil
+		max_elements: int=MAX_ELEMENTS 	# Largest number of (loop, point) pairs evaluated at once
+	):
+		self.r = np.asarray(r, dtype=float)
+		self.z = np.asarray(z, dtype=float)
+
+		z_loop, a = coil.loops()
+		unit = coil.length_unit
+		R, Z = np.meshgrid(self.r, self.z, indexing='ij')
+
+		# Arrays with shape (len(r), len(z)) [T]
+		self.Br, self.Bz = loop_field(a * unit, z_loop * unit, R * unit, Z * unit, max_elements=max_elements)
+
+		self._Br = RegularGridInterpolator((self.r, self.z), self.Br)
+		self._Bz = RegularGridInterpolator((self.r, self.z), self.Bz)
+
+	def sample(self, I: float | np.ndarray, r: float | np.ndarray, z: float | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+		"""Interpolate Br and Bz at the points (r, z) inside the grid. The accuracy is poor close to the wires"""
+		points = np.stack(np.broadcast_arrays(np.abs(r), z), axis=-1)
+		# Br is odd in r
+		sign = np.where(np.asarray(r) < 0, -1.0, 1.0)
+		return I * sign * self._Br(points), I * self._Bz(points)
+
+	def magnitude(self) -> np.ndarray:
+		"""Return |B| on the grid"""
+		return np.hypot(self.Br, self.Bz)
+
+
+def off_axis_field(coil: Coil, r: np.ndarray, z: np.ndarray) -> OffAxisField:
+	"""Return the off-axis field of a coil on a grid. Coils with the same geometry share the same grid"""
+	r = np.asarray(r, dtype=float)
+	z = np.asarray(z, dtype=float)
+	key = (type(coil).__name__, coil.geometry_key(), r.tobytes(), z.tobytes())
+	if key in _field_grids:
+		_field_grids.move_to_end(key)
+		return _field_grids[key]
+
+	_field_grids[key] = OffAxisField(coil, r, z)
+	if len(_field_grids) > MAX_FIELD_GRIDS:
+		_field_grids.popitem(last=False)
+	return _field_grids[key]
@@ -1,27 +1,92 @@
 import numpy as np
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
 
 from .coil import Coil
+from utils.circuits import rlc_solution
 
 
 class PowerSourceEnum(Enum):
 	ConstantCurrent = "ConstantCurrent"
 	ConstantVoltage = "ConstantVoltage"
+	CapacitorBank = "CapacitorBank"
+
+
+# Number of waveforms kept in the shared cache
+MAX_WAVEFORMS = 256
+# Longer waveforms are not cached
+MAX_WAVEFORM_SAMPLES = 4096
+
+_waveforms = OrderedDict()
+
+
+@dataclass
+class Waveform:
+	"""The current and energy consumption of a power source driving a coil, sampled at the times t"""
+
+	t: np.ndarray 			# Times of the samples
+	I: np.ndarray 			# Current at every time
+	energy: np.ndarray 		# Energy consumed between t[i] and t[i+1], one less than the times
 
 
 class PowerSource(ABC):
-	"""Abstract class for a general power sorurce"""
+	"""
+	Abstract class for a general power sorurce.
+	The times can be arrays, the current and energy is then returned for every time
+	"""
 
 	@abstractmethod
-	def current(self, coil: Coil, t: float) -> float:
+	def current(self, coil: Coil, t: float | np.ndarray) -> float | np.ndarray:
 		"""Return the current generated by the power sorurce at time t"""
 
-	def energy_consumption(self, coil: Coil, t: float, dt: float) -> float:
+	def energy_consumption(self, coil: Coil, t: float | np.ndarray, dt: float | np.ndarray) -> float | np.ndarray:
 		"""Calculate the energy consumtion at time t during a time dt"""
 
+	@abstractmethod
+	def parameters(self) -> tuple:
+		"""Return the parameters of the power source. Sources with the same parameters give the same waveforms"""
+
+	def waveform(self, coil: Coil, t: np.ndarray) -> Waveform:
+		"""
+		Return the current and energy consumption at the times t in one call.
+		Waveforms on evenly spaced times only depend on the resistance of the coil and the grid,
+		so they are shared between all power sources and coils with the same parameters.
+		The arrays of a shared waveform are read only
+		"""
+		t = np.asarray(t, dtype=float)
+		R = coil.resistance()
+
+		# Only evenly spaced times are cached, keyed on the grid instead of every time
+		dt = t[1] - t[0] if t.size > 1 else 0.0
+		if t.size > MAX_WAVEFORM_SAMPLES or (t.size > 2 and not np.allclose(np.diff(t), dt, rtol=1e-9, atol=0)):
+			return self._sample_waveform(coil, t)
+
+		key = (type(self).__name__, self.parameters(), R, t[0] if t.size > 0 else None, dt, t.size)
+		if key in _waveforms:
+			_waveforms.move_to_end(key)
+			return _waveforms[key]
+
+		waveform = self._sample_waveform(coil, t.copy())
+		for array in (waveform.t, waveform.I, waveform.energy):
+			array.setflags(write=False)
+
+		_waveforms[key] = waveform
+		if len(_waveforms) > MAX_WAVEFORMS:
+			_waveforms.popitem(last=False)
+		return waveform
+
+	def _sample_waveform(self, coil: Coil, t: np.ndarray) -> Waveform:
+		"""Return the waveform at the times t without the cache"""
+		return Waveform(
+			t=t,
+			I=np.array(np.broadcast_to(self.current(coil=coil, t=t), t.shape), dtype=float),
+			energy=np.array(np.broadcast_to(self.energy_consumption(coil=coil, t=t[:-1], dt=np.diff(t)), (max(t.size - 1, 0),)), dtype=float)
+		)
+
+
 class ConstantCurrent(PowerSource):
 	"""Class for generating a constant current"""
 
@@ -32,13 +97,18 @@ class ConstantCurrent(PowerSource):
 		self.I = current
 
 
-	def current(self, coil: Coil, t: float) -> float:
-		return self.I
+	def current(self, coil: Coil, t: float | np.ndarray) -> float | np.ndarray:
+		if np.ndim(t) == 0:
+			return self.I
+		return np.full(np.shape(t), self.I, dtype=float)
 
-	def energy_consumption(self, coil: Coil, t: float, dt: float) -> float:
+	def energy_consumption(self, coil: Coil, t: float | np.ndarray, dt: float | np.ndarray) -> float | np.ndarray:
 		P = self.I**2 * coil.resistance()
 		return P * dt
 
+	def parameters(self) -> tuple:
+		return (self.I,)
+
 
 class ConstantVoltage(PowerSource):
 	"""Class for generating a current from a constant voltage"""
@@ -49,9 +119,63 @@ class ConstantVoltage(PowerSource):
 		"""
 		self.voltage = voltage
 
-	def current(self, coil: Coil, t: float) -> float:
-		return self.voltage / coil.resistance()
+	def current(self, coil: Coil, t: float | np.ndarray) -> float | np.ndarray:
+		I = self.voltage / coil.resistance()
+		if np.ndim(t) == 0:
+			return I
+		return np.full(np.shape(t), I, dtype=float)
 
-	def energy_consumption(self, coil: Coil, t: float, dt: float) -> float:
-		P = self.voltage * self.current(coil)
+	def energy_consumption(self, coil: Coil, t: float | np.ndarray, dt: float | np.ndarray) -> float | np.ndarray:
+		P = self.voltage * self.current(coil, t)
 		return P * dt
+
+	def parameters(self) -> tuple:
+		return (self.voltage,)
+
+
+class CapacitorBank(PowerSource):
+	"""
+	A charged capacitance bank that is discharged through the coil at t=0.
+	The circuit is a series RLC circuit with the resistance of the coil, so the current has a closed form
+	"""
+
+	def __init__(
+		self,
+		capacitance: float, 	# Capacitance of the bank [F]
+		voltage: float, 		# Voltage over the bank at t=0 [V]
+		inductance: float=0.0 	# Inductance of the circuit [H]. 0 gives a RC discharge
+	):
+		self.capacitance = capacitance
+		self.voltage = voltage
+		self.inductance = inductance
+
+		self._solutions = {}
+
+	def _solution(self, coil: Coil):
+		"""Return I(t) and V(t) of the discharge through the coil"""
+		R = coil.resistance()
+		if R not in self._solutions:
+			if self.inductance > 0:
+				solution, _ = rlc_solution(R=R, L=self.inductance, C=self.capacitance, I0=0.0, V0=self.voltage)
+			else:
+				tau = R * self.capacitance
+				def solution(t):
+					V = self.voltage * np.exp(-np.asarray(t, dtype=float) / tau)
+					return V / R, V
+			self._solutions[R] = solution
+		return self._solutions[R]
+
+	def current(self, coil: Coil, t: float | np.ndarray) -> float | np.ndarray:
+		I, _ = self._solution(coil)(np.maximum(t, 0))
+		return float(I) if np.ndim(t) == 0 else I
+
+	def energy_consumption(self, coil: Coil, t: float | np.ndarray, dt: float | np.ndarray) -> float | np.ndarray:
+		"""The energy taken from the capacitance bank during dt"""
+		solution = self._solution(coil)
+		_, V0 = solution(np.maximum(t, 0))
+		_, V1 = solution(np.maximum(np.add(t, dt), 0))
+		E = self.capacitance * (V0**2 - V1**2) / 2
+		return float(E) if np.ndim(E) == 0 else E
+
+	def parameters(self) -> tuple:
+		return (self.capacitance, self.voltage, self.inductance)
@@ -32,10 +32,10 @@ class Projectile1D(ABC):
 		self.acc = 0
 
 	@abstractmethod
-	def calc_force_from_coil(self, coil: Coil, power_source: PowerSource, t: float):
+	def calc_force_from_coil(self, coil: Coil, power_source: PowerSource, t: float, pos: float=None):
 		"""
 		Calculate the forc acting on the projectile from a coil
-		with a given power source
+		with a given power source. pos is used instead of the position of the projectile if it is given
 		"""
 
 
@@ -49,9 +49,9 @@ class MagneticProjectile(Projectile1D):
 		# m is the magnetic dipol moment of the magnet
 		self.m = m
 
-	def calc_force_from_coil(self, coil: Coil, power_source: PowerSource, t: float):
+	def calc_force_from_coil(self, coil: Coil, power_source: PowerSource, t: float, pos: float=None):
 		I = power_source.current(coil=coil, t=t)
-		dB = coil.B_field_gradiant(I=I, z=self.pos)
+		dB = coil.B_field_gradiant(I=I, z=self.pos if pos is None else pos)
 		return self.m * dB
 
 
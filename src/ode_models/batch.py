@@ -0,0 +1,263 @@
+import numpy as np
+
+from dataclasses import dataclass
+
+from .coilgun import RL_stop_current
+from .inductance import InductanceModel
+from .integrator import dopri5_step, error_norm, step_factor
+
+
+"""
+Solve the coilgun ODE for a whole population of designs at once.
+
+Every member has its own adaptive step size but all members are advanced
+together with one vectorized right hand side. A member starts in the
+capacitor phase (state [x, v, I, dIdt, V]) and is switched to the RL phase
+when the voltage over the capacitance bank reaches zero (or the projectile
+reaches x1). The RL phase then runs for t_max, just like
+CoilgunSimulationODE.run does with ode_solver_coilgun and ode_solver_RL.
+The early stops of the phases are the same as in the single design solvers.
+"""
+
+# Phases of a member
+CAPACITOR_PHASE = 0
+RL_PHASE = 1
+DONE = 2
+
+
+@dataclass
+class BatchSolution:
+	"""Final state of every member in a batch"""
+
+	t: np.ndarray 			# [s] Time when the member was done
+	x: np.ndarray 			# [m] Final position of the projectile
+	v: np.ndarray 			# [m/s] Final velocity of the projectile
+	I: np.ndarray 			# [A] Final current through the coil
+	V: np.ndarray 			# [V] Final voltage over the capacitance bank
+	t_switch: np.ndarray 	# [s] Time when the capacitance bank was disconnected
+	steps: np.ndarray 		# [-] Number of accepted steps
+	success: np.ndarray 	# [-] False if the member ran out of steps
+
+
+def _rhs(y, phase, C, R, m, inductance: InductanceModel):
+	"""
+	Vectorized derivative of the state [x, v, I, dIdt, V] with shape (5, N).
+	Members in the RL phase do not use dIdt and V, so their derivatives are zero
+	"""
+	x, v, I, dIdt, V = y
+	L, dLdx = inductance.with_derivative(x)
+
+	capacitor = phase == CAPACITOR_PHASE
+
+	dydt = np.empty_like(y)
+	dydt[0] = v
+	dydt[1] = I**2 * dLdx / (2*m)
+	dydt[2] = np.where(capacitor, dIdt, -I*R/L)
+	dydt[3] = np.where(capacitor, -I / (L*C) - R*dIdt / L - dIdt*dLdx*v/L, 0.0)
+	dydt[4] = np.where(capacitor, -I/C, 0.0)
+	return dydt
+
+
+def _initial_step(y0, f0, fun, t_span, rtol, atol):
+	"""Vectorized version of the initial step selection used by scipy"""
+	scale = atol + np.abs(y0) * rtol
+	d0 = np.sqrt(np.mean((y0 / scale)**2, axis=0))
+	d1 = np.sqrt(np.mean((f0 / scale)**2, axis=0))
+	h0 = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.where(d1 > 0, d1, 1))
+	h0 = np.minimum(h0, t_span)
+
+	y1 = y0 + h0 * f0
+	f1 = fun(y1)
+	d2 = np.sqrt(np.mean(((f1 - f0) / scale)**2, axis=0)) / h0
+
+	h1 = np.where(
+		(d1 <= 1e-15) & (d2 <= 1e-15),
+		np.maximum(1e-6, h0 * 1e-3),
+		np.power(0.01 / np.maximum(np.maximum(d1, d2), 1e-300), 1/5)
+	)
+	return np.minimum(np.minimum(100 * h0, h1), t_span)
+
+
+def _hermite_peak(I0, I1, dI0, dI1, h):
+	"""
+	Return the largest |I| over steps of size h, from the cubic Hermite
+	interpolant of I and dI/dt at both ends of the steps
+	"""
+	def interpolant(s):
+		return (2*s**3 - 3*s**2 + 1)*I0 + (s**3 - 2*s**2 + s)*h*dI0 + (3*s**2 - 2*s**3)*I1 + (s**3 - s**2)*h*dI1
+
+	# The extrema are where the quadratic derivative a*s^2 + b*s + c is zero
+	a = 6*(I0 - I1) + 3*h*(dI0 + dI1)
+	b = 6*(I1 - I0) - h*(4*dI0 + 2*dI1)
+	c = h*dI0
+
+	peak = np.maximum(np.abs(I0), np.abs(I1))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		root = np.sqrt(b**2 - 4*a*c)
+		for s in ((-b + root) / (2*a), (-b - root) / (2*a), -c / b):
+			inside = (s > 0) & (s < 1)
+			peak = np.where(inside, np.maximum(peak, np.abs(interpolant(np.where(inside, s, 0.0)))), peak)
+	return peak
+
+
+def ode_solver_coilgun_batch(
+	C: np.ndarray, 		# Capacitance of the capaitance banks
+	R: np.ndarray, 		# Resistance of the coils
+	m: np.ndarray, 		# Mass of the projectiles
+	V0: np.ndarray,		# Starting voltage over the capacitance banks
+	x0: np.ndarray,		# Starting position of the projectiles relative to the center of the coils
+	v0: np.ndarray, 	# Starting velocity of the projectiles
+	inductance_params: np.ndarray, 	# Shape (N, 4). A, B, C and D for the inductance model of every member
+	t_max: float,		# Maximum time for each phase of the simulation
+	x1: np.ndarray=None, 	# End the capacitor phase when the projectile passes this point. nan to never end
+	max_step: float=np.inf, 	# Largest step the solver may take
+	rtol: float=1e-3, 	# Relative tolerance of the solver
+	atol: float=1e-6, 	# Absolute tolerance of the solver. A float or an array with shape (5, N) for each component and member
+	max_steps: int=100000, 	# Give up on a member after this many steps
+	I_stop_fraction: float=None, 	# If present a phase ends when |I| falls below this fraction of the peak current of the phase
+	RL_x1: np.ndarray=None, 	# End the RL phase when the projectile passes this point. nan to never end
+	RL_energy_tolerance: float=None 	# End the RL phase when it can not change the efficiency more than this, see RL_stop_current
+) -> BatchSolution:
+	"""
+	ODE solver for a population of coilguns.
+	Every member is integrated with its own adaptive step size and
+	per member masks are used instead of terminal events
+	"""
+	C, R, m, V0, x0, v0 = (np.asarray(a, dtype=float) for a in np.broadcast_arrays(C, R, m, V0, x0, v0))
+	A, B, C_L, D = np.asarray(inductance_params, dtype=float).reshape(-1, 4).T
+	N = C.size
+	atol = np.asarray(atol, dtype=float)
+
+	x1 = np.full(N, np.nan) if x1 is None else np.array(x1, dtype=float).reshape(N)
+	RL_x1 = np.full(N, np.nan) if RL_x1 is None else np.array(RL_x1, dtype=float).reshape(N)
+
+	# Tolerance for the location of the events
+	V_tol = 1e-6 * np.abs(V0)
+	x_tol = 1e-9
+
+	# The state with shape (5, N)
+	L_0 = InductanceModel(A, B, C_L, D)(x0)
+	y = np.array([x0, v0, np.zeros(N), V0 / L_0, V0])
+	t = np.zeros(N)
+	t_end = np.full(N, float(t_max))
+	t_switch = np.full(N, np.nan)
+	phase = np.full(N, CAPACITOR_PHASE)
+	steps = np.zeros(N, dtype=int)
+	attempts = np.zeros(N, dtype=int)
+	success = np.ones(N, dtype=bool)
+	# The peak current of the capacitor phase and the current where the RL phase ends
+	peak = np.zeros(N)
+	I_stop = np.full(N, np.nan)
+
+	def fun(y, idx):
+		return _rhs(y, phase[idx], C[idx], R[idx], m[idx], InductanceModel(A[idx], B[idx], C_L[idx], D[idx]))
+
+	all_idx = np.arange(N)
+	f = fun(y, all_idx)
+	h = _initial_step(y, f, lambda y1: fun(y1, all_idx), t_end - t, rtol, atol)
+	h = np.minimum(h, max_step)
+	rejected = np.zeros(N, dtype=bool)
+
+	while True:
+		idx = np.flatnonzero(phase != DONE)
+		if idx.size == 0:
+			break
+
+		y_i = y[:, idx]
+		f_i = f[:, idx]
+		t_i = t[idx]
+		h_i = np.minimum(np.minimum(h[idx], t_end[idx] - t_i), max_step)
+
+		# Take a Dormand-Prince step for all the active members
+		y_new, K = dopri5_step(lambda _, y: fun(y, idx), t_i, y_i, f_i, h_i)
+
+		atol_i = atol if atol.ndim == 0 else atol[:, idx]
+		err_norm = error_norm(K, h_i, y_i, y_new, rtol, atol_i)
+		accepted = err_norm < 1
+		h_next = h_i * step_factor(err_norm, rejected[idx])
+
+		# Locate the events by shrinking the step until it ends on the root. Every event is a
+		# function g of the state that crosses zero downwards, with a tolerance for the root
+		capacitor = phase[idx] == CAPACITOR_PHASE
+		if I_stop_fraction is not None:
+			peak_i = np.where(capacitor, np.maximum(peak[idx], _hermite_peak(y_i[2], y_new[2], y_i[3], y_new[3], h_i)), peak[idx])
+			I_stop_i = np.where(capacitor, I_stop_fraction * peak_i, I_stop[idx])
+		else:
+			peak_i = peak[idx]
+			I_stop_i = np.where(capacitor, np.nan, I_stop[idx])
+		x_end = np.where(capacitor, x1[idx], RL_x1[idx])
+
+		g = [
+			# The capacitance bank is empty
+			(np.where(capacitor, y_i[4], np.nan), np.where(capacitor, y_new[4], np.nan), V_tol[idx]),
+			# The projectile passes the end point of the phase
+			(x_end - y_i[0], x_end - y_new[0], x_tol),
+			# The current has decayed
+			(np.abs(y_i[2]) - I_stop_i, np.abs(y_new[2]) - I_stop_i, 1e-6 * I_stop_i),
+		]
+
+		theta = np.ones(idx.size)
+		overshoot = np.zeros(idx.size, dtype=bool)
+		for g_old, g_new, g_tol in g:
+			overshoot_g = accepted & (g_old > g_tol) & (g_new < -g_tol)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				theta = np.where(overshoot_g, np.minimum(theta, g_old / (g_old - g_new)), theta)
+			overshoot |= overshoot_g
+		theta = np.clip(theta, 1e-6, 1.0)
+		overshoot &= h_i * theta > 1e-14 * np.maximum(t_i, t_max)
+
+		accepted &= ~overshoot
+		h_next = np.where(overshoot, h_i * theta, h_next)
+		event = accepted & np.any([(g_old > g_tol) & (g_new <= g_tol) for g_old, g_new, g_tol in g], axis=0)
+
+		# Save the accepted steps
+		acc_idx = idx[accepted]
+		y[:, acc_idx] = y_new[:, accepted]
+		f[:, acc_idx] = K[6][:, accepted]
+		t[acc_idx] = t_i[accepted] + h_i[accepted]
+		peak[acc_idx] = peak_i[accepted]
+		steps[acc_idx] += 1
+
+		h[idx] = h_next
+		rejected[idx] = ~accepted
+		attempts[idx] += 1
+
+		# Switch to the RL phase at an event or when the time is up
+		time_out = accepted & (t[idx] >= t_end[idx])
+		switch = idx[(event | time_out) & capacitor]
+		if switch.size > 0:
+			phase[switch] = RL_PHASE
+			t_switch[switch] = t[switch]
+			t_end[switch] = t[switch] + t_max
+			f[:, switch] = fun(y[:, switch], switch)
+
+			I_stop_switch = RL_stop_current(
+				I0=y[2, switch],
+				V1=y[4, switch],
+				V0=V0[switch],
+				C=C[switch],
+				A=A[switch],
+				current_fraction=I_stop_fraction,
+				energy_tolerance=RL_energy_tolerance
+			)
+			if I_stop_switch is not None:
+				I_stop[switch] = I_stop_switch
+
+			# The RL phase ends where it starts if the projectile has left the coil or the current is too small
+			x, v, I = y[:3, switch]
+			with np.errstate(invalid='ignore'):
+				phase[switch[((x >= RL_x1[switch]) & (v >= 0)) | (np.abs(I) <= I_stop[switch])]] = DONE
+
+		# The RL phase is done at an event or when the time is up
+		done = idx[(event | time_out) & ~capacitor]
+		phase[done] = DONE
+
+		# Give up on members that take too many steps
+		failed = idx[attempts[idx] >= max_steps]
+		phase[failed] = DONE
+		success[failed] = False
+
+	x, v, I, _, V = y
+	return BatchSolution(
+		t=t, x=x, v=v, I=I, V=V, t_switch=t_switch, steps=steps, success=success
+	)
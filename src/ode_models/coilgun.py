@@ -1,7 +1,121 @@
 import numpy as np
-from scipy import integrate
+from dataclasses import dataclass
+from scipy import integrate, optimize
 from typing import Callable
 
+from ode_models.integrator import LeanSolution, solve_ivp_lean, LEAN_METHOD
+
+
+# Methods of solve_ivp that make use of the Jacobian
+IMPLICIT_METHODS = ("Radau", "BDF", "LSODA")
+# Methods that can be used by the hybrid solver
+HYBRID_METHODS = ("RK23", "RK45", "DOP853")
+
+
+@dataclass
+class StateScales:
+	"""
+	Characteristic scales of the coilgun state. With them atol is given in units of each
+	component, which is the same as solving the nondimensionalised system with a uniform atol
+	"""
+
+	x: float 		# [m] Position, the length of the coil
+	v: float 		# [m/s] Velocity, the length of the coil over the LC time
+	I: float 		# [A] Current, V0 over the impedance of the circuit
+	dIdt: float 	# [A/s] Rate of change of the current, I over the LC time
+	V: float 		# [V] Voltage, the initial voltage of the capacitance bank
+	E: float 		# [J] Energy, the initial energy of the capacitance bank
+
+	def atol(self, atol: float, components: list[str]) -> np.ndarray:
+		"""Return the absolute tolerance for each component of a state"""
+		return atol * np.array([getattr(self, component) for component in components])
+
+
+def scaled_atol(atol: float, scales: StateScales, components: list[str]):
+	"""Return atol as it is if there are no scales, otherwise relative to the scale of each component"""
+	if scales is None:
+		return atol
+	return scales.atol(atol, components)
+
+
+def inductance_evaluator(L: Callable, dLdx: Callable) -> Callable:
+	"""
+	Return a function of x that returns L(x) and dL/dx(x).
+	Inductance models with a with_derivative method (see ode_models.inductance)
+	evaluate both in one call
+	"""
+	with_derivative = getattr(L, "with_derivative", None)
+	if with_derivative is not None:
+		return with_derivative
+	return lambda x: (L(x), dLdx(x))
+
+
+def solve_ode(fun: Callable, y0: list, t_max: float, events: list, method: str, options: dict, t0: float=0.0, **kwargs):
+	"""Solve with solve_ivp, or with the lean Dormand-Prince integrator if it is the method"""
+	if method == LEAN_METHOD:
+		return solve_ivp_lean(fun=fun, t_span=(t0, t_max), y0=y0, events=events, **kwargs)
+	return integrate.solve_ivp(fun=fun, y0=y0, t_span=(t0, t_max), events=events or None, method=method, **kwargs, **options)
+
+
+def _join_solutions(solutions: list, n: int, n_events: int, stored_start: bool) -> LeanSolution:
+	"""
+	Join the solutions of consecutive time intervals with n state components into one with their first n_events events.
+	If stored_start is True every solution has stored its first state, which is the last state of the one before
+	"""
+	skip = 1 if stored_start else 0
+	t = [solutions[0].t] + [sol.t[skip:] for sol in solutions[1:]]
+	y = [np.reshape(solutions[0].y, (n, -1))] + [np.reshape(sol.y, (n, -1))[:, skip:] for sol in solutions[1:]]
+
+	return LeanSolution(
+		t=np.concatenate(t),
+		y=np.concatenate(y, axis=1),
+		t_events=[np.concatenate([sol.t_events[i] for sol in solutions]) for i in range(n_events)],
+		y_events=[np.concatenate([np.reshape(sol.y_events[i], (-1, n)) for sol in solutions]) for i in range(n_events)],
+		status=solutions[-1].status,
+		nfev=sum(sol.nfev for sol in solutions),
+		message=solutions[-1].message
+	)
+
+
+def _ledger_jacobian(jacobian: np.ndarray, rows: list) -> np.ndarray:
+	"""
+	Extend the Jacobian of the physical state with the rows of the energy ledger.
+	The ledger does not feed back into the physics so its columns are zero
+	"""
+	n_state = jacobian.shape[0]
+	n = n_state + len(rows)
+	extended = np.zeros((n, n))
+	extended[:n_state, :n_state] = jacobian
+	extended[n_state:, :n_state] = rows
+	return extended
+
+
+def _append_stop_state(sol, n_terminal: int):
+	"""
+	Return t and y of a solution with the state where a terminal event stopped the solver last.
+	When t_eval is used solve_ivp does not include that state by itself
+	"""
+	t, y = sol.t, sol.y
+	if sol.status != 1:
+		return t, y
+
+	for t_event, y_event in zip(sol.t_events[:n_terminal], sol.y_events[:n_terminal]):
+		if len(t_event) > 0:
+			# y is empty without a shape if no time in t_eval was reached
+			y = np.reshape(y, (len(y_event[-1]), -1))
+			return np.append(t, t_event[-1]), np.column_stack((y, y_event[-1]))
+	return t, y
+
+def _peak_values(sol, y0: list, y1: np.ndarray, current: Callable, force: Callable, first_peak_event: int):
+	"""
+	Return the largest absolute current and force of a solution.
+	They are found among the first state y0, the last state y1 and the states of the peak events
+	"""
+	states = [np.column_stack((y0, y1))] + [y_event.T for y_event in sol.y_events[first_peak_event:] if len(y_event) > 0]
+	states = np.column_stack(states)
+	return np.max(np.abs(current(states))), np.max(np.abs(force(states)))
+
+
 def ode_solver_coilgun(
 	C: float, 		# Capacitance of the capaitance bank
 	R: float, 		# Resistance of the coil
@@ -13,26 +127,67 @@ def ode_solver_coilgun(
 	V0: float,		# Starting voltage over the capacitance bank
 	v0: float, 		# Starting velocity of the projectile
 	x1: float=None, # If present the simulation will end when the projectile passes this point
-	t_steps: int=None # Minimum steps the solver should take
+	t_steps: int=None, # Number of evenly spaced output samples over t_max. If None the steps of the solver are returned
+	method: str="RK45", 	# Method used by solve_ivp, or DOPRI5 for the lean Dormand-Prince integrator
+	rtol: float=1e-3, 		# Relative tolerance of the solver
+	atol: float=1e-6, 		# Absolute tolerance of the solver
+	d2Ldx2: Callable=None, 	# Second derivative of the inductance. If present the implicit methods get an analytic Jacobian
+	t_eval: np.ndarray=None, 	# Only store the solution at these times. The state where the solver stopped is always last
+	max_step: float=np.inf, 	# Largest step the solver may take. The step size is otherwise controlled by rtol and atol
+	peaks: bool=False, 		# Also return the peak current and force. Requires d2Ldx2
+	I_stop_fraction: float=None, 	# If present the simulation will end when |I| falls below this fraction of its peak
+	energy: bool=False, 	# Also integrate the energy ledger [E_C, E_R, W] and return it last
+	scales: StateScales=None 	# If present atol is relative to the characteristic scale of each state component
 ):
 	"""
 	ODE solver for a coilgun.
-	This method assumes that the inductance is a known function of the position
+	This method assumes that the inductance is a known function of the position.
+	The energy ledger is the energy delivered by the capacitance bank E_C, the resistive
+	loss E_R and the work on the projectile W, integrated as extra components of the state
 	"""
 
+	inductance = inductance_evaluator(L, dLdx)
+
 	def dydt(t, y):
 		"""
-		Calculate the derivative of the state [x, v, I, dIdt, V]
+		Calculate the derivative of the state [x, v, I, dIdt, V] (and [E_C, E_R, W])
 		"""
-		x, v, I, dIdt, V = y
+		x, v, I, dIdt, V = y[:5]
+		L_x, dLdx_x = inductance(x)
 
-		dvdt = I**2 * dLdx(x) / (2*m) #+ np.divide(L(x)*I*dIdt, v, out=np.zeros_like(v), where=v!=0)
-		dIdt2 = -I / (L(x)*C) - R*dIdt / L(x) - dIdt*dLdx(x)*v/L(x)
+		dvdt = I**2 * dLdx_x / (2*m) #+ np.divide(L(x)*I*dIdt, v, out=np.zeros_like(v), where=v!=0)
+		dIdt2 = -I / (L_x*C) - R*dIdt / L_x - dIdt*dLdx_x*v/L_x
 		dVdt = -I/C
 
-
+		if energy:
+			return [v, dvdt, dIdt, dIdt2, dVdt, V*I, R*I**2, m*dvdt*v]
 		return [v, dvdt, dIdt, dIdt2, dVdt]
 
+	def jacobian(t, y):
+		"""
+		Calculate the Jacobian of the state [x, v, I, dIdt, V]
+		"""
+		x, v, I, dIdt, V = y[:5]
+		L_x, dLdx_x, d2Ldx2_x = L(x), dLdx(x), d2Ldx2(x)
+
+		g = I/C + R*dIdt + dIdt*dLdx_x*v
+
+		jac = np.array([
+			[0, 1, 0, 0, 0],
+			[I**2 * d2Ldx2_x / (2*m), 0, I * dLdx_x / m, 0, 0],
+			[0, 0, 0, 1, 0],
+			[-dIdt*d2Ldx2_x*v/L_x + g*dLdx_x/L_x**2, -dIdt*dLdx_x/L_x, -1 / (L_x*C), -(R + dLdx_x*v) / L_x, 0],
+			[0, 0, -1/C, 0, 0],
+		])
+
+		if energy:
+			return _ledger_jacobian(jac, [
+				[0, 0, V, 0, I],
+				[0, 0, 2*R*I, 0, 0],
+				[I**2 * d2Ldx2_x * v / 2, I**2 * dLdx_x / 2, I * dLdx_x * v, 0, 0],
+			])
+		return jac
+
 	def end_point_reached(t, y):
 		"""Stop the solver if the end point is reached"""
 		return y[0] - x1
@@ -44,54 +199,126 @@ def ode_solver_coilgun(
 		"""
 		return y[4]
 
+	# The peak of |I| so far. It only changes between the solves, at the maxima of |I|
+	peak_current = 0.0
+
+	def current_decayed(t, y):
+		"""
+		Stop the solver when the current has decayed to a fraction of its peak.
+		Happens in overdamped circuits where the voltage never goes under zero
+		"""
+		return abs(y[2]) - I_stop_fraction * peak_current
+
+	def current_extremum(t, y):
+		"""|I| has an extremum when I*dIdt changes sign"""
+		return y[2]*y[3]
+
+	def current_peak(t, y):
+		"""The current has a maximum when dIdt changes sign"""
+		return y[3]
+
+	def force_peak(t, y):
+		"""The force on the projectile has an extremum when dF/dt changes sign"""
+		x, v, I, dIdt, V = y[:5]
+		return I*dIdt*dLdx(x) + I**2 * d2Ldx2(x) * v / 2
+
 	# Stop at event
 	end_point_reached.terminal = True
 	no_reverse_voltage.terminal = True
+	current_decayed.terminal = True
+	current_decayed.direction = -1
 
 	# Set the events
 	events = [no_reverse_voltage]
 	if x1 is not None:
 		events.append(end_point_reached)
+	if I_stop_fraction is not None:
+		events.append(current_decayed)
+	n_terminal = len(events)
+	if peaks:
+		events += [current_peak, force_peak]
 
-	# Calculate maximum time step
-	t_step = t_max / t_steps if t_steps is not None else np.inf
+	# The output resolution does not limit the step size of the solver
+	if t_eval is None and t_steps is not None:
+		t_eval = np.linspace(0, t_max, t_steps + 1)
 
 	# Calculate initial conditions
 	y0 = [x0, v0, 0.0, V0/L(x0), V0]
+	if energy:
+		y0 += [0.0, 0.0, 0.0]
+	atol = scaled_atol(atol, scales, ["x", "v", "I", "dIdt", "V"] + ["E"]*(len(y0) - 5))
 
-	sol = integrate.solve_ivp(
-		fun=dydt, 
-		y0=y0, 
-		t_span=(0, t_max), 
-		events=events,
-		max_step=t_step
-	)
+	# Only the implicit methods use the Jacobian (the others warn if it is given)
+	options = {}
+	if d2Ldx2 is not None and method in IMPLICIT_METHODS:
+		options["jac"] = jacobian
 
-	t = sol.t
-	x, v, I, dIdt, V = sol.y
+	def solve(t0, y0, t_eval, extra_events):
+		if t_eval is not None and t0 > 0:
+			t_eval = np.asarray(t_eval)
+			t_eval = t_eval[t_eval > t0]
+		return solve_ode(
+			fun=dydt,
+			y0=y0,
+			t_max=t_max,
+			events=events + extra_events,
+			method=method,
+			options=options,
+			t0=t0,
+			max_step=max_step,
+			rtol=rtol,
+			atol=atol,
+			t_eval=t_eval
+		)
+
+	if I_stop_fraction is None:
+		sol = solve(0.0, y0, t_eval, [])
+	else:
+		# The threshold of current_decayed must not change during a solve, so the solver
+		# is stopped at every extremum of |I| and restarted from there with the new peak.
+		# The event looks for maxima and minima in turn since it is zero where the solver restarts
+		solutions = []
+		t0, y_start, maximum = 0.0, y0, True
+		while True:
+			current_extremum.terminal = True
+			current_extremum.direction = -1 if maximum else 1
+			sol = solve(t0, y_start, t_eval, [current_extremum])
+			solutions.append(sol)
+			if sol.status != 1 or len(sol.t_events[-1]) == 0:
+				break
+			t0, y_start = sol.t_events[-1][-1], sol.y_events[-1][-1]
+			if maximum:
+				peak_current = max(peak_current, abs(y_start[2]))
+			maximum = not maximum
+		sol = _join_solutions(solutions, len(y0), len(events), stored_start=t_eval is None)
+
+	t, y = _append_stop_state(sol, n_terminal)
+	x, v, I, dIdt, V = y[:5]
+	results = (t, x, v, I, V, dIdt)
 
 	# Calculate voltage over capacitance bank
 	#V = V0 - 1/C*integrate.cumulative_trapezoid(I, t, initial=0)
 
-	# # Power loss
-	# P_R = R*I*I
-	# P_C = V*I
-	# P_L = L(x)*dIdt*I
+	# The energy delivered by the CB, the resistive loss and the work on the projectile
+	# are integrated with the state when energy is True.
+	# Note that the circuit model has no back EMF term I*dL/dt, so the work on the
+	# projectile is not drawn from the circuit: E_C = E_R + L(x)I^2/2 - W
 
-	# # Force
-	# F = I**2 * dLdx(x) / 2
-	# a = F / m
+	if peaks:
+		I_peak, F_peak = _peak_values(
+			sol,
+			y0=y0,
+			y1=y[:, -1],
+			current=lambda y: y[2],
+			force=lambda y: y[2]**2 * dLdx(y[0]) / 2,
+			first_peak_event=n_terminal
+		)
+		results += (I_peak, F_peak)
 
-	# # Print enery loss by the circuit
-	# print(f"Energy lost by the capacitator: {integrate.trapz(P_C, t)} J")
-	# print(f"Energy lost by the resistance: {integrate.trapz(P_R, t)} J")
-	# print(f"Energy lost by the inductor: {integrate.trapz(P_L, t)} J")
-	# print(f"Energy lost by the resistance and inductor: {integrate.trapz(P_R+P_L, t)} J")
-	# print(f"Final velocity: {integrate.trapz(a, t)} m/s")
-	# print(f"Work on the projectile: {integrate.trapz(F, x)} J")
-	# print(f"Energy gained by the projectile: {m/2*(v[-1]**2-v[0]**2)} J")
+	if energy:
+		results += (y[5:],)
 
-	return t, x, v, I, V, dIdt
+	return results
 
 def ode_solver_RL(
 	R: float, 		# Resistance of the coil
@@ -103,53 +330,366 @@ def ode_solver_RL(
 	v0: float, 		# Starting velocity of the projectile
 	I0: float, 		# Starting currnet through the coil
 	x1: float=None, # If present the simulation will end when the projectile passes this point
-	t_steps: int=None # Minimum steps the solver should take
+	t_steps: int=None, # Number of evenly spaced output samples over t_max. If None the steps of the solver are returned
+	method: str="RK45", 	# Method used by solve_ivp, or DOPRI5 for the lean Dormand-Prince integrator
+	rtol: float=1e-3, 		# Relative tolerance of the solver
+	atol: float=1e-6, 		# Absolute tolerance of the solver
+	d2Ldx2: Callable=None, 	# Second derivative of the inductance. If present the implicit methods get an analytic Jacobian
+	t_eval: np.ndarray=None, 	# Only store the solution at these times. The state where the solver stopped is always last
+	max_step: float=np.inf, 	# Largest step the solver may take. The step size is otherwise controlled by rtol and atol
+	peaks: bool=False, 		# Also return the peak current and force. Requires d2Ldx2
+	I_stop: float=None, 	# If present the simulation will end when |I| falls below this current
+	energy: bool=False, 	# Also integrate the energy ledger [E_C, E_R, W] and return it last. E_C is zero in this phase
+	scales: StateScales=None 	# If present atol is relative to the characteristic scale of each state component
 ):
 	"""
 	ODE solver for a coilgun after the contact to capacitance bank is closed.
 	This method assumes that the inductance is a known function of the position
 	"""
+	inductance = inductance_evaluator(L, dLdx)
+
 	def dydt(t, y):
 		"""
-		Calculate the derivative of the state [x, v, I]
+		Calculate the derivative of the state [x, v, I] (and [E_R, W])
 		"""
-		x, v, I = y
+		x, v, I = y[:3]
+		L_x, dLdx_x = inductance(x)
 
-		dvdt = I**2 * dLdx(x) / (2*m) #+ np.divide(L(x)*I*dIdt, v, out=np.zeros_like(v), where=v!=0)
-		dIdt = -I*R/L(x)
+		dvdt = I**2 * dLdx_x / (2*m) #+ np.divide(L(x)*I*dIdt, v, out=np.zeros_like(v), where=v!=0)
+		dIdt = -I*R/L_x
 
+		if energy:
+			return [v, dvdt, dIdt, R*I**2, m*dvdt*v]
 		return [v, dvdt, dIdt]
 
+	def jacobian(t, y):
+		"""
+		Calculate the Jacobian of the state [x, v, I]
+		"""
+		x, v, I = y[:3]
+		L_x, dLdx_x, d2Ldx2_x = L(x), dLdx(x), d2Ldx2(x)
+
+		jac = np.array([
+			[0, 1, 0],
+			[I**2 * d2Ldx2_x / (2*m), 0, I * dLdx_x / m],
+			[I*R*dLdx_x / L_x**2, 0, -R / L_x],
+		])
+
+		if energy:
+			return _ledger_jacobian(jac, [
+				[0, 0, 2*R*I],
+				[I**2 * d2Ldx2_x * v / 2, I**2 * dLdx_x / 2, I * dLdx_x * v],
+			])
+		return jac
+
 	def end_point_reached(t, y):
 		"""Stop the solver if the end point is reached"""
 		return y[0] - x1
 
+	def current_decayed(t, y):
+		"""Stop the solver when the current is too small to matter"""
+		return abs(y[2]) - I_stop
+
+	def force_peak(t, y):
+		"""The force on the projectile has an extremum when dF/dt changes sign"""
+		x, v, I = y[:3]
+		return -I**2 * R / L(x) * dLdx(x) + I**2 * d2Ldx2(x) * v / 2
+
 	# Stop at event
 	end_point_reached.terminal = True
+	current_decayed.terminal = True
+	current_decayed.direction = -1
 
 	# Set the events
-	events = None
+	events = []
 	if x1 is not None:
-		events = end_point_reached
+		events.append(end_point_reached)
+	if I_stop is not None:
+		events.append(current_decayed)
+	n_terminal = len(events)
+	if peaks:
+		events.append(force_peak)
 
-	# Calculate maximum time step
-	t_step = t_max / t_steps if t_steps is not None else np.inf
+	# The output resolution does not limit the step size of the solver
+	if t_eval is None and t_steps is not None:
+		t_eval = np.linspace(0, t_max, t_steps + 1)
 
 	# Calculate initial conditions
 	y0 = [x0, v0, I0]
+	if energy:
+		y0 += [0.0, 0.0]
+	atol = scaled_atol(atol, scales, ["x", "v", "I"] + ["E"]*(len(y0) - 3))
 
-	sol = integrate.solve_ivp(
-		fun=dydt, 
-		y0=y0, 
-		t_span=(0, t_max), 
+	# Only the implicit methods use the Jacobian (the others warn if it is given)
+	options = {}
+	if d2Ldx2 is not None and method in IMPLICIT_METHODS:
+		options["jac"] = jacobian
+
+	sol = solve_ode(
+		fun=dydt,
+		y0=y0,
+		t_max=t_max,
 		events=events,
-		max_step=t_step
+		method=method,
+		options=options,
+		max_step=max_step,
+		rtol=rtol,
+		atol=atol,
+		t_eval=t_eval
 	)
 
-	t = sol.t
-	x, v, I = sol.y
+	t, y = _append_stop_state(sol, n_terminal)
+	x, v, I = y[:3]
+	results = (t, x, v, I)
+
+	if peaks:
+		# The current only decays in this phase
+		I_peak, F_peak = _peak_values(
+			sol,
+			y0=y0,
+			y1=y[:, -1],
+			current=lambda y: y[2],
+			force=lambda y: y[2]**2 * dLdx(y[0]) / 2,
+			first_peak_event=n_terminal
+		)
+		results += (I_peak, F_peak)
+
+	if energy:
+		# No energy is delivered by the capacitance bank in this phase
+		results += (np.vstack((np.zeros_like(t), y[3:])),)
+
+	return results
+
+def ode_solver_hybrid(
+	C: float, 		# Capacitance of the capaitance bank
+	R: float, 		# Resistance of the coil
+	m: float, 		# Mass of the projectile
+	L: Callable, 	# Function that calculates the inductance of the coil at the position x
+	dLdx: Callable, # Function that calculates the derivative of the inductance at the position x
+	x0: float,		# Starting position relative to the center of the coil for the projectile
+	t_max: float,	# Maximum time for each phase of the simulation
+	V0: float,		# Starting voltage over the capacitance bank
+	v0: float, 		# Starting velocity of the projectile
+	x1: float=None, # If present the capacitor phase will end when the projectile passes this point
+	t_steps: int=None, # Number of evenly spaced output samples over t_max. If None the steps of the solver are returned
+	method: str="RK45", 	# One of the explicit Runge-Kutta methods in HYBRID_METHODS
+	rtol: float=1e-3, 		# Relative tolerance of the solver
+	atol: float=1e-6, 		# Absolute tolerance of the solver
+	max_step: float=np.inf, 	# Largest step the solver may take. The step size is otherwise controlled by rtol and atol
+	final_only: bool=False, 	# Only return the first state, the state at the switch and the last state
+	I_stop_fraction: float=None, 	# If present the capacitor phase will end when |I| falls below this fraction of its peak
+	RL_x1: float=None, 			# If present the RL phase will end when the projectile passes this point
+	RL_I_stop: Callable=None, 	# Called with the current and voltage at the switch. Returns the current where the RL phase ends or None
+	scales: StateScales=None, 	# If present atol is relative to the characteristic scale of each state component
+	**kwargs 				# Arguments for the two phase solvers that the hybrid solver does not use (e.g. d2Ldx2)
+):
+	"""
+	ODE solver for a coilgun that integrates the capacitor phase and the RL phase in one go.
+	The right hand side is switched when the diode stops the current from the capacitance bank,
+	so the step size of the solver is kept over the switch. The state is [x, v, I, dIdt, V]
+	in both phases but dIdt and V are frozen in the RL phase.
+	Returns the time, position, velocity, current and voltage and the time of the switch
+	"""
+	# The switch rewinds the state of the solver, which only the explicit Runge-Kutta methods allow
+	if method not in HYBRID_METHODS:
+		raise ValueError(f"The hybrid solver needs one of the methods {HYBRID_METHODS}, got {method}")
+
+	capacitor_phase = True
+	inductance = inductance_evaluator(L, dLdx)
+
+	def dydt(t, y):
+		"""
+		Calculate the derivative of the state [x, v, I, dIdt, V]
+		"""
+		x, v, I, dIdt, V = y
+		L_x, dLdx_x = inductance(x)
+
+		dvdt = I**2 * dLdx_x / (2*m)
+
+		if capacitor_phase:
+			dIdt2 = -I / (L_x*C) - R*dIdt / L_x - dIdt*dLdx_x*v/L_x
+			return np.array([v, dvdt, dIdt, dIdt2, -I/C])
+		return np.array([v, dvdt, -I*R/L_x, 0.0, 0.0])
+
+	# Events as (function, direction) in the same way as solve_ivp
+	peak_current = 0.0
+	capacitor_events = [(lambda y: y[4], 0)]
+	if x1 is not None:
+		capacitor_events.append((lambda y: y[0] - x1, 0))
+	if I_stop_fraction is not None:
+		capacitor_events.append((lambda y: abs(y[2]) - I_stop_fraction * peak_current, -1))
+
+	# Preallocate the output, one row [t, x, v, I, V] for every stored state
+	if final_only:
+		capacity = 3
+	elif t_steps is not None:
+		capacity = 2 * t_steps + 4
+	else:
+		capacity = 256
+	output = np.empty((capacity, 5))
+	n_stored = 0
+
+	def store(t, y):
+		nonlocal output, n_stored
+		if n_stored > 0 and output[n_stored - 1, 0] == t:
+			return
+		if n_stored == len(output):
+			output = np.concatenate((output, np.empty_like(output)))
+		output[n_stored, 0] = t
+		output[n_stored, 1:] = y[[0, 1, 2, 4]]
+		n_stored += 1
+
+	sample_dt = t_max / t_steps if t_steps is not None else None
+	next_sample = 1
+
+	def store_samples(sol, t_old, t_new):
+		"""Store the samples on the output grid in (t_old, t_new] using the dense output"""
+		nonlocal next_sample
+		if sample_dt is None or final_only:
+			return
+		while next_sample * sample_dt <= t_new:
+			t_sample = next_sample * sample_dt
+			if t_sample > t_old:
+				store(t_sample, sol(t_sample))
+			next_sample += 1
+
+	def find_event(events, sol, t_old, y_old, t_new, y_new):
+		"""Return the time and state of the first event in a step or None"""
+		first = None
+		for event, direction in events:
+			g_old, g_new = event(y_old), event(y_new)
+			crossed = (g_old > 0 >= g_new) if direction <= 0 else False
+			crossed |= (g_old < 0 <= g_new) if direction >= 0 else False
+			if not crossed:
+				continue
+			t_event = optimize.brentq(lambda t: event(sol(t)), t_old, t_new) if g_new != 0 else t_new
+			if first is None or t_event < first:
+				first = t_event
+		if first is None:
+			return None
+		return first, sol(first)
+
+	# Calculate initial conditions
+	y0 = np.array([x0, v0, 0.0, V0/L(x0), V0], dtype=float)
+	store(0.0, y0)
+	atol = scaled_atol(atol, scales, ["x", "v", "I", "dIdt", "V"])
+
+	solver = getattr(integrate, method)(
+		dydt, 0.0, y0, t_bound=t_max, max_step=max_step, rtol=rtol, atol=atol
+	)
+	events = capacitor_events
+	t_switch = None
+	t_end = t_max
+
+	while True:
+		t_old, y_old = solver.t, solver.y.copy()
+		message = solver.step()
+		if solver.status == "failed":
+			raise RuntimeError(message)
+
+		t_new, y_new = solver.t, solver.y
+		sol = solver.dense_output()
+
+		event = find_event(events, sol, t_old, y_old, t_new, y_new)
+		stopped = event is not None or solver.status == "finished"
+		if event is not None:
+			t_new, y_new = event
+
+		store_samples(sol, t_old, t_new)
+		if capacitor_phase:
+			peak_current = max(peak_current, abs(y_new[2]))
+
+		if not stopped:
+			if t_steps is None and not final_only:
+				store(t_new, y_new)
+			continue
+
+		store(t_new, y_new)
+
+		if not capacitor_phase:
+			break
+
+		# Switch to the RL phase. The step size of the solver is kept
+		capacitor_phase = False
+		t_switch = t_new
+		t_end = t_switch + t_max
+
+		events = []
+		if RL_x1 is not None:
+			if y_new[0] >= RL_x1 and y_new[1] >= 0:
+				# The projectile has already left the coil
+				break
+			events.append((lambda y: y[0] - RL_x1, 0))
+		I_stop = RL_I_stop(y_new[2], y_new[4]) if RL_I_stop is not None else None
+		if I_stop is not None:
+			if abs(y_new[2]) <= I_stop:
+				# The current is already too small to matter
+				break
+			events.append((lambda y: abs(y[2]) - I_stop, -1))
+
+		solver.t = t_switch
+		solver.y = y_new.copy()
+		solver.f = solver.fun(t_switch, solver.y)
+		solver.t_bound = t_end
+		solver.status = "running"
+		next_sample = int(np.floor(t_switch / sample_dt)) + 1 if sample_dt is not None else None
+
+	t, x, v, I, V = output[:n_stored].T
+	return t, x, v, I, V, t_switch
+
+def stiffness_ratio(
+	R: float, 	# Resistance of the coil
+	L: float, 	# Inductance of the coil
+	C: float 	# Capacitance of the capacitance bank
+) -> float:
+	"""
+	Cheap estimate of the stiffness of the capacitor discharge.
+	The ratio between the fastest and the slowest time scale of the
+	series RLC circuit. An underdamped circuit has one time scale and gives 1
+	"""
+	damping = R / (2*L)
+	discriminant = damping**2 - 1 / (L*C)
+
+	if discriminant <= 0:
+		return 1.0
+
+	fast = damping + np.sqrt(discriminant)
+	# Written this way to avoid cancellation when the circuit is heavily overdamped
+	slow = 1 / (L*C*fast)
+	return fast / slow
+
+def RL_stop_current(
+	I0: float, 		# Current through the coil at the start of the RL phase
+	V1: float, 		# Voltage left over the capacitance bank
+	V0: float, 		# Starting voltage over the capacitance bank
+	C: float, 		# Capacitance of the capacitance bank
+	A: float, 		# A of the inductance model L(x) = Aexp(-B|x|^C)+D
+	current_fraction: float=None, 	# End when |I| falls below this fraction of I0
+	energy_tolerance: float=None 	# End when the rest of the RL phase can not change the efficiency more than this
+):
+	"""
+	Return the current where the RL phase can end, or None if it runs until the time is up.
+	Works for scalars and for arrays with one value per design
+	"""
+	I_stop = []
+
+	if current_fraction is not None:
+		# The current only decays in the RL phase so the peak is the initial current
+		I_stop.append(current_fraction * np.abs(I0))
+
+	if energy_tolerance is not None:
+		# The work left on the projectile is the integral of I^2/2 dL(x(t)). |I| only decays in the
+		# RL phase, so by the second mean value theorem it is at most |A|I^2/2 from the current where
+		# the phase ends, whatever the projectile does. The circuit has no back EMF, so this is not
+		# drawn from the magnetic energy. Relative to the energy drained from the CB it bounds the
+		# error in the efficiency
+		energy_drained = C * (V0**2 - V1**2) / 2
+		with np.errstate(divide='ignore'):
+			I_stop.append(np.sqrt(2 * energy_tolerance * energy_drained / np.abs(A)))
 
-	return t, x, v, I
+	if not I_stop:
+		return None
+	return np.maximum.reduce(I_stop)
 
 def calculate_efficiency(
 	v0: float,	# Starting velocity for the projectile
@@ -0,0 +1,185 @@
+import math
+import numpy as np
+
+
+"""
+Models of the inductance of a coil as a function of the projectile position
+L(x) = Aexp(-B|x|^C) + D
+
+The ODE solvers evaluate the model for one scalar x at a time, where numpy
+is slow. The models therefore have a scalar path written with the math
+module and a numpy path for arrays (e.g. when plotting).
+"""
+
+
+def _is_scalar(x) -> bool:
+	return isinstance(x, (float, int, np.floating, np.integer))
+
+
+class InductanceModel:
+	"""
+	The exact inductance model L(x) = Aexp(-B|x|^C) + D
+	The parameters can also be arrays for one model per element of an array x, e.g. for a batch of coils
+	"""
+
+	def __init__(self, A: float, B: float, C: float, D: float):
+		self.A, self.B, self.C, self.D = (
+			float(param) if np.ndim(param) == 0 else np.asarray(param, dtype=float)
+			for param in (A, B, C, D)
+		)
+
+	def __call__(self, x):
+		"""Return L(x)"""
+		return self.with_derivative(x)[0]
+
+	def derivative(self, x):
+		"""Return dL/dx(x)"""
+		return self.with_derivative(x)[1]
+
+	def with_derivative(self, x):
+		"""Return L(x) and dL/dx(x) with one evaluation of the exponential"""
+		A, B, C, D = self.A, self.B, self.C, self.D
+
+		if _is_scalar(x):
+			x = float(x)
+			abs_x = abs(x)
+			exp_term = A * math.exp(-B * abs_x**C)
+			# The derivative goes to zero at x=0 for C>1
+			dLdx = -B * C * exp_term * abs_x**(C - 2) * x if x != 0 else 0.0
+			return exp_term + D, dLdx
+
+		x = np.asarray(x, dtype=float)
+		abs_x = np.abs(x)
+		exp_term = A * np.exp(-B * np.power(abs_x, C))
+		with np.errstate(divide='ignore', invalid='ignore'):
+			dLdx = np.where(x != 0, -B * C * exp_term * np.power(abs_x, C - 2) * x, 0.0)
+		return exp_term + D, dLdx
+
+	def second_derivative(self, x):
+		"""
+		Return d2L/dx2(x)
+		L''(x) = ABCe^(-B|x|^C)|x|^(C-2)(BC|x|^C - C + 1)
+		"""
+		A, B, C = self.A, self.B, self.C
+
+		if _is_scalar(x):
+			abs_x = abs(float(x))
+			if abs_x == 0:
+				return 0.0
+			abs_x_C = abs_x**C
+			return A * B * C * math.exp(-B * abs_x_C) * abs_x**(C - 2) * (B * C * abs_x_C - C + 1)
+
+		abs_x = np.abs(np.asarray(x, dtype=float))
+		abs_x_C = np.power(abs_x, C)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			return np.where(
+				abs_x != 0,
+				A * B * C * np.exp(-B * abs_x_C) * np.power(abs_x, C - 2) * (B * C * abs_x_C - C + 1),
+				0.0
+			)
+
+	def range(self, fraction: float) -> float:
+		"""
+		Return the distance from the center of the coil where Aexp(-B|x|^C)
+		has fallen to a fraction of A
+		"""
+		return (math.log(1 / fraction) / self.B)**(1 / self.C)
+
+
+class TabulatedInductance(InductanceModel):
+	"""
+	The inductance model precomputed on an evenly spaced grid.
+	L and dL/dx are interpolated with cubic Hermite polynomials that use the exact
+	derivatives at the grid points. Outside the grid the model is constant, L=D
+	"""
+
+	def __init__(self, A: float, B: float, C: float, D: float, points: int=2001, cutoff: float=1e-12):
+		super().__init__(A, B, C, D)
+
+		# The grid covers the region where the model differs from D by more than the cutoff
+		self.x_max = self.range(cutoff)
+		self.x_min = -self.x_max
+		self.points = points
+		self.h = (self.x_max - self.x_min) / (points - 1)
+		self.inv_h = 1 / self.h
+
+		x = np.linspace(self.x_min, self.x_max, points)
+		exact = InductanceModel(A, B, C, D)
+		L, dLdx = exact.with_derivative(x)
+		d2Ldx2 = exact.second_derivative(x)
+
+		# Lists are faster than arrays when indexed with python scalars
+		self.L_table = L.tolist()
+		self.dLdx_table = dLdx.tolist()
+		self.d2Ldx2_table = d2Ldx2.tolist()
+		self.L_array, self.dLdx_array, self.d2Ldx2_array = L, dLdx, d2Ldx2
+
+	def with_derivative(self, x):
+		if _is_scalar(x):
+			x = float(x)
+			if not self.x_min < x < self.x_max:
+				return self.D, 0.0
+
+			# Locate the interval and the position in it
+			u = (x - self.x_min) * self.inv_h
+			i = min(int(u), self.points - 2)
+			s = u - i
+			h = self.h
+
+			L0, L1 = self.L_table[i], self.L_table[i+1]
+			dL0, dL1 = self.dLdx_table[i], self.dLdx_table[i+1]
+			d2L0, d2L1 = self.d2Ldx2_table[i], self.d2Ldx2_table[i+1]
+
+			s2 = s*s
+			s3 = s2*s
+			h00 = 2*s3 - 3*s2 + 1
+			h10 = s3 - 2*s2 + s
+			h01 = 3*s2 - 2*s3
+			h11 = s3 - s2
+
+			return (
+				h00*L0 + h10*h*dL0 + h01*L1 + h11*h*dL1,
+				h00*dL0 + h10*h*d2L0 + h01*dL1 + h11*h*d2L1
+			)
+
+		x = np.asarray(x, dtype=float)
+		inside = (x > self.x_min) & (x < self.x_max)
+		u = np.where(inside, (x - self.x_min) * self.inv_h, 0.0)
+		i = np.minimum(u.astype(int), self.points - 2)
+		s = u - i
+		h = self.h
+
+		h00 = 2*s**3 - 3*s**2 + 1
+		h10 = s**3 - 2*s**2 + s
+		h01 = 3*s**2 - 2*s**3
+		h11 = s**3 - s**2
+
+		L = h00*self.L_array[i] + h10*h*self.dLdx_array[i] + h01*self.L_array[i+1] + h11*h*self.dLdx_array[i+1]
+		dLdx = h00*self.dLdx_array[i] + h10*h*self.d2Ldx2_array[i] + h01*self.dLdx_array[i+1] + h11*h*self.d2Ldx2_array[i+1]
+
+		return np.where(inside, L, self.D), np.where(inside, dLdx, 0.0)
+
+	def second_derivative(self, x):
+		"""Return d2L/dx2 by linear interpolation in the table"""
+		if _is_scalar(x):
+			x = float(x)
+			if not self.x_min < x < self.x_max:
+				return 0.0
+			u = (x - self.x_min) * self.inv_h
+			i = min(int(u), self.points - 2)
+			s = u - i
+			return (1 - s)*self.d2Ldx2_table[i] + s*self.d2Ldx2_table[i+1]
+
+		grid = np.linspace(self.x_min, self.x_max, self.points)
+		return np.interp(x, grid, self.d2Ldx2_array, left=0.0, right=0.0)
+
+	def interpolation_error(self, samples_per_interval: int=8) -> tuple[float, float]:
+		"""
+		Return the largest absolute error of L and dL/dx compared with the exact model,
+		checked at points between the grid points
+		"""
+		x = np.linspace(self.x_min, self.x_max, (self.points - 1) * samples_per_interval + 1)
+		L, dLdx = self.with_derivative(x)
+		L_exact, dLdx_exact = InductanceModel(self.A, self.B, self.C, self.D).with_derivative(x)
+
+		return np.max(np.abs(L - L_exact)), np.max(np.abs(dLdx - dLdx_exact))
@@ -0,0 +1,295 @@
+import numpy as np
+
+from dataclasses import dataclass, field
+from scipy import optimize
+from scipy.integrate import RK45
+from typing import Callable
+
+
+"""
+A lean adaptive Dormand-Prince 5(4) integrator for the small state vectors of the coilgun ODEs.
+
+It takes the same steps as RK45 in solve_ivp (same coefficients, error norm and step size
+control) but skips most of the generic bookkeeping. The stages are kept in one preallocated
+buffer and the right hand side is called with the state as a list of python floats, which
+makes the scalar arithmetic in the model much cheaper than with numpy scalars.
+The vectorized step and step size control below are used to solve many problems together.
+"""
+
+# The method name used to select this integrator instead of solve_ivp
+LEAN_METHOD = "DOPRI5"
+
+_A = RK45.A
+_B = RK45.B
+_C = RK45.C
+_E = RK45.E
+_P = RK45.P
+_ERROR_EXPONENT = -1 / (RK45.error_estimator_order + 1)
+
+_SAFETY = 0.9
+_MIN_FACTOR = 0.2
+_MAX_FACTOR = 10
+
+_EPS = np.finfo(float).eps
+
+
+@dataclass
+class LeanSolution:
+	"""The parts of the solve_ivp result that are used by the coilgun solvers"""
+
+	t: np.ndarray 			# Times of the stored states
+	y: np.ndarray 			# Stored states with shape (n, len(t))
+	t_events: list 			# Times of each event
+	y_events: list 			# States at each event
+	status: int 			# 0 if t_max was reached, 1 if a terminal event stopped the solver, -1 if it failed
+	nfev: int = 0 			# Number of evaluations of the right hand side
+	nsteps: int = 0 		# Number of accepted steps
+	message: str = field(default="")
+
+	@property
+	def success(self) -> bool:
+		return self.status >= 0
+
+
+def _rms(x: np.ndarray) -> float:
+	return np.sqrt(np.dot(x, x) / x.size)
+
+
+def _initial_step(fun: Callable, t0: float, y0: np.ndarray, f0: np.ndarray, t_span: float, max_step: float, rtol: float, atol: float) -> float:
+	"""The same initial step as solve_ivp"""
+	scale = atol + np.abs(y0) * rtol
+	d0 = _rms(y0 / scale)
+	d1 = _rms(f0 / scale)
+	if d0 < 1e-5 or d1 < 1e-5:
+		h0 = 1e-6
+	else:
+		h0 = 0.01 * d0 / d1
+	h0 = min(h0, t_span)
+
+	f1 = np.asarray(fun(t0 + h0, (y0 + h0 * f0).tolist()), dtype=float)
+	d2 = _rms((f1 - f0) / scale) / h0
+
+	if d1 <= 1e-15 and d2 <= 1e-15:
+		h1 = max(1e-6, h0 * 1e-3)
+	else:
+		h1 = (0.01 / max(d1, d2))**(-_ERROR_EXPONENT)
+
+	return min(100 * h0, h1, t_span, max_step)
+
+
+def dopri5_step(fun: Callable, t, y: np.ndarray, f: np.ndarray, h) -> tuple[np.ndarray, np.ndarray]:
+	"""
+	Take one Dormand-Prince step of size h from the state y at t where f = fun(t, y).
+	y can have the shape (n,) or (n, N) for N problems that are solved together, then t and h have the shape (N,).
+	Returns the new state and the stages K, the last stage is fun at the new state
+	"""
+	K = np.empty((7,) + np.shape(y))
+	K[0] = f
+	for s in range(1, 6):
+		K[s] = fun(t + _C[s] * h, y + h * np.tensordot(_A[s, :s], K[:s], axes=(0, 0)))
+	y_new = y + h * np.tensordot(_B, K[:6], axes=(0, 0))
+	K[6] = fun(t + h, y_new)
+	return y_new, K
+
+
+def error_norm(K: np.ndarray, h, y: np.ndarray, y_new: np.ndarray, rtol: float, atol) -> np.ndarray:
+	"""RMS norm of the scaled error estimate of a step, taken over the first axis like in solve_ivp"""
+	err = h * np.tensordot(_E, K, axes=(0, 0))
+	err /= atol + np.maximum(np.abs(y), np.abs(y_new)) * rtol
+	return np.sqrt(np.mean(err**2, axis=0))
+
+
+def step_factor(error_norm: np.ndarray, rejected=False) -> np.ndarray:
+	"""
+	Factor to scale the step size with after a step with the given error norm.
+	The step is not increased after an accepted step that follows a rejected one
+	"""
+	with np.errstate(divide='ignore'):
+		factor = np.where(
+			error_norm == 0,
+			_MAX_FACTOR,
+			np.clip(_SAFETY * np.power(error_norm, _ERROR_EXPONENT), _MIN_FACTOR, _MAX_FACTOR)
+		)
+	return np.where(rejected & (error_norm < 1), np.minimum(factor, 1), factor)
+
+
+def solve_ivp_lean(
+	fun: Callable, 		# Right hand side fun(t, y) where y is a list of floats. Returns a sequence
+	t_span: tuple, 		# Start and end time
+	y0: list, 			# Initial state
+	rtol: float=1e-3, 	# Relative tolerance
+	atol: float=1e-6, 	# Absolute tolerance
+	max_step: float=np.inf, 	# Largest step the solver may take
+	events: list=None, 	# Event functions event(t, y) with the attributes terminal and direction like in solve_ivp
+	t_eval: np.ndarray=None 	# Only store the solution at these times
+) -> LeanSolution:
+	"""
+	Solve an initial value problem with an adaptive Dormand-Prince method.
+	Used like solve_ivp(method="RK45") and gives the same results within rounding
+	"""
+	t, t_bound = map(float, t_span)
+	y = np.array(y0, dtype=float)
+	n = y.size
+	events = events or []
+
+	# Preallocated buffers for the stages, a trial state and the error estimate
+	K = np.empty((7, n))
+	y_stage = np.empty(n)
+	y_new = np.empty(n)
+	err = np.empty(n)
+
+	K[0] = fun(t, y.tolist())
+	nfev = 1
+
+	h_abs = _initial_step(fun, t, y, K[0], t_bound - t, max_step, rtol, atol)
+	nfev += 1
+
+	# Stored output with doubling capacity
+	t_eval = None if t_eval is None else np.asarray(t_eval, dtype=float)
+	capacity = len(t_eval) + 1 if t_eval is not None else 256
+	ts = np.empty(capacity)
+	ys = np.empty((capacity, n))
+	stored = 0
+	next_eval = 0
+
+	def store(t_i, y_i):
+		nonlocal ts, ys, stored
+		if stored == len(ts):
+			ts = np.concatenate((ts, np.empty(len(ts))))
+			ys = np.concatenate((ys, np.empty_like(ys)))
+		ts[stored] = t_i
+		ys[stored] = y_i
+		stored += 1
+
+	if t_eval is None:
+		store(t, y)
+	else:
+		while next_eval < len(t_eval) and t_eval[next_eval] <= t:
+			store(t_eval[next_eval], y)
+			next_eval += 1
+
+	# Events in the same way as solve_ivp
+	terminal = [getattr(event, "terminal", False) for event in events]
+	direction = [getattr(event, "direction", 0) for event in events]
+	g = [event(t, y.tolist()) for event in events]
+	t_events = [[] for _ in events]
+	y_events = [[] for _ in events]
+
+	status = None
+	nsteps = 0
+	message = "The solver successfully reached the end of the integration interval."
+
+	while status is None:
+		min_step = 10 * abs(np.nextafter(t, np.inf) - t)
+		h_abs = min(max(h_abs, min_step), max_step)
+		step_rejected = False
+
+		# Take one accepted step
+		while True:
+			if h_abs < min_step:
+				status = -1
+				message = "Required step size is less than spacing between numbers."
+				break
+
+			t_new = min(t + h_abs, t_bound)
+			h = t_new - t
+			h_abs = h
+
+			for s in range(1, 6):
+				np.dot(_A[s, :s], K[:s], out=y_stage)
+				y_stage *= h
+				y_stage += y
+				K[s] = fun(t + _C[s] * h, y_stage.tolist())
+
+			np.dot(_B, K[:6], out=y_new)
+			y_new *= h
+			y_new += y
+			K[6] = fun(t_new, y_new.tolist())
+			nfev += 6
+
+			np.dot(_E, K, out=err)
+			err *= h
+			err /= atol + np.maximum(np.abs(y), np.abs(y_new)) * rtol
+			error_norm = _rms(err)
+
+			if error_norm < 1:
+				if error_norm == 0:
+					factor = _MAX_FACTOR
+				else:
+					factor = min(_MAX_FACTOR, _SAFETY * error_norm**_ERROR_EXPONENT)
+				if step_rejected:
+					factor = min(1, factor)
+				h_abs *= factor
+				break
+
+			h_abs *= max(_MIN_FACTOR, _SAFETY * error_norm**_ERROR_EXPONENT)
+			step_rejected = True
+
+		if status is not None:
+			break
+		nsteps += 1
+
+		# Dense output over the step, y(t + theta*h) = y + h*Q[theta, theta^2, theta^3, theta^4]
+		Q = K.T.dot(_P)
+		t_old, y_old = t, y.copy()
+
+		def dense(t_i):
+			theta = (t_i - t_old) / h
+			return y_old + h * Q.dot([theta, theta**2, theta**3, theta**4])
+
+		t_stop = t_new
+		if events:
+			y_new_list = y_new.tolist()
+			g_new = [event(t_new, y_new_list) for event in events]
+
+			# Locate the roots of the active events
+			roots = []
+			for i, (g_i, g_new_i, d) in enumerate(zip(g, g_new, direction)):
+				up = g_i <= 0 <= g_new_i
+				down = g_i >= 0 >= g_new_i
+				if (up and d > 0) or (down and d < 0) or ((up or down) and d == 0):
+					root = optimize.brentq(
+						lambda t_i: events[i](t_i, dense(t_i).tolist()),
+						t_old, t_new, xtol=4*_EPS, rtol=4*_EPS
+					)
+					roots.append((root, i))
+			roots.sort()
+
+			# Record the events up to and including the first terminal one
+			for root, i in roots:
+				t_events[i].append(root)
+				y_events[i].append(dense(root))
+				if terminal[i]:
+					status = 1
+					message = "A termination event occurred."
+					t_stop = root
+					break
+			g = g_new
+
+		if t_eval is None:
+			store(t_stop, dense(t_stop) if status == 1 else y_new)
+		else:
+			while next_eval < len(t_eval) and t_eval[next_eval] <= t_stop:
+				store(t_eval[next_eval], dense(t_eval[next_eval]))
+				next_eval += 1
+
+		if status == 1:
+			break
+
+		t = t_new
+		y[:] = y_new
+		K[0] = K[6]
+
+		if t >= t_bound:
+			status = 0
+
+	return LeanSolution(
+		t=ts[:stored],
+		y=ys[:stored].T,
+		t_events=[np.array(t_event) for t_event in t_events],
+		y_events=[np.array(y_event).reshape(-1, n) for y_event in y_events],
+		status=status,
+		nfev=nfev,
+		nsteps=nsteps,
+		message=message
+	)
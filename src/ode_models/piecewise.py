@@ -0,0 +1,293 @@
+import numpy as np
+
+from scipy import optimize
+from typing import Callable
+
+from ode_models.coilgun import StateScales, inductance_evaluator, scaled_atol, solve_ode
+from utils.circuits import rlc_solution
+
+
+"""
+Solve the coilgun ODE piecewise, with closed-form solutions where the projectile is far from the coil.
+
+Far from the coil L(x) is almost constant and dL/dx almost zero. The circuit is then a plain
+series RLC circuit (or an RL circuit after the switch) and the projectile moves with constant
+velocity. Both have exact solutions, so only the time near the coil is integrated numerically.
+
+The state is [x, v, I, V] with the circuit written as L(x)dI/dt = V - RI, which is the same
+model as the [x, v, I, dIdt, V] state of ode_solver_coilgun.
+"""
+
+# Smallest number of points used to bracket the events of a closed-form segment
+_MIN_GRID_POINTS = 16
+# Largest number of points used to bracket the events of a closed-form segment
+_MAX_GRID_POINTS = 100000
+
+
+def _first_crossing(g: Callable, t_grid: np.ndarray, g_grid: np.ndarray) -> float:
+	"""
+	Return the first time where g goes from positive to zero or negative,
+	bracketed by the grid and refined with brentq. None if it does not happen on the grid
+	"""
+	crossed = np.flatnonzero((g_grid[:-1] > 0) & (g_grid[1:] <= 0))
+	if crossed.size == 0:
+		return None
+	k = crossed[0]
+	if g_grid[k + 1] == 0:
+		return t_grid[k + 1]
+	return optimize.brentq(g, t_grid[k], t_grid[k + 1])
+
+
+def ode_solver_piecewise(
+	C: float, 		# Capacitance of the capaitance bank
+	R: float, 		# Resistance of the coil
+	m: float, 		# Mass of the projectile
+	L: Callable, 	# Function that calculates the inductance of the coil at the position x
+	dLdx: Callable, # Function that calculates the derivative of the inductance at the position x
+	x0: float,		# Starting position relative to the center of the coil for the projectile
+	t_max: float,	# Maximum time for each phase of the simulation
+	V0: float,		# Starting voltage over the capacitance bank
+	v0: float, 		# Starting velocity of the projectile
+	x_far: float, 	# L(x) is treated as constant and dL/dx as zero where |x| is larger than this
+	x1: float=None, # If present the capacitor phase will end when the projectile passes this point
+	t_steps: int=None, # Number of evenly spaced output samples over t_max. If None only the ends of the segments are returned
+	method: str="RK45", 	# Method used by solve_ivp near the coil, or DOPRI5 for the lean Dormand-Prince integrator
+	rtol: float=1e-3, 		# Relative tolerance of the solver
+	atol: float=1e-6, 		# Absolute tolerance of the solver
+	max_step: float=np.inf, 	# Largest step the solver may take. The step size is otherwise controlled by rtol and atol
+	final_only: bool=False, 	# Only return the first state, the state at the switch and the last state
+	I_stop_fraction: float=None, 	# If present the capacitor phase will end when |I| falls below this fraction of its peak
+	RL_x1: float=None, 			# If present the RL phase will end when the projectile passes this point
+	RL_I_stop: Callable=None, 	# Called with the current and voltage at the switch. Returns the current where the RL phase ends or None
+	scales: StateScales=None, 	# If present atol is relative to the characteristic scale of each state component
+	**kwargs 				# Arguments for the other solvers that are not used here (e.g. d2Ldx2)
+):
+	"""
+	ODE solver for both phases of a coilgun that only integrates numerically near the coil.
+	Where |x| > x_far the exact RLC (or RL) solution with the inductance frozen at the start
+	of the segment is used and the projectile keeps its velocity.
+	Returns the time, position, velocity, current and voltage and the time of the switch
+	"""
+	inductance = inductance_evaluator(L, dLdx)
+	atol = scaled_atol(atol, scales, ["x", "v", "I", "V"])
+
+	output = []
+	sample_dt = t_max / t_steps if t_steps is not None and not final_only else None
+
+	def store(t, y):
+		if output and output[-1][0] == t:
+			return
+		output.append((t, *y))
+
+	def sample_times(t_start, t_end):
+		"""Return the times of the output grid in (t_start, t_end)"""
+		if sample_dt is None:
+			return np.empty(0)
+		first = np.floor(t_start / sample_dt) + 1
+		times = np.arange(first, np.ceil(t_end / sample_dt)) * sample_dt
+		return times[(times > t_start) & (times < t_end)]
+
+	capacitor_phase = True
+	# The peak of |I| so far. It only changes between the solves, at the maxima of |I|
+	peak_current = 0.0
+	next_extremum_maximum = True
+	at_extremum = False
+	I_stop = None
+	t, y = 0.0, np.array([x0, v0, 0.0, V0], dtype=float)
+	t_end = t_max
+	t_switch = None
+	store(t, y)
+
+	def is_far(x, v):
+		"""The projectile is far from the coil and not on its way in at the border"""
+		if abs(x) > x_far:
+			return True
+		return abs(x) >= x_far * (1 - 1e-9) and x * v >= 0
+
+	while True:
+		x, v, I, V = y
+		phase_ended = False
+
+		if is_far(x, v):
+			# Exact solution with L(x) frozen at the start of the segment
+			L_x = inductance(x)[0]
+			tau_end = t_end - t
+			reenters = False
+			if x * v < 0 and abs(x) > x_far:
+				tau_border = (abs(x) - x_far) / abs(v)
+				if tau_border < tau_end:
+					tau_end, reenters = tau_border, True
+
+			stop_x = x1 if capacitor_phase else RL_x1
+			if stop_x is not None and x < stop_x and v > 0 and (stop_x - x) / v <= tau_end:
+				tau_end, reenters, phase_ended = (stop_x - x) / v, False, True
+
+			if capacitor_phase:
+				circuit, omega = rlc_solution(R, L_x, C, I, V)
+			else:
+				decay = R / L_x
+				circuit, omega = (lambda tau: (I * np.exp(-decay * np.asarray(tau)), np.full(np.shape(tau), V))), 0.0
+
+			# Bracket the events on a grid that resolves the oscillation
+			points = _MIN_GRID_POINTS
+			if omega > 0:
+				points = int(np.clip(np.ceil(tau_end * omega * 8 / np.pi), _MIN_GRID_POINTS, _MAX_GRID_POINTS))
+			tau_grid = np.linspace(0, tau_end, points)
+			I_grid, V_grid = circuit(tau_grid)
+
+			tau_event = None
+			if capacitor_phase:
+				tau_event = _first_crossing(lambda tau: circuit(tau)[1], tau_grid, V_grid)
+				if I_stop_fraction is not None:
+					peaks = np.maximum(peak_current, np.maximum.accumulate(np.abs(I_grid)))
+					tau_decay = _first_crossing(
+						lambda tau: abs(circuit(tau)[0]) - I_stop_fraction * peaks[-1],
+						tau_grid, np.abs(I_grid) - I_stop_fraction * peaks
+					)
+					if tau_decay is not None and (tau_event is None or tau_decay < tau_event):
+						tau_event = tau_decay
+			elif I_stop is not None:
+				tau_event = _first_crossing(lambda tau: abs(circuit(tau)[0]) - I_stop, tau_grid, np.abs(I_grid) - I_stop)
+
+			if tau_event is not None and tau_event < tau_end:
+				tau_end, reenters, phase_ended = tau_event, False, True
+				tau_grid = tau_grid[tau_grid < tau_end]
+				I_grid = I_grid[:tau_grid.size]
+
+			peak_current = max(peak_current, np.max(np.abs(I_grid)) if I_grid.size > 0 else 0.0)
+
+			samples = sample_times(t, t + tau_end)
+			if samples.size > 0:
+				I_samples, V_samples = circuit(samples - t)
+				for t_sample, I_sample, V_sample in zip(samples, I_samples, V_samples):
+					store(t_sample, (x + v*(t_sample - t), v, I_sample, V_sample))
+
+			I_new, V_new = circuit(tau_end)
+			t, y = t + tau_end, np.array([x + v*tau_end, v, float(I_new), float(V_new)])
+			peak_current = max(peak_current, abs(y[2]))
+
+			if reenters:
+				continue
+
+		else:
+			# Integrate numerically until the projectile leaves the region near the coil
+			def dydt(tau, y):
+				x, v, I, V = y
+				L_x, dLdx_x = inductance(x)
+				dvdt = I**2 * dLdx_x / (2*m)
+				if capacitor_phase:
+					return [v, dvdt, (V - R*I) / L_x, -I/C]
+				return [v, dvdt, -R*I / L_x, 0.0]
+
+			def leaves_forward(tau, y):
+				return y[0] - x_far
+
+			def leaves_backward(tau, y):
+				return y[0] + x_far
+
+			leaves_forward.terminal = leaves_backward.terminal = True
+			leaves_forward.direction, leaves_backward.direction = 1, -1
+			events = [leaves_forward, leaves_backward]
+
+			if capacitor_phase:
+				def no_reverse_voltage(tau, y):
+					return y[3]
+				events.append(no_reverse_voltage)
+				if I_stop_fraction is not None:
+					I_threshold = I_stop_fraction * peak_current
+					def current_decayed(tau, y):
+						return abs(y[2]) - I_threshold
+					current_decayed.direction = -1
+					events.append(current_decayed)
+			elif I_stop is not None:
+				def current_decayed(tau, y):
+					return abs(y[2]) - I_stop
+				current_decayed.direction = -1
+				events.append(current_decayed)
+
+			stop_x = x1 if capacitor_phase else RL_x1
+			if stop_x is not None:
+				def end_point_reached(tau, y):
+					return y[0] - stop_x
+				events.append(end_point_reached)
+
+			for event in events[2:]:
+				event.terminal = True
+
+			# Stop at the extrema of |I| to update the peak of the current_decayed threshold.
+			# The event is zero where the solver restarts after one, so maxima and minima are looked for in turn
+			extremum = None
+			if capacitor_phase and I_stop_fraction is not None:
+				if not at_extremum and I * (V - R*I) != 0:
+					next_extremum_maximum = I * (V - R*I) > 0
+				def current_extremum(tau, y):
+					return y[2] * (y[3] - R*y[2])
+				current_extremum.terminal = True
+				current_extremum.direction = -1 if next_extremum_maximum else 1
+				extremum = len(events)
+				events.append(current_extremum)
+
+			samples = sample_times(t, t_end)
+			sol = solve_ode(
+				fun=dydt,
+				y0=y.tolist(),
+				t_max=t_end - t,
+				events=events,
+				method=method,
+				options={},
+				max_step=max_step,
+				rtol=rtol,
+				atol=atol,
+				t_eval=np.append(samples - t, t_end - t) if sample_dt is not None else None
+			)
+			if not sol.success:
+				raise RuntimeError(sol.message)
+
+			if sample_dt is not None:
+				for tau_sample, y_sample in zip(sol.t, sol.y.T):
+					store(t + tau_sample, y_sample)
+			elif not final_only:
+				for tau_step, y_step in zip(sol.t[1:-1], sol.y.T[1:-1]):
+					store(t + tau_step, y_step)
+
+			stopped_by = [i for i, t_event in enumerate(sol.t_events) if len(t_event) > 0]
+			if stopped_by:
+				i = stopped_by[0]
+				t, y = t + sol.t_events[i][0], np.array(sol.y_events[i][0])
+				at_extremum = i == extremum
+				if at_extremum:
+					if next_extremum_maximum:
+						peak_current = max(peak_current, abs(y[2]))
+					next_extremum_maximum = not next_extremum_maximum
+				elif i >= 2:
+					phase_ended = True
+			else:
+				t, y = t + sol.t[-1], sol.y[:, -1].copy()
+				at_extremum = False
+			peak_current = max(peak_current, np.max(np.abs(sol.y[2])) if sol.y.size > 0 else 0.0, abs(y[2]))
+
+			if not phase_ended and t < t_end:
+				# Left the region near the coil
+				if not final_only:
+					store(t, y)
+				continue
+
+		store(t, y)
+
+		if not capacitor_phase:
+			break
+
+		# Switch to the RL phase
+		capacitor_phase = False
+		t_switch = t
+		t_end = t_switch + t_max
+		I_stop = RL_I_stop(y[2], y[3]) if RL_I_stop is not None else None
+		if RL_x1 is not None and y[0] >= RL_x1 and y[1] >= 0:
+			# The projectile has already left the coil
+			break
+		if I_stop is not None and abs(y[2]) <= I_stop:
+			# The current is already too small to matter
+			break
+
+	t, x, v, I, V = np.array(output).T
+	return t, x, v, I, V, t_switch
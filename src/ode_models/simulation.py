@@ -2,10 +2,55 @@ from dataclasses import dataclass
 import numpy as np
 
 from GA.DNA import DNA
-from ode_models.coilgun import ode_solver_coilgun, ode_solver_RL
+from ode_models.coilgun import ode_solver_coilgun, ode_solver_RL, ode_solver_hybrid, stiffness_ratio, RL_stop_current, HYBRID_METHODS, StateScales
+from ode_models.batch import ode_solver_coilgun_batch, BatchSolution
+from ode_models.piecewise import ode_solver_piecewise
+from ode_models.inductance import InductanceModel, TabulatedInductance
 from utils.constants import mu_0
 
 
+@dataclass
+class SolverConf:
+	"""Settings for the ODE solver"""
+
+	method: str = "RK45" 				# RK45, DOP853, Radau, BDF, LSODA, DOPRI5 or auto
+	rtol: float = 1e-7 					# Relative tolerance of the solver, calibrated with cli.calibrate
+	atol: float = 1e-6 					# Absolute tolerance of the solver
+	scaled: bool = False 				# atol is relative to the characteristic scales of each design instead of in SI units
+	max_step: float = np.inf 			# Largest step the solver may take. The tolerances control the step size otherwise
+	jacobian: bool = True 				# Give the implicit methods an analytic Jacobian
+	hybrid: bool = False 				# Solve both phases in one integration. Only for the explicit Runge-Kutta methods
+	analytic_tolerance: float = None 	# Use the exact RLC and RL solutions where L(x) is within this fraction of D from constant
+	stop_current_fraction: float = None 	# End a phase when |I| falls below this fraction of the peak current of the phase
+	stop_exit_fraction: float = None 		# End the RL phase when the projectile is so far past the coil that L(x)-D is below this fraction of A
+	stop_energy_tolerance: float = None 	# End the RL phase when the rest of it can not change the efficiency more than this
+	nonstiff_method: str = "RK45" 		# Method used by auto for non-stiff designs
+	stiff_method: str = "Radau" 		# Method used by auto for stiff designs
+	stiffness_threshold: float = 1e3 	# Designs with a larger stiffness ratio are solved with stiff_method
+	inductance_table_points: int = None 	# Tabulate the inductance model with this many points. None evaluates the model exactly
+
+
+@dataclass
+class ODEFinalState:
+	"""The start and end of an ODE simulation of a coilgun"""
+
+	x0: float 				# [m] Initial position of the projectile
+	v0: float 				# [m/s] Initial velocity of the projectile
+	V0: float 				# [V] Initial voltage over the capacitance bank
+	t_switch: float 		# [s] Time when the capacitance bank was disconnected
+	t: float 				# [s] Time when the simulation ended
+	x: float 				# [m] Final position of the projectile
+	v: float 				# [m/s] Final velocity of the projectile
+	I: float 				# [A] Final current through the coil
+	V: float 				# [V] Final voltage over the capacitance bank
+	I_peak: float = None 	# [A] Largest current through the coil. Only calculated on request
+	F_peak: float = None 	# [N] Largest force on the projectile. Only calculated on request
+	E_C: float = None 		# [J] Energy delivered by the capacitance bank. Only calculated on request
+	E_R: float = None 		# [J] Energy lost in the resistance of the coil. Only calculated on request
+	W: float = None 		# [J] Work done on the projectile. Only calculated on request
+	E_L: float = None 		# [J] Energy left in the magnetic field of the coil. Only calculated on request
+
+
 @dataclass
 class CapacitanceBankData:
 	"""Data for a capacitance bank"""
@@ -89,6 +134,40 @@ class CoilData:
 
 		return dLdx
 
+	def inductance(self, projectile: ProjectileData, table_points: int=None) -> InductanceModel:
+		"""
+		Return the inductance model as an object that evaluates L, dL/dx and d2L/dx2.
+		If table_points is given the model is precomputed on a grid with that many points
+		"""
+		A, B, C, D = self.params_for_inductance_model(projectile)
+		if table_points is None:
+			return InductanceModel(A, B, C, D)
+		return TabulatedInductance(A, B, C, D, points=table_points)
+
+	def inductance_model_range(self, projectile: ProjectileData, fraction: float) -> float:
+		"""
+		Return the distance from the center of the coil where the position dependent part
+		of the inductance model, Aexp(-B|x|^C), has fallen to a fraction of A
+		"""
+		A, B, C, D = self.params_for_inductance_model(projectile)
+		return (np.log(1 / fraction) / B)**(1 / C)
+
+	def inductance_model_second_derivitive(self, projectile: ProjectileData):
+		"""
+		Return a function that will calculate the second derivative
+		of the inductance with respect of the projectile position
+		"""
+		A, B, C, D = self.params_for_inductance_model(projectile)
+		def d2Ldx2(x):
+			"""
+			Calculate the second derivative of the inductance of a coil
+			L''(x) = ABCe^(-B|x|^C)|x|^(C-2)(BC|x|^C - C + 1)
+			"""
+			abs_x_C = np.power(np.abs(x), C)
+			return A*B*C*np.exp(-B*abs_x_C)*np.power(np.abs(x), C-2)*(B*C*abs_x_C - C + 1)
+
+		return d2Ldx2
+
 class CoilgunSimulationODE:
 	"""
 	Simulation of a coilgun using an ODE model
@@ -98,6 +177,8 @@ class CoilgunSimulationODE:
 		self.coil = coil
 		self.CB = CB
 		self.projectile = projectile
+		# Inductance models by number of table points, built once per simulation
+		self._inductance_models = {}
 
 	@classmethod
 	def from_DNA(cls, DNA: DNA):
@@ -125,40 +206,216 @@ class CoilgunSimulationODE:
 
 		return cls(coil=coil, CB=CB, projectile=projectile)
 
-	def run(self, t_max: float, t_steps: int):
-		"""Run the simulation during a time t_max for t_steps"""
-		L = self.coil.inductance_model(self.projectile)
-		dLdx = self.coil.inductance_model_derivitive(self.projectile)
-		R = self.coil.resistance()
+	def solver_method(self, conf: SolverConf) -> str:
+		"""Return the solver method to use. With auto it is chosen from the stiffness of the circuit"""
+		if conf.method != "auto":
+			return conf.method
+
+		L = self.inductance(conf)
+		ratio = stiffness_ratio(R=self.coil.resistance(), L=L(self.projectile.x0), C=self.CB.C)
+
+		if ratio > conf.stiffness_threshold:
+			return conf.stiff_method
+		return conf.nonstiff_method
+
+	def inductance(self, solver_conf: SolverConf=None) -> InductanceModel:
+		"""Return the inductance model of the coil and projectile used by the solvers"""
+		table_points = solver_conf.inductance_table_points if solver_conf is not None else None
+		if table_points not in self._inductance_models:
+			self._inductance_models[table_points] = self.coil.inductance(self.projectile, table_points)
+		return self._inductance_models[table_points]
+
+	def characteristic_scales(self) -> StateScales:
+		"""
+		Return the characteristic scales of the state, derived from the
+		coil length, the LC time and the peak current of the circuit
+		"""
+		L = self.inductance()(self.projectile.x0)
+		C, R, V0 = self.CB.C, self.coil.resistance(), self.CB.V
+
+		T = np.sqrt(L * C)
+		# The current is limited by the resistance in overdamped circuits and by the LC impedance otherwise
+		I = V0 / max(R, np.sqrt(L / C))
+
+		return StateScales(
+			x=self.coil.l,
+			v=self.coil.l / T,
+			I=I,
+			dIdt=I / T,
+			V=V0,
+			E=C * V0**2 / 2
+		)
+
+	def _solver_args(self, solver_conf: SolverConf, second_derivative: bool=False) -> dict:
+		"""Return the arguments that are shared by both ODE solvers"""
+		conf = solver_conf if solver_conf is not None else SolverConf()
+		use_d2Ldx2 = conf.jacobian or second_derivative
+
+		inductance = self.inductance(conf)
+
+		return {
+			"m": self.projectile.m,
+			"L": inductance,
+			"dLdx": inductance.derivative,
+			"d2Ldx2": inductance.second_derivative if use_d2Ldx2 else None,
+			"R": self.coil.resistance(),
+			"method": self.solver_method(conf),
+			"rtol": conf.rtol,
+			"atol": conf.atol,
+			"max_step": conf.max_step,
+			"scales": self.characteristic_scales() if conf.scaled else None
+		}
+
+	def _coil_passed(self, conf: SolverConf, x: float, v: float) -> bool:
+		"""Return True if the projectile has left the coil for good and the RL phase can be skipped"""
+		if conf.stop_exit_fraction is None:
+			return False
+		return x >= self.coil.inductance_model_range(self.projectile, conf.stop_exit_fraction) and v >= 0
+
+	def _RL_stop_args(self, conf: SolverConf, I0: float, V1: float) -> dict:
+		"""Return the arguments for the terminal events of the RL phase"""
+		A, B, C, D = self.coil.params_for_inductance_model(self.projectile)
+		I_stop = RL_stop_current(
+			I0=I0,
+			V1=V1,
+			V0=self.CB.V,
+			C=self.CB.C,
+			A=A,
+			current_fraction=conf.stop_current_fraction,
+			energy_tolerance=conf.stop_energy_tolerance
+		)
+
+		return {
+			"x1": self.coil.inductance_model_range(self.projectile, conf.stop_exit_fraction) if conf.stop_exit_fraction is not None else None,
+			"I_stop": float(I_stop) if I_stop is not None else None
+		}
+
+	def _skip_RL_phase(self, conf: SolverConf, x: float, v: float, I: float, V: float) -> bool:
+		"""Return True if the RL phase would end where it starts"""
+		I_stop = self._RL_stop_args(conf, I, V)["I_stop"]
+		return self._coil_passed(conf, x, v) or (I_stop is not None and abs(I) <= I_stop)
+
+	def _use_hybrid(self, conf: SolverConf) -> bool:
+		"""Return True if the simulation should use the hybrid solver"""
+		return conf.hybrid and self.solver_method(conf) in HYBRID_METHODS
+
+	def _run_hybrid(self, t_max: float, t_steps: int, conf: SolverConf, final_only: bool):
+		"""Run both phases of the simulation with the hybrid solver"""
+		solver_args = self._solver_args(conf)
+		RL_stop_args = self._RL_stop_args(conf, I0=1.0, V1=0.0)
+
+		return ode_solver_hybrid(
+			C=self.CB.C,
+			V0=self.CB.V,
+			x0=self.projectile.x0,
+			x1=self.projectile.x1,
+			v0=self.projectile.v0,
+			t_max=t_max,
+			t_steps=t_steps,
+			final_only=final_only,
+			I_stop_fraction=conf.stop_current_fraction,
+			RL_x1=RL_stop_args["x1"],
+			RL_I_stop=lambda I0, V1: self._RL_stop_args(conf, I0, V1)["I_stop"],
+			**solver_args
+		)
+
+	def dimensionless_groups(self, t_max: float) -> tuple:
+		"""
+		Return the dimensionless groups of the design. With the position in coil lengths,
+		the time in units of sqrt(DC) and the current in units of V0*sqrt(C/D) the ODE only
+		depends on these, so designs with the same groups have the same efficiency
+		"""
+		A, B, C_L, D = self.coil.params_for_inductance_model(self.projectile)
+		C, R, V0 = self.CB.C, self.coil.resistance(), self.CB.V
+		l, m = self.coil.l, self.projectile.m
+		T = np.sqrt(D * C)
+
+		return (
+			R * np.sqrt(C / D), 				# Damping of the circuit
+			C**2 * V0**2 * D / (m * l**2), 		# Squared ratio of the electrical to the mechanical time scale
+			self.projectile.x0 / l, 			# Start position
+			self.projectile.x1 / l if self.projectile.x1 is not None else None, 	# End position
+			self.projectile.v0 * T / l, 		# Start velocity
+			A / D, 								# Strength of the core (mu_r - 1)
+			C_L, 								# Shape of the inductance model
+			t_max / T 							# Length of each phase
+		)
+
+	def far_distance(self, tolerance: float) -> float:
+		"""
+		Return the distance from the center of the coil beyond which L(x) differs
+		from D by less than a fraction tolerance of D
+		"""
+		A, B, C, D = self.coil.params_for_inductance_model(self.projectile)
+		if A == 0 or tolerance * D >= abs(A):
+			return 0.0
+		return self.inductance().range(tolerance * D / abs(A))
+
+	def _run_piecewise(self, t_max: float, t_steps: int, conf: SolverConf, final_only: bool):
+		"""Run both phases of the simulation with exact solutions far from the coil"""
+		solver_args = self._solver_args(conf)
+		RL_stop_args = self._RL_stop_args(conf, I0=1.0, V1=0.0)
+
+		return ode_solver_piecewise(
+			C=self.CB.C,
+			V0=self.CB.V,
+			x0=self.projectile.x0,
+			x1=self.projectile.x1,
+			v0=self.projectile.v0,
+			t_max=t_max,
+			x_far=self.far_distance(conf.analytic_tolerance),
+			t_steps=t_steps,
+			final_only=final_only,
+			I_stop_fraction=conf.stop_current_fraction,
+			RL_x1=RL_stop_args["x1"],
+			RL_I_stop=lambda I0, V1: self._RL_stop_args(conf, I0, V1)["I_stop"],
+			**solver_args
+		)
+
+	def run(self, t_max: float, t_steps: int=None, solver_conf: SolverConf=None):
+		"""
+		Run the simulation during a time t_max.
+		The trajectories are sampled t_steps times over t_max in each phase,
+		or at the steps of the solver if t_steps is None
+		"""
+		conf = solver_conf if solver_conf is not None else SolverConf()
+
+		if conf.analytic_tolerance is not None:
+			t, x, v, I, V, _ = self._run_piecewise(t_max, t_steps, conf, final_only=False)
+			return t, x, v, I, V
+
+		if self._use_hybrid(conf):
+			t, x, v, I, V, _ = self._run_hybrid(t_max, t_steps, conf, final_only=False)
+			return t, x, v, I, V
+
+		solver_args = self._solver_args(conf)
 
 		# Drain the CB
 		t1, x1, v1, I1, V1, _ = ode_solver_coilgun(
 			C=self.CB.C,
 			V0=self.CB.V,
-			m=self.projectile.m,
 			x0=self.projectile.x0,
 			x1=self.projectile.x1,
 			v0=self.projectile.v0,
-			L=L,
-			dLdx=dLdx,
-			R=R,
 			t_max=t_max,
-			t_steps=t_steps
+			t_steps=t_steps,
+			I_stop_fraction=conf.stop_current_fraction,
+			**solver_args
 		)
 
 		# After CB is drained the current do not go to zero imedietly
-		t2, x2, v2, I2 = ode_solver_RL(
-			m=self.projectile.m,
-			x0=x1[-1],
-			x1=None,
-			v0=v1[-1],
-			L=L,
-			dLdx=dLdx,
-			R=R,
-			I0=I1[-1],
-			t_max=t_max,
-			t_steps=t_steps
-		)
+		if self._skip_RL_phase(conf, x1[-1], v1[-1], I1[-1], V1[-1]):
+			t2, x2, v2, I2 = np.zeros(1), x1[-1:], v1[-1:], I1[-1:]
+		else:
+			t2, x2, v2, I2 = ode_solver_RL(
+				x0=x1[-1],
+				v0=v1[-1],
+				I0=I1[-1],
+				t_max=t_max,
+				t_steps=t_steps,
+				**self._RL_stop_args(conf, I1[-1], V1[-1]),
+				**solver_args
+			)
 		# first element is the same as the last
 		t = np.concatenate((t1, t2[1:] + t1[-1]))
 		x = np.concatenate((x1, x2[1:]))
@@ -168,3 +425,120 @@ class CoilgunSimulationODE:
 
 		# Return time, pos, vel, current, voltage
 		return t, x, v, I, V
+
+	def run_final(self, t_max: float, solver_conf: SolverConf=None, peaks: bool=False, energy: bool=False) -> 'ODEFinalState':
+		"""
+		Run the simulation like run but only keep what is needed to calculate the fitness.
+		No trajectories are stored or concatenated.
+		With energy the energy ledger is integrated together with the state
+		"""
+		conf = solver_conf if solver_conf is not None else SolverConf()
+
+		# The hybrid and piecewise solvers do not locate the peaks or integrate the energy ledger
+		single_pass = conf.analytic_tolerance is not None or self._use_hybrid(conf)
+		if single_pass and not peaks and not energy:
+			if conf.analytic_tolerance is not None:
+				t, x, v, I, V, t_switch = self._run_piecewise(t_max, None, conf, final_only=True)
+			else:
+				t, x, v, I, V, t_switch = self._run_hybrid(t_max, None, conf, final_only=True)
+			return ODEFinalState(
+				x0=self.projectile.x0,
+				v0=self.projectile.v0,
+				V0=self.CB.V,
+				t_switch=t_switch,
+				t=t[-1],
+				x=x[-1],
+				v=v[-1],
+				I=I[-1],
+				V=V[-1]
+			)
+
+		solver_args = self._solver_args(conf, second_derivative=peaks)
+
+		# Drain the CB
+		phase_1 = ode_solver_coilgun(
+			C=self.CB.C,
+			V0=self.CB.V,
+			x0=self.projectile.x0,
+			x1=self.projectile.x1,
+			v0=self.projectile.v0,
+			t_max=t_max,
+			t_eval=[t_max],
+			peaks=peaks,
+			energy=energy,
+			I_stop_fraction=conf.stop_current_fraction,
+			**solver_args
+		)
+		t1, x1, v1, I1, V1 = (value[-1] for value in phase_1[:5])
+
+		# After CB is drained the current do not go to zero imedietly
+		if self._skip_RL_phase(conf, x1, v1, I1, V1):
+			phase_2 = ([0.0], [x1], [v1], [I1]) + ((0.0, 0.0) if peaks else ()) + ((np.zeros((3, 1)),) if energy else ())
+		else:
+			phase_2 = ode_solver_RL(
+				x0=x1,
+				v0=v1,
+				I0=I1,
+				t_max=t_max,
+				t_eval=[t_max],
+				peaks=peaks,
+				energy=energy,
+				**self._RL_stop_args(conf, I1, V1),
+				**solver_args
+			)
+		t2, x2, v2, I2 = (value[-1] for value in phase_2[:4])
+
+		final_state = ODEFinalState(
+			x0=self.projectile.x0,
+			v0=self.projectile.v0,
+			V0=self.CB.V,
+			t_switch=t1,
+			t=t1 + t2,
+			x=x2,
+			v=v2,
+			I=I2,
+			V=V1
+		)
+
+		if peaks:
+			final_state.I_peak = max(phase_1[6], phase_2[4])
+			final_state.F_peak = max(phase_1[7], phase_2[5])
+
+		if energy:
+			# The ledger of each phase starts from zero
+			final_state.E_C, final_state.E_R, final_state.W = phase_1[-1][:, -1] + phase_2[-1][:, -1]
+			final_state.E_L = solver_args["L"](x2) * I2**2 / 2
+
+		return final_state
+
+	@staticmethod
+	def run_batch(simulations: list['CoilgunSimulationODE'], t_max: float, solver_conf: SolverConf=None) -> BatchSolution:
+		"""
+		Run many simulations together and return the final state of each of them.
+		The batched solver is always an explicit Runge-Kutta method so only the tolerances and the stops of the conf are used
+		"""
+		conf = solver_conf if solver_conf is not None else SolverConf()
+		RL_x1 = [sim._RL_stop_args(conf, I0=1.0, V1=0.0)["x1"] for sim in simulations]
+
+		atol = conf.atol
+		if conf.scaled:
+			scales = [sim.characteristic_scales() for sim in simulations]
+			atol = np.array([scale.atol(conf.atol, ["x", "v", "I", "dIdt", "V"]) for scale in scales]).T
+
+		return ode_solver_coilgun_batch(
+			C=[sim.CB.C for sim in simulations],
+			R=[sim.coil.resistance() for sim in simulations],
+			m=[sim.projectile.m for sim in simulations],
+			V0=[sim.CB.V for sim in simulations],
+			x0=[sim.projectile.x0 for sim in simulations],
+			v0=[sim.projectile.v0 for sim in simulations],
+			inductance_params=[sim.coil.params_for_inductance_model(sim.projectile) for sim in simulations],
+			x1=[sim.projectile.x1 for sim in simulations],
+			t_max=t_max,
+			rtol=conf.rtol,
+			atol=atol,
+			max_step=conf.max_step,
+			I_stop_fraction=conf.stop_current_fraction,
+			RL_x1=[np.nan if x is None else x for x in RL_x1],
+			RL_energy_tolerance=conf.stop_energy_tolerance
+		)
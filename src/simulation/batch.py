@@ -0,0 +1,184 @@
+import numpy as np
+
+from dataclasses import dataclass
+
+from coilgun.coil import Coil
+from coilgun.field_map import field_map
+from coilgun.power_source import PowerSource
+from coilgun.projectile import MagneticProjectile
+from .simulate import SimulationConf, integrator_from_conf
+
+
+"""
+Run the time-stepping coilgun simulation for a whole population of designs at once.
+
+The state of every member is kept in arrays (structure of arrays) and all members are
+advanced in lockstep with the same dt and the same integrator as CoilgunSimulation. Members
+that have reached their max time are masked out. The conf must have a field map resolution,
+the field gradients of all members are then interpolated from their shared field maps in one
+vectorized lookup. The current and
+energy of every power source are sampled at the step times with one waveform call per member
+for a chunk of steps at a time.
+"""
+
+# Number of steps in every chunk of sampled waveforms
+WAVEFORM_CHUNK = 1024
+
+
+@dataclass
+class BatchSimulationData:
+	"""The final state of every member in a batch simulation"""
+
+	time: np.ndarray 		# The time when each member finished
+	frames: np.ndarray 		# The number of frames of each member, including the first
+	pos0: np.ndarray 		# Start position of each projectile
+	vel0: np.ndarray 		# Start velocity of each projectile
+	pos: np.ndarray 		# Final position of each projectile
+	vel: np.ndarray 		# Final velocity of each projectile
+	energy: np.ndarray 		# Total energy consumed by each coil
+
+	def energy_gain(self, projectile_mass: np.ndarray) -> np.ndarray:
+		"""Return the energy gained by every projectile"""
+		return projectile_mass * (self.vel**2 - self.vel0**2) / 2
+
+	def efficiency(self, projectile_mass: np.ndarray) -> np.ndarray:
+		"""Return the energy gain over the energy consumption, 0 for members that consumed no energy"""
+		gain = self.energy_gain(projectile_mass)
+		return np.divide(gain, self.energy, out=np.zeros_like(gain), where=self.energy != 0)
+
+
+class _FieldTables:
+	"""The field maps of all members concatenated into flat arrays for a vectorized lookup"""
+
+	def __init__(self, coils: list[Coil], resolution: int):
+		maps = [field_map(coil, resolution) for coil in coils]
+		sizes = np.array([len(fmap.dB) for fmap in maps])
+
+		self.coils = coils
+		self.offset = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+		self.last = sizes - 2
+		self.z_min = np.array([fmap.z_min for fmap in maps])
+		self.z_max = np.array([fmap.z_max for fmap in maps])
+		self.step = np.array([fmap.step for fmap in maps])
+		self.dB = np.concatenate([fmap.dB for fmap in maps])
+		self.slope = np.concatenate([np.append(np.diff(fmap.dB) / fmap.step, 0) for fmap in maps])
+
+	def gradient(self, members: np.ndarray, I: np.ndarray, z: np.ndarray) -> np.ndarray:
+		"""
+		The field gradient of the members at z, interpolated like FieldMap.B_field_gradiant.
+		Outside of the maps the exact gradient of the coil is used, in the same way as FieldMap
+		"""
+		u = (z - self.z_min[members]) / self.step[members]
+		i = np.clip(u.astype(int), 0, self.last[members])
+		j = self.offset[members] + i
+		dB = I * (self.dB[j] + self.slope[j] * (u - i) * self.step[members])
+
+		# Only the members outside of their maps call their coils
+		for k in np.flatnonzero((z < self.z_min[members]) | (z >= self.z_max[members])):
+			dB[k] = self.coils[members[k]].B_field_gradiant(I=float(I[k]), z=float(z[k]))
+		return dB
+
+
+class BatchCoilgunSimulation:
+	"""A population of coilgun simulations advanced together"""
+
+	def __init__(
+		self,
+		coils: list[Coil],
+		power_sources: list[PowerSource],
+		projectiles: list[MagneticProjectile],
+		conf: SimulationConf, 			# dt and field map resolution of all members, and the max time if max_times is not given
+		max_times: np.ndarray=None 		# Max time of every member
+	):
+		if not all(isinstance(projectile, MagneticProjectile) for projectile in projectiles):
+			raise NotImplementedError("The batch simulation only supports magnetic projectiles")
+
+		self.coils = coils
+		self.power_sources = power_sources
+
+		self.integrator = integrator_from_conf(conf)
+		if self.integrator.adaptive:
+			raise NotImplementedError("The members of a batch simulation share the time step, use a fixed step integrator")
+		if conf.field_map_resolution is None:
+			raise NotImplementedError("The batch simulation looks up the field gradients in field maps, set a field map resolution")
+
+		self.dt = conf.dt
+		self.max_times = np.full(len(coils), conf.max_time, dtype=float) if max_times is None else np.asarray(max_times, dtype=float)
+
+		# Structure of arrays for the members
+		self.mass = np.array([projectile.mass for projectile in projectiles], dtype=float)
+		self.m = np.array([projectile.m for projectile in projectiles], dtype=float)
+		self.pos0 = np.array([projectile.pos for projectile in projectiles], dtype=float)
+		self.vel0 = np.array([projectile.vel for projectile in projectiles], dtype=float)
+
+		self.fields = _FieldTables(coils, conf.field_map_resolution)
+
+	def _currents(self, members: np.ndarray, t: float) -> np.ndarray:
+		"""The current from the power source of every member at time t"""
+		return np.array([self.power_sources[k].current(coil=self.coils[k], t=t) for k in members], dtype=float)
+
+	def _sample_waveforms(self, members: np.ndarray, t: float, steps: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+		"""
+		Return the step times from t, accumulated in the same way as in run, and the current at
+		every time and the energy of every step for the members with shapes (members, steps + 1) and (members, steps)
+		"""
+		times = [t]
+		for _ in range(steps):
+			times.append(times[-1] + self.dt)
+		times = np.array(times)
+
+		waveforms = [self.power_sources[k].waveform(self.coils[k], times) for k in members]
+		return times, np.array([waveform.I for waveform in waveforms]), np.array([waveform.energy for waveform in waveforms])
+
+	def _gradients(self, members: np.ndarray, I: np.ndarray, z: np.ndarray) -> np.ndarray:
+		"""The field gradient of every member at its projectile"""
+		return self.fields.gradient(members, I, z)
+
+	def run(self) -> BatchSimulationData:
+		"""Run all the simulations to their max time"""
+		n = len(self.coils)
+		pos = self.pos0.copy()
+		vel = self.vel0.copy()
+		energy = np.zeros(n)
+		time = np.zeros(n)
+		frames = np.ones(n, dtype=int)
+
+		t = 0.0
+		active = np.flatnonzero(t < self.max_times)
+		a = None
+		step = WAVEFORM_CHUNK
+		while active.size > 0:
+			# Sample the power sources for the next chunk of steps
+			if step == WAVEFORM_CHUNK:
+				times, I, E = self._sample_waveforms(active, t, WAVEFORM_CHUNK)
+				sampled = active
+				step = 0
+			rows = np.searchsorted(sampled, active)
+
+			# The force of MagneticProjectile on the active members
+			def acceleration(t_i: float, x: np.ndarray) -> np.ndarray:
+				if t_i == times[step]:
+					I_i = I[rows, step]
+				elif t_i == times[step + 1]:
+					I_i = I[rows, step + 1]
+				else:
+					I_i = self._currents(active, t_i)
+				return self.m[active] * self._gradients(active, I_i, x) / self.mass[active]
+
+			_, pos[active], vel[active], a, _ = self.integrator.step(acceleration, t, pos[active], vel[active], a, self.dt)
+			energy[active] += E[rows, step]
+
+			t += self.dt
+			step += 1
+			time[active] = t
+			frames[active] += 1
+
+			# Mask out the members that are done
+			still_active = t < self.max_times[active]
+			active = active[still_active]
+			if a is not None:
+				a = a[still_active]
+
+		return BatchSimulationData(
+			time=time, frames=frames, pos0=self.pos0.copy(), vel0=self.vel0.copy(), pos=pos, vel=vel, energy=energy
+		)
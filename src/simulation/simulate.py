@@ -1,9 +1,15 @@
 import numpy as np
 
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterator
+
 from coilgun.coil import Coil
+from coilgun.field_map import mapped_coil
 from coilgun.power_source import PowerSource
 from coilgun.projectile import Projectile1D
+from ode_models.integrator import dopri5_step, error_norm, step_factor
 
 
 @dataclass
@@ -12,16 +18,132 @@ class SimulationConf:
 
 	dt: float 				# The time between updates
 	max_time: float 		# The maximum time the simulation will run for
+	field_map_resolution: int = None 	# Interpolate the field gradient from a shared field map with this many steps over the coil. None uses the exact field
+	integrator: str = "Euler" 	# Name of an IntegratorEnum. dt is the first step of the adaptive integrator
+	rtol: float = 1e-6 		# Relative tolerance of the adaptive integrator
+	atol: float = 1e-9 		# Absolute tolerance of the adaptive integrator
+	recording: str = "Full" 	# Name of a RecordingEnum, what run keeps of the frames
+	record_every: int = 1 	# Keep every n:th frame with the Decimate recording
+
+
+class IntegratorEnum(Enum):
+	Euler = "Euler"
+	SymplecticEuler = "SymplecticEuler"
+	Verlet = "Verlet"
+	AdaptiveRK = "AdaptiveRK"
+
+
+class Integrator(ABC):
+	"""
+	Advances the projectile one step. The acceleration a(t, x) only depends on the position,
+	so every integrator gets the acceleration at the start of the step if it is known and
+	returns the acceleration at the end of the step if it has calculated it
+	"""
+
+	# The integrator chooses its own steps
+	adaptive = False
+
+	@abstractmethod
+	def step(
+		self,
+		acceleration: Callable, 	# a(t, x)
+		t: float, 					# Time at the start of the step
+		x: float, 					# Position at the start of the step
+		v: float, 					# Velocity at the start of the step
+		a: float, 					# Acceleration at the start of the step or None
+		dt: float 					# Step size (the suggested step size for adaptive integrators)
+	) -> tuple:
+		"""Return the step taken, x, v and a at the end of the step, and the next step size"""
+
+
+class EulerIntegrator(Integrator):
+	"""Explicit Euler, the same update as Projectile1D.update"""
+
+	def step(self, acceleration, t, x, v, a, dt):
+		if a is None:
+			a = acceleration(t, x)
+		return dt, x + v * dt, v + a * dt, None, dt
+
+
+class SymplecticEulerIntegrator(Integrator):
+	"""Semi-implicit Euler. The velocity is updated first and moves the position"""
+
+	def step(self, acceleration, t, x, v, a, dt):
+		if a is None:
+			a = acceleration(t, x)
+		v = v + a * dt
+		return dt, x + v * dt, v, None, dt
+
+
+class VerletIntegrator(Integrator):
+	"""Velocity Verlet. Second order with one force evaluation per step"""
+
+	def step(self, acceleration, t, x, v, a, dt):
+		if a is None:
+			a = acceleration(t, x)
+		x = x + v * dt + a * dt**2 / 2
+		a_new = acceleration(t + dt, x)
+		return dt, x, v + (a + a_new) * dt / 2, a_new, dt
+
+
+class AdaptiveRKIntegrator(Integrator):
+	"""Dormand-Prince 5(4) with the step size control of RK45 in scipy"""
+
+	adaptive = True
+
+	def __init__(self, rtol: float=1e-6, atol: float=1e-9):
+		self.rtol = rtol
+		self.atol = atol
+
+	def step(self, acceleration, t, x, v, a, dt):
+		if a is None:
+			a = acceleration(t, x)
+
+		# y = (x, v) with y' = (v, a(t, x))
+		def fun(t, y):
+			return np.array([y[1], acceleration(t, y[0])])
+
+		y = np.array([x, v])
+		f = np.array([v, a])
+		rejected = False
+		while True:
+			y_new, K = dopri5_step(fun, t, y, f, dt)
+			error = error_norm(K, dt, y, y_new, self.rtol, self.atol)
+			factor = float(step_factor(error, rejected))
+			if error < 1:
+				return dt, y_new[0], y_new[1], K[6][1], dt * factor
+			dt *= factor
+			rejected = True
+
+
+def integrator_from_conf(conf: SimulationConf) -> Integrator:
+	"""Create the integrator of a simulation conf"""
+	integrator_enum = IntegratorEnum[conf.integrator]
+
+	if integrator_enum == IntegratorEnum.Euler:
+		return EulerIntegrator()
+	elif integrator_enum == IntegratorEnum.SymplecticEuler:
+		return SymplecticEulerIntegrator()
+	elif integrator_enum == IntegratorEnum.Verlet:
+		return VerletIntegrator()
+	elif integrator_enum == IntegratorEnum.AdaptiveRK:
+		return AdaptiveRKIntegrator(rtol=conf.rtol, atol=conf.atol)
 
 
 @dataclass
 class SimulationData:
 	"""A class that holds all the data from a simulation"""
 
-	time: list[float]		# The time for every frame
-	pos: list[float]		# The position of the projectile at every time
-	vel: list[float]		# The velocity of the projectile at every time
-	energy: list[float]		# The energy consumed by the coil at the time t during the time dt
+	time: np.ndarray		# The time for every frame
+	pos: np.ndarray			# The position of the projectile at every time
+	vel: np.ndarray			# The velocity of the projectile at every time
+	energy: np.ndarray		# The energy consumed by the coil at the time t during the time dt
+
+	def __post_init__(self):
+		self.time = np.asarray(self.time, dtype=float)
+		self.pos = np.asarray(self.pos, dtype=float)
+		self.vel = np.asarray(self.vel, dtype=float)
+		self.energy = np.asarray(self.energy, dtype=float)
 
 	def frames(self):
 		"""Return the number of frames in the simulation"""
@@ -29,11 +151,11 @@ class SimulationData:
 
 	def position_limits(self):
 		"""Return the minimum and maximum position of the projectile"""
-		return min(self.pos), max(self.pos)
+		return np.min(self.pos), np.max(self.pos)
 
 	def energy_consumption(self) -> float:
 		"""Return the total energy consumed"""
-		return sum(self.energy)
+		return np.sum(self.energy)
 
 	def energy_gain(self, projectile_mass: float) -> float:
 		"""Return the energy gained by the projectile"""
@@ -46,6 +168,151 @@ class SimulationData:
 		return self.time[-1] - self.time[0]
 
 
+@dataclass
+class SimulationSummary:
+	"""Running sums and extremes of a simulation. Has the same methods as SimulationData"""
+
+	time0: float = np.nan 	# The time of the first frame
+	time1: float = np.nan 	# The time of the last frame
+	vel0: float = np.nan 	# The velocity of the projectile in the first frame
+	vel1: float = np.nan 	# The velocity of the projectile in the last frame
+	pos_min: float = np.inf 	# The smallest position of the projectile
+	pos_max: float = -np.inf 	# The largest position of the projectile
+	energy: float = 0.0 	# The total energy consumed by the coil
+	frame_count: int = 0 	# The number of frames
+
+	def frames(self):
+		"""Return the number of frames in the simulation"""
+		return self.frame_count
+
+	def position_limits(self):
+		"""Return the minimum and maximum position of the projectile"""
+		return self.pos_min, self.pos_max
+
+	def energy_consumption(self) -> float:
+		"""Return the total energy consumed"""
+		return self.energy
+
+	def energy_gain(self, projectile_mass: float) -> float:
+		"""Return the energy gained by the projectile"""
+		return projectile_mass*self.vel1**2/2 - projectile_mass*self.vel0**2/2
+
+	def total_time(self):
+		"""Return the total time the simulation was running"""
+		return self.time1 - self.time0
+
+
+class RecordingEnum(Enum):
+	Full = "Full"
+	Summary = "Summary"
+	Decimate = "Decimate"
+
+
+class Recording(ABC):
+	"""What a simulation keeps of the frames. The frames are given to the recording in chunks"""
+
+	# Number of frames in every chunk. None puts all the frames in one chunk
+	chunk_frames = 4096
+
+	@abstractmethod
+	def record(self, chunk: SimulationData):
+		"""Record the next chunk of frames"""
+
+	@abstractmethod
+	def result(self) -> SimulationData | SimulationSummary:
+		"""Return what has been recorded"""
+
+
+class FullRecording(Recording):
+	"""Keep every frame"""
+
+	chunk_frames = None
+
+	def __init__(self):
+		self.chunks = []
+
+	def record(self, chunk: SimulationData):
+		self.chunks.append(chunk)
+
+	def result(self) -> SimulationData:
+		if len(self.chunks) == 1:
+			return self.chunks[0]
+		return SimulationData(*(
+			np.concatenate([getattr(chunk, name) for chunk in self.chunks]) for name in ["time", "pos", "vel", "energy"]
+		))
+
+
+class SummaryRecording(Recording):
+	"""Only keep running sums and extremes, the memory does not depend on the number of frames"""
+
+	def __init__(self):
+		self.summary = SimulationSummary()
+
+	def record(self, chunk: SimulationData):
+		summary = self.summary
+		if summary.frame_count == 0:
+			summary.time0, summary.vel0 = chunk.time[0], chunk.vel[0]
+		summary.time1, summary.vel1 = chunk.time[-1], chunk.vel[-1]
+		summary.pos_min = min(summary.pos_min, np.min(chunk.pos))
+		summary.pos_max = max(summary.pos_max, np.max(chunk.pos))
+		summary.energy += np.sum(chunk.energy)
+		summary.frame_count += chunk.frames()
+
+	def result(self) -> SimulationSummary:
+		return self.summary
+
+
+class DecimatedRecording(Recording):
+	"""
+	Keep every n:th frame and the last frame. The energy of a kept frame is the energy
+	consumed since the previous kept frame, so the total energy is the same as with every frame
+	"""
+
+	def __init__(self, every: int):
+		self.every = every
+		self.kept = []
+		self.frame_count = 0
+		self.energy = 0.0 		# Energy consumed since the last kept frame
+		self.last = None 		# The last frame if it was not kept
+
+	def record(self, chunk: SimulationData):
+		index = self.frame_count + np.arange(chunk.frames())
+		keep = index % self.every == 0
+
+		# Energy since the last kept frame up to and including every frame
+		cumulative = self.energy + np.cumsum(chunk.energy)
+		kept_cumulative = cumulative[keep]
+		energy = np.diff(kept_cumulative, prepend=0.0)
+		if kept_cumulative.size > 0:
+			self.energy = cumulative[-1] - kept_cumulative[-1]
+		else:
+			self.energy = cumulative[-1]
+
+		self.kept.append(SimulationData(chunk.time[keep], chunk.pos[keep], chunk.vel[keep], energy))
+		self.last = None if keep[-1] else (chunk.time[-1], chunk.pos[-1], chunk.vel[-1])
+		self.frame_count += chunk.frames()
+
+	def result(self) -> SimulationData:
+		if self.last is not None:
+			self.kept.append(SimulationData([self.last[0]], [self.last[1]], [self.last[2]], [self.energy]))
+			self.last, self.energy = None, 0.0
+		recording = FullRecording()
+		recording.chunks = self.kept
+		return recording.result()
+
+
+def recording_from_conf(conf: SimulationConf) -> Recording:
+	"""Create the recording of a simulation conf"""
+	recording_enum = RecordingEnum[conf.recording]
+
+	if recording_enum == RecordingEnum.Full:
+		return FullRecording()
+	elif recording_enum == RecordingEnum.Summary:
+		return SummaryRecording()
+	elif recording_enum == RecordingEnum.Decimate:
+		return DecimatedRecording(every=conf.record_every)
+
+
 class CoilgunSimulation:
 	"""A class that performances a simulation of a coilgun"""
 
@@ -67,41 +334,87 @@ class CoilgunSimulation:
 		# Calculate the coil resistance (it will not change so dont calculate it more than once)
 		self.R = self.coil.resistance()
 
-	def run(self):
-		"""Run the simulation"""
+		# The coil used for the force. The field map is shared with every simulation of a coil with the same geometry
+		self.field_coil = coil if conf.field_map_resolution is None else mapped_coil(coil, conf.field_map_resolution)
+
+		self.integrator = integrator_from_conf(conf)
+		self.conf = conf
+		# Number of times the force has been calculated
+		self.force_evaluations = 0
+
+	def acceleration(self, t: float, pos: float) -> float:
+		"""The acceleration of the projectile at a position"""
+		self.force_evaluations += 1
+		F = self.projectile.calc_force_from_coil(
+			coil=self.field_coil, 
+			power_source=self.power_source,
+			t=t,
+			pos=pos
+		)
+		return F / self.projectile.mass
+
+	def run(self, recording: Recording=None) -> SimulationData | SimulationSummary:
+		"""Run the simulation. The recording decides what is kept of the frames, if not given the conf decides"""
+		recording = recording_from_conf(self.conf) if recording is None else recording
+		for chunk in self.stream(recording.chunk_frames):
+			recording.record(chunk)
+		return recording.result()
+
+	def stream(self, chunk_frames: int=None) -> Iterator[SimulationData]:
+		"""
+		Run the simulation and yield the frames in chunks, starting with the initial state.
+		Only one chunk is kept in memory. If chunk_frames is None all frames are put in one chunk
+		"""
+		# Buffers for a chunk. The time is accumulated step by step so rounding can add a frame
+		capacity = int(np.ceil(max(self.max_time - self.t, 0) / self.dt)) + 2
+		growing = chunk_frames is None
+		if not growing:
+			capacity = min(capacity, chunk_frames)
+		time = np.empty(capacity)
+		pos = np.empty(capacity)
+		vel = np.empty(capacity)
+		# The start and size of the step to every frame, for the energy
+		t_start = np.empty(capacity)
+		step = np.empty(capacity)
+
+		def chunk(frames: int) -> SimulationData:
+			# The energy does not depend on the projectile, calculate it for every step in one call
+			energy = self.power_source.energy_consumption(coil=self.coil, t=t_start[:frames], dt=step[:frames])
+			return SimulationData(time[:frames].copy(), pos[:frames].copy(), vel[:frames].copy(), energy)
 
 		# Initial conditions
-		time = [self.t]
-		pos = [self.projectile.pos]
-		vel = [self.projectile.vel]
-		energy = [0]
+		time[0] = self.t
+		pos[0] = self.projectile.pos
+		vel[0] = self.projectile.vel
+		t_start[0], step[0] = self.t, 0.0
+		frame = 1
 
+		x, v, a = self.projectile.pos, self.projectile.vel, None
+		dt = self.dt
 		while self.t < self.max_time:
-			# Calculate the force on the projectile
-			# and update its motion
-			F = self.projectile.calc_force_from_coil(
-				coil=self.coil, 
-				power_source=self.power_source,
-				t=self.t
-			)
-			self.projectile.add_force(F)
-			self.projectile.update(self.dt)
-
-			# Calculate energy consumption
-			E = self.power_source.energy_consumption(
-				coil=self.coil,
-				t=self.t,
-				dt=self.dt
-			)
-
-			self.t += self.dt
+			# Do not step past the max time with adaptive steps
+			if self.integrator.adaptive:
+				dt = min(dt, self.max_time - self.t)
 
-			# Save the information
-			time.append(self.t)
-			pos.append(self.projectile.pos)
-			vel.append(self.projectile.vel)
-			energy.append(E)
+			# Update the motion of the projectile
+			h, x, v, a, dt = self.integrator.step(self.acceleration, self.t, x, v, a, dt)
+			self.projectile.pos, self.projectile.vel = x, v
 
-		return SimulationData(time, pos, vel, energy)
+			t_previous = self.t
+			self.t += h
 
+			# Save the information
+			if frame == capacity:
+				if growing:
+					capacity *= 2
+					time, pos, vel, t_start, step = (np.resize(buffer, capacity) for buffer in (time, pos, vel, t_start, step))
+				else:
+					yield chunk(frame)
+					frame = 0
+			time[frame] = self.t
+			pos[frame] = x
+			vel[frame] = v
+			t_start[frame], step[frame] = t_previous, h
+			frame += 1
 
+		yield chunk(frame)
@@ -0,0 +1,46 @@
+import cmath
+import numpy as np
+
+from typing import Callable
+
+
+"""
+Closed-form solutions of the circuits of a coilgun.
+They are used both by the power sources of the time-stepping simulation and by the ODE solvers.
+"""
+
+
+def rlc_solution(R: float, L: float, C: float, I0: float, V0: float) -> tuple[Callable, float]:
+	"""
+	Return the exact solution of a series RLC circuit with constant inductance,
+	L dI/dt = V - RI and dV/dt = -I/C, as a function of the time that returns I and V.
+	The angular frequency of the oscillation (0 if the circuit is overdamped) is also returned
+	"""
+	M = np.array([[-R/L, 1/L], [-1/C, 0.0]])
+	y0 = np.array([I0, V0])
+
+	alpha = R / (2*L)
+	root = cmath.sqrt(alpha**2 - 1/(L*C))
+	l1, l2 = -alpha + root, -alpha - root
+	omega = abs(root.imag)
+
+	if abs(l1 - l2) > 1e-6 * abs(l1):
+		# y(t) = u1 e^(l1 t) + u2 e^(l2 t)
+		u1 = (M - l2*np.eye(2)) @ y0 / (l1 - l2)
+		u2 = -(M - l1*np.eye(2)) @ y0 / (l1 - l2)
+
+		def solution(t):
+			t = np.asarray(t, dtype=float)
+			y = np.multiply.outer(u1, np.exp(l1*t)) + np.multiply.outer(u2, np.exp(l2*t))
+			return y.real[0], y.real[1]
+	else:
+		# Critically damped, y(t) = e^(lt)(y0 + t(M - l)y0)
+		l = -alpha
+		u = (M - l*np.eye(2)) @ y0
+
+		def solution(t):
+			t = np.asarray(t, dtype=float)
+			y = np.exp(l*t) * (np.multiply.outer(y0, np.ones_like(t)) + np.multiply.outer(u, t))
+			return y[0], y[1]
+
+	return solution, omega
@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
 
 from coilgun.coil import Coil, Solenoid, GeometryCoil
+from coilgun.off_axis import OffAxisField
 
 
 def draw_coil(coil: Coil, ax: Axes) -> None:
@@ -43,4 +44,20 @@ def draw_wire(radius: float, wire_radius: float, z: float, ax: Axes) -> None:
 		[z + np.sqrt(1/2) * wire_radius, z - np.sqrt(1/2) * wire_radius], 
 		[radius + np.sqrt(1/2) * wire_radius, radius - np.sqrt(1/2) * wire_radius], 
 		color='black'
-	)
\ No newline at end of file
+	)
+
+
+def draw_field(field: OffAxisField, ax: Axes) -> None:
+	"""Draw |B| and the field lines of an off-axis field on both sides of the axis"""
+	# Mirror the grid in the axis, Br is odd and Bz is even in r
+	r = np.concatenate((-field.r[:0:-1], field.r))
+	Br = np.concatenate((-field.Br[:0:-1], field.Br))
+	Bz = np.concatenate((field.Bz[:0:-1], field.Bz))
+
+	# The field is infinite on the wires
+	Br = np.where(np.isfinite(Br), Br, np.nan)
+	Bz = np.where(np.isfinite(Bz), Bz, np.nan)
+
+	mesh = ax.pcolormesh(field.z, r, np.hypot(Br, Bz), shading='auto', norm='log')
+	ax.streamplot(field.z, r, Bz, Br, color='white', linewidth=0.5, density=1.5)
+	plt.colorbar(mesh, ax=ax, label="|B| at 1 A [T]")
@@ -1,20 +1,23 @@
+import math
+
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
-from simulation.simulate import CoilgunSimulation
+from simulation.simulate import CoilgunSimulation, DecimatedRecording
 from visualise.coil import draw_coil
 
 from GA.DNA import DNA
 
 from ode_models.coilgun import ode_solver_coilgun, calculate_efficiency
-from ode_models.simulation import CoilgunSimulationODE
+from ode_models.simulation import CoilgunSimulationODE, SolverConf
 
 
-def draw_simulation(sim: CoilgunSimulation) -> FuncAnimation:
-	"""Visualise the simulation"""
+def draw_simulation(sim: CoilgunSimulation, max_frames: int=2000) -> FuncAnimation:
+	"""Visualise the simulation with at most about max_frames frames"""
 
-	# Run the simulation
-	sim_data = sim.run()
+	# Run the simulation and only keep the frames that are animated
+	steps = math.ceil(sim.max_time / sim.dt)
+	sim_data = sim.run(DecimatedRecording(every=max(1, math.ceil(steps / max_frames))))
 
 	# Create figure
 	fig, ax = plt.subplots()
@@ -52,11 +55,12 @@ def draw_simulation(sim: CoilgunSimulation) -> FuncAnimation:
 
 	return animation
 
-def plot_ode_solution(dna: DNA, t_max: float, t_steps: int):
+def plot_ode_solution(dna: DNA, t_max: float, t_steps: int, solver_conf: SolverConf=None):
 	sim = CoilgunSimulationODE.from_DNA(dna)
-	t, x, v, I, V = sim.run(t_max, t_steps)
+	t, x, v, I, V = sim.run(t_max, t_steps, solver_conf)
 
-	dLdx = sim.coil.inductance_model_derivitive(sim.projectile)
+	# The same inductance model as the solver used
+	dLdx = sim.inductance(solver_conf).derivative
 
 	F = I**2 * dLdx(x) / 2
 
@@ -0,0 +1,39 @@
+import numpy as np
+
+from GA.calibration import sample_DNA, candidate_confs, duel_agreement, calibrate, recommend, CalibrationResult
+from GA.DNA import DNA, MutationRules
+from ode_models.simulation import SolverConf
+from utils.path import defaults_path
+
+
+def test_duel_agreement():
+	reference = np.array([0.1, 0.2, 0.3, 0.3001])
+	assert duel_agreement(reference, reference) == 1.0
+
+	# Swapping the two best flips one of the six duels
+	scores = np.array([0.1, 0.2, 0.3001, 0.3])
+	assert duel_agreement(scores, reference) == 5/6
+	# Unless the difference is a tie
+	assert duel_agreement(scores, reference, tie_tolerance=1e-3) == 1.0
+
+def test_recommend():
+	def result(time, agreement):
+		return CalibrationResult(SolverConf(), time, 0.0, 0.0, 1.0, agreement)
+
+	results = [result(1.0, 1.0), result(0.5, 0.9), result(2.0, 1.0)]
+	assert recommend(results) is results[0]
+	assert recommend(results, min_agreement=0.9) is results[1]
+	assert recommend([result(0.5, 0.9)]) is None
+
+def test_calibrate():
+	dna = DNA.read_DNA(defaults_path() / 'dna_ode_template.yaml')
+	rules = MutationRules.read_rules(defaults_path() / 'rules_ode_template.yaml')
+	dnas = sample_DNA(dna, rules, 3)
+
+	confs = candidate_confs(SolverConf(), ["RK45"], [1e-3, 1e-6], [1e-6], [np.inf])
+	assert [conf.rtol for conf in confs] == [1e-3, 1e-6]
+
+	results = calibrate(dnas, 100e-3, SolverConf(rtol=1e-8, atol=1e-10), confs)
+	assert len(results) == 2
+	assert results[1].max_error < 1e-3
+	assert results[1].rank_correlation > 0.9
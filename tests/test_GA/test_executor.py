@@ -0,0 +1,34 @@
+import pytest
+
+from GA.executor import SerialExecutor, ThreadExecutor, ProcessExecutor, executor_from_name
+
+
+def square(x):
+	return x**2
+
+@pytest.mark.parametrize("executor", [SerialExecutor(), ThreadExecutor(workers=4), ProcessExecutor(workers=2)])
+def test_executor_order(executor):
+	"""The results should come back in the same order as the input"""
+	with executor:
+		assert executor.map(square, range(100)) == [x**2 for x in range(100)]
+		# The pool is reused for the next generation
+		assert executor.map(square, range(10)) == [x**2 for x in range(10)]
+
+def test_executor_from_name():
+	"""Create executors from the names used in the conf"""
+	assert isinstance(executor_from_name("serial"), SerialExecutor)
+	assert isinstance(executor_from_name("thread", workers=2), ThreadExecutor)
+	assert executor_from_name("process", workers=3).workers == 3
+
+	with pytest.raises(KeyError):
+		executor_from_name("gpu")
+
+def test_evolution_with_threads(test_evolution):
+	"""The evolution should give the same scores with a thread pool"""
+	serial_score = [score for _, score in test_evolution.evaluate_gen()]
+
+	with ThreadExecutor(workers=4) as executor:
+		test_evolution.executor = executor
+		thread_score = [score for _, score in test_evolution.evaluate_gen()]
+
+	assert serial_score == thread_score
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from GA.DNA import DNA
+from GA.executor import SerialExecutor
+from GA.fitness import FitnessFunction, CachedFitness, CoilFitness, ODECoilFitness, SimilarityCachedFitness, canonical_DNA_key
+from ode_models.simulation import SolverConf
+from simulation.simulate import SimulationConf
+from utils.path import defaults_path
+
+
+class CountingFitness(FitnessFunction):
+	"""Fitness function that counts how many times it is called"""
+
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, dna: DNA) -> float:
+		self.calls += 1
+		return dna["a"] + dna["b"]
+
+
+def test_canonical_key():
+	"""The key should only depend on the content of the DNA"""
+	assert canonical_DNA_key(DNA({"a": 1.0, "b": 2.0})) == canonical_DNA_key(DNA({"b": 2.0, "a": 1.0}))
+	assert canonical_DNA_key(DNA({"a": 1.0})) != canonical_DNA_key(DNA({"a": 1.0 + 1e-12}))
+	assert canonical_DNA_key(DNA({"a": 1.0}), float_digits=6) == canonical_DNA_key(DNA({"a": 1.0 + 1e-12}), float_digits=6)
+
+def test_cached_fitness():
+	"""Only new DNA should be evaluated"""
+	fitness = CountingFitness()
+	cached = CachedFitness(fitness, max_size=2)
+
+	assert cached(DNA({"a": 1.0, "b": 2.0})) == 3.0
+	assert cached(DNA({"a": 1.0, "b": 2.0})) == 3.0
+	assert fitness.calls == 1
+	assert cached.hits == 1 and cached.misses == 1
+
+	# The least recently used score is thrown away
+	cached(DNA({"a": 2.0, "b": 2.0}))
+	cached(DNA({"a": 3.0, "b": 2.0}))
+	cached(DNA({"a": 1.0, "b": 2.0}))
+	assert fitness.calls == 4
+
+def test_cached_generation():
+	"""A generation should be scored in order with duplicates evaluated once"""
+	fitness = CountingFitness()
+	cached = CachedFitness(fitness)
+
+	generation = [DNA({"a": float(i % 3), "b": 1.0}) for i in range(9)]
+	scores = cached.evaluate_generation(generation, SerialExecutor())
+
+	assert scores == [i % 3 + 1.0 for i in range(9)]
+	assert fitness.calls == 3
+	assert cached.statistics()["cache hits"] == 6
+
+def test_similarity_cache():
+	"""A design scaled so that its dimensionless groups are unchanged should hit the cache"""
+	dna = DNA.read_DNA(defaults_path() / 'dna_ode_template.yaml')
+	k = 1.7
+	scaled = DNA(dict(dna.DNA))
+	scaled.DNA.update(
+		solenoid_length=dna["solenoid_length"] * k,
+		solenoid_radius=dna["solenoid_radius"] * k**0.5,
+		wire_cross_sectional_area=dna["wire_cross_sectional_area"] * k**0.5,
+		projectile_mass=dna["projectile_mass"] / k**2,
+		projectile_start_pos=dna["projectile_start_pos"] * k
+	)
+	other = DNA(dict(dna.DNA))
+	other.DNA.update(capacitance_voltage=2 * dna["capacitance_voltage"])
+
+	fitness = SimilarityCachedFitness(ODECoilFitness(100e-3, solver_conf=SolverConf(rtol=1e-8, atol=1e-10)), validation_rate=1.0)
+	scores = fitness.evaluate_generation([dna, scaled, other], SerialExecutor())
+
+	assert scores[0] == scores[1]
+	assert scores[2] != scores[0]
+	stats = fitness.statistics()
+	assert stats["similarity hits"] == 1
+	assert stats["similarity validations"] == 1
+	assert stats["similarity max error"] < 1e-6
+	assert fitness.validate(other) == 0.0
+
+def test_similarity_bin_edge():
+	"""Groups on both sides of a bin edge should hit when they are within the tolerance, and only then"""
+	fitness = SimilarityCachedFitness(ODECoilFitness(100e-3), tolerance=1e-2)
+	edge = np.exp(2 * 11 * np.log1p(1e-2))
+
+	fitness._store((edge * (1 - 1e-4), None, 0.0, -2.0), 1.0)
+	assert fitness._lookup((edge * (1 + 1e-4), None, 0.0, -2.0)) == 1.0
+	assert fitness._lookup((edge * (1 + 1e-4), None, 0.0, 2.0)) is None
+	assert fitness._lookup((edge * (1 + 1e-4), 1.0, 0.0, -2.0)) is None
+
+	# Neighbouring bins that are further apart than the tolerance
+	assert fitness._lookup((edge * (1 - 1e-4) * 1.0101, None, 0.0, -2.0)) is None
+	assert fitness._lookup((edge * (1 - 1e-4) * 1.0099, None, 0.0, -2.0)) == 1.0
+
+def test_coil_fitness_batch():
+	"""The batch path should give the same scores as one DNA at a time"""
+	base = DNA.read_DNA(defaults_path() / 'dna_template.yaml')
+	generation = []
+	for current, mass in [(1, 0.01), (2, 0.02), (0.5, 0.005)]:
+		dna = DNA(dict(base.DNA))
+		dna.DNA["current"] = current
+		dna.DNA["projectile_mass"] = mass
+		generation.append(dna)
+
+	conf = SimulationConf(dt=1e-3, max_time=0.2, field_map_resolution=200)
+	scores = CoilFitness(conf, batch=True).evaluate_generation(generation, SerialExecutor())
+
+	assert scores == pytest.approx([CoilFitness(conf)(dna) for dna in generation], rel=1e-9)
+
+def test_coil_fitness_batch_outside_map():
+	"""Projectiles that start outside of the field maps should get the same scores in the batch and serial paths"""
+	base = DNA.read_DNA(defaults_path() / 'dna_template.yaml')
+	generation = []
+	for position, velocity in [(-0.8, 5.0), (-1.5, 10.0), (-0.1, 0.0)]:
+		dna = DNA(dict(base.DNA))
+		dna.DNA["projectile_position"] = position
+		dna.DNA["projectile_velocity"] = velocity
+		generation.append(dna)
+
+	conf = SimulationConf(dt=1e-3, max_time=0.3, field_map_resolution=50)
+	scores = CoilFitness(conf, batch=True).evaluate_generation(generation, SerialExecutor())
+
+	assert scores == pytest.approx([CoilFitness(conf)(dna) for dna in generation], rel=1e-9)
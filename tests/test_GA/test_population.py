@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from GA.DNA import DNA, MutationError, MutationRule, MutationRules
+from GA.evolution import CrossBreeding, Evolution
+from GA.population import Population
+from GA.selection import versus, versus_indices
+from ode_models.simulation import CoilgunSimulationODE
+from utils.path import defaults_path
+
+
+@pytest.fixture
+def population_rules():
+	return MutationRules({
+		"a": MutationRule(0.0, 1.0, 0.5),
+		"b": MutationRule(10.0, 20.0, 0.0)
+	})
+
+@pytest.fixture
+def population(population_rules):
+	generation = [DNA({"type": "test", "a": float(i), "b": 10.0 + i}) for i in range(10)]
+	return Population.from_DNA(generation, population_rules, rng=np.random.default_rng(0))
+
+
+def test_views(population, tmp_path):
+	"""The DNA views read and write the genome matrix"""
+	dna = population[3]
+
+	assert dna["a"] == 3.0 and dna["type"] == "test"
+	assert dict(dna.DNA) == {"type": "test", "a": 3.0, "b": 13.0}
+
+	dna.DNA["a"] = 0.5
+	assert population.genomes[3, 0] == 0.5
+
+	# Genes without rules are shared by the population
+	with pytest.raises(KeyError):
+		dna.DNA["type"] = "other"
+
+	# Saved views can be read as normal DNA
+	dna.save_DNA(tmp_path / "dna.yaml")
+	assert DNA.read_DNA(tmp_path / "dna.yaml").DNA == dict(dna.DNA)
+
+def test_bad_population(population_rules):
+	"""The DNA must have all genes with rules and agree on the rest"""
+	with pytest.raises(MutationError):
+		Population.from_DNA([DNA({"a": 1.0})], population_rules)
+
+	with pytest.raises(ValueError):
+		Population.from_DNA([DNA({"type": "x", "a": 1.0, "b": 1.0}), DNA({"type": "y", "a": 1.0, "b": 1.0})], population_rules)
+
+def test_random_population(population_rules):
+	"""Random genes are inside the rules"""
+	population = Population.random(DNA({"type": "test", "a": None, "b": None}), population_rules, 1000)
+
+	assert population.genomes.shape == (1000, 2)
+	assert np.all((population.genomes[:, 0] >= 0) & (population.genomes[:, 0] <= 1))
+	assert np.all((population.genomes[:, 1] >= 10) & (population.genomes[:, 1] <= 20))
+
+def test_crossover_and_mutation(population):
+	"""Children only have genes of their parents, and only genes with a rate > 0 mutate"""
+	children = population.crossover(np.full(1000, 1), np.full(1000, 2))
+
+	assert set(children.genomes[:, 0]) == {1.0, 2.0}
+	assert set(children.genomes[:, 1]) == {11.0, 12.0}
+
+	children.mutate()
+	mutated = ~np.isin(children.genomes[:, 0], [1.0, 2.0])
+	assert 0.4 < np.mean(mutated) < 0.6
+	assert set(children.genomes[:, 1]) == {11.0, 12.0}
+
+def test_population_evolution():
+	"""The population evolution maximizes a score between 0 and 1 like the DNA evolution"""
+	rules = MutationRules({"score": MutationRule(0, 1, 0.01)})
+	population = Population.random(DNA({"score": None}), rules, 100, rng=np.random.default_rng(0))
+
+	evolution = Evolution(
+		generation=population,
+		last_gen=20,
+		fitness_func=lambda dna: dna["score"],
+		breeding_protocol=CrossBreeding(parent_selection=versus, population_selection=versus_indices),
+		mutation_rules=rules
+	)
+	start_score = evolution.average_score()
+	evolution.evolve()
+	evolution.evaluate_gen()
+
+	assert isinstance(evolution.generation, Population)
+	assert evolution.average_score() > start_score
+
+def test_ode_views():
+	"""The views work with the code written for DNA"""
+	template = DNA.read_DNA(defaults_path() / 'dna_ode_template.yaml')
+	rules = MutationRules({"capacitance": MutationRule(1e-6, 1e-3, 0.1)})
+	population = Population.random(template, rules, 5)
+
+	sim = CoilgunSimulationODE.from_DNA(population[0])
+	assert sim.CB.C == population.genomes[0, 0]
+	assert sim.coil.N == template["solenoid_turns"]
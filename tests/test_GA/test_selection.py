@@ -1,5 +1,7 @@
+import numpy as np
+
 from GA.DNA import DNA
-from GA.selection import versus
+from GA.selection import versus, versus_indices
 
 def test_versus():
 	"""Test that the versus selcection returns the best of the combatants"""
@@ -10,3 +12,15 @@ def test_versus():
 
 	assert versus(gen_score) is good_DNA
 	assert versus(gen_score) is not bad_DNA
+
+def test_versus_indices():
+	"""The vectorized duels never pit an individual against itself"""
+	rng = np.random.default_rng(0)
+
+	# The best of two always wins
+	assert np.all(versus_indices(np.array([1.0, 0.0]), 100, rng) == 0)
+
+	# The worst individual can never win
+	winners = versus_indices(np.array([0.0, 1.0, 2.0, -1.0]), 1000, rng)
+	assert not np.any(winners == 3)
+	assert set(winners) == {0, 1, 2}
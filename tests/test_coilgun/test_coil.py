@@ -1,3 +1,5 @@
+import numpy as np
+
 from coilgun.coil import Coil
 
 
@@ -8,4 +10,30 @@ def test_coil_resistance(geometry_coil):
 def test_B_field_from_coil(geometry_coil):
 	"""Test the calculation of the B field from the coil"""
 	# My calculator do not have the required precistion
-	assert round(geometry_coil.B_field(z=0, I=1) - 954.7230157e-6, 6) == 0
\ No newline at end of file
+	assert round(geometry_coil.B_field(z=0, I=1) - 954.7230157e-6, 6) == 0
+
+def test_B_field_array(geometry_coil, solenoid):
+	"""The field at an array of z should be the same as one z at a time"""
+	for coil, z in [(geometry_coil, np.linspace(-5, 8, 14)), (solenoid, np.linspace(-0.05, 0.15, 11))]:
+		B = coil.B_field(I=2, z=z)
+		dB = coil.B_field_gradiant(I=2, z=z)
+
+		assert B.shape == dB.shape == z.shape
+		np.testing.assert_allclose(B, [coil.B_field(I=2, z=z_i) for z_i in z], rtol=1e-12)
+		np.testing.assert_allclose(dB, [coil.B_field_gradiant(I=2, z=z_i) for z_i in z], rtol=1e-12)
+
+def test_geometry_coil_gradiant(geometry_coil):
+	"""The analytic gradient [T/m] should agree with a finite difference between the turns"""
+	z = np.array([-3.3, 0.5, 1.5, 7.2]) 	# [mm]
+	h = 1e-4
+	dB = (geometry_coil.B_field(I=1, z=z+h) - geometry_coil.B_field(I=1, z=z-h)) / (2 * h * 1e-3)
+
+	np.testing.assert_allclose(geometry_coil.B_field_gradiant(I=1, z=z), dB, rtol=1e-6)
+
+def test_field_profile(geometry_coil):
+	"""The FFT field profile on a grid aligned with the circles should be the same as the direct sum"""
+	for z in [-10 + 0.25 * np.arange(100), np.linspace(-9.9, 15.1, 100)]:
+		B, dB = geometry_coil.field_profile(I=2, z=z)
+
+		np.testing.assert_allclose(B, geometry_coil.B_field(I=2, z=z), rtol=1e-9, atol=1e-15)
+		np.testing.assert_allclose(dB, geometry_coil.B_field_gradiant(I=2, z=z), rtol=1e-9, atol=1e-12)
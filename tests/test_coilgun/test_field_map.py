@@ -0,0 +1,45 @@
+import numpy as np
+
+from coilgun.coil import GeometryCoil
+from coilgun.field_map import field_map, mapped_coil
+from coilgun.projectile import MagneticProjectile
+from simulation.simulate import CoilgunSimulation, SimulationConf
+
+
+def test_field_map_error(geometry_coil, solenoid):
+	"""The interpolated gradient should be within the error bound of the exact gradient"""
+	for coil in [geometry_coil, solenoid]:
+		fmap = field_map(coil, resolution=200)
+		z = np.linspace(-coil.length(), 2 * coil.length(), 101)
+
+		exact = coil.B_field_gradiant(I=3, z=z)
+		tolerance = 1.01 * fmap.error() * np.max(np.abs(3 * fmap.dB))
+
+		assert fmap.error() < 1e-3
+		np.testing.assert_allclose(fmap.B_field_gradiant(I=3, z=z), exact, atol=tolerance, rtol=0)
+		np.testing.assert_allclose([fmap.B_field_gradiant(I=3, z=z_i) for z_i in z], exact, atol=tolerance, rtol=0)
+
+def test_field_map_outside(solenoid):
+	"""Outside of the map the exact gradient should be used"""
+	fmap = field_map(solenoid)
+	z = fmap.z_max + 1.0
+
+	assert fmap.B_field_gradiant(I=2, z=z) == solenoid.B_field_gradiant(I=2, z=z)
+
+def test_field_map_shared(geometry_coil):
+	"""Coils with the same geometry should share one map"""
+	coil = GeometryCoil(coils=[1,2,4], inner_diameter=5, wire_diameter=1, resistivity=2e-6)
+
+	assert field_map(coil) is field_map(geometry_coil)
+	assert field_map(coil, resolution=100) is not field_map(geometry_coil)
+
+def test_mapped_coil(solenoid, constant_current_source):
+	"""A simulation with the field map should give almost the same result as with the exact field"""
+	conf = SimulationConf(dt=1e-3, max_time=0.5)
+	mapped_conf = SimulationConf(dt=1e-3, max_time=0.5, field_map_resolution=200)
+
+	exact = CoilgunSimulation(solenoid, constant_current_source, MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf).run()
+	mapped = CoilgunSimulation(solenoid, constant_current_source, MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), mapped_conf).run()
+
+	assert mapped_coil(solenoid).resistance() == solenoid.resistance()
+	np.testing.assert_allclose(mapped.vel, exact.vel, rtol=1e-3, atol=1e-6)
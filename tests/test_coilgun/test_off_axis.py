@@ -0,0 +1,41 @@
+import numpy as np
+
+from coilgun.off_axis import loop_field, off_axis_field
+from utils.constants import mu_0
+
+
+def test_loop_on_axis():
+	"""On the axis the field of a loop should be the textbook formula"""
+	a, z = 0.02, np.linspace(-0.1, 0.1, 11)
+	Br, Bz = loop_field([a], [0], 0, z, I=2)
+
+	np.testing.assert_allclose(Bz, mu_0 * 2 * a**2 / (2 * (a**2 + z**2)**(3/2)), rtol=1e-12)
+	np.testing.assert_array_equal(Br, 0)
+
+def test_divergence_free(geometry_coil):
+	"""The field of the coil should have no divergence off the wires"""
+	z_loop, a = geometry_coil.loops()
+	field = lambda r, z: loop_field(a * 1e-3, z_loop * 1e-3, r, z)
+	r, z, h = 1.2e-3, 3.3e-3, 1e-7
+
+	dBr = ((r + h) * field(r + h, z)[0] - (r - h) * field(r - h, z)[0]) / (2 * h * r)
+	dBz = (field(r, z + h)[1] - field(r, z - h)[1]) / (2 * h)
+
+	assert abs(dBr + dBz) < 1e-6 * abs(dBz)
+
+def test_solenoid_on_axis(solenoid):
+	"""On the axis the loops of a solenoid should give the field of the solenoid"""
+	field = off_axis_field(solenoid, r=np.linspace(0, 0.04, 5), z=np.linspace(-0.05, 0.15, 9))
+
+	np.testing.assert_allclose(field.Bz[0], solenoid.B_field(I=1, z=field.z), rtol=1e-4)
+
+def test_field_grid(geometry_coil):
+	"""The field grid should be shared and sampling it on the grid should give the grid values"""
+	r, z = np.linspace(0, 2, 5), np.linspace(-5, 8, 14)
+	field = off_axis_field(geometry_coil, r, z)
+	Br, Bz = field.sample(I=2, r=-r[1], z=z)
+
+	assert field is off_axis_field(geometry_coil, r, z)
+	assert field.Br.shape == field.Bz.shape == (5, 14)
+	np.testing.assert_allclose(Br, -2 * field.Br[1], rtol=1e-12)
+	np.testing.assert_allclose(Bz, 2 * field.Bz[1], rtol=1e-12)
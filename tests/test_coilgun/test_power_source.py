@@ -1,4 +1,10 @@
-from coilgun.power_source import ConstantCurrent, ConstantVoltage
+import numpy as np
+import pytest
+
+from scipy import integrate
+
+from coilgun.coil import Solenoid
+from coilgun.power_source import CapacitorBank, ConstantCurrent, ConstantVoltage
 
 
 def test_ConstantCurrent(constant_current_source, geometry_coil):
@@ -14,3 +20,47 @@ def test_ConstantVoltage(constant_voltage_source, geometry_coil):
 	R = geometry_coil.resistance()
 	V = constant_voltage_source.voltage
 	assert constant_voltage_source.current(coil=geometry_coil, t=0) ==  V / R
+
+def test_waveform(constant_current_source, constant_voltage_source, geometry_coil):
+	"""The current and energy at an array of times should be the same as one time at a time"""
+	t = np.linspace(0, 1, 11)
+	for source in [constant_current_source, constant_voltage_source, CapacitorBank(capacitance=1e-3, voltage=30, inductance=1e-4)]:
+		waveform = source.waveform(geometry_coil, t)
+
+		np.testing.assert_allclose(waveform.I, [source.current(coil=geometry_coil, t=t_i) for t_i in t], rtol=1e-12)
+		np.testing.assert_allclose(waveform.energy, [source.energy_consumption(coil=geometry_coil, t=t_i, dt=0.1) for t_i in t[:-1]], rtol=1e-9)
+		assert source.waveform(geometry_coil, t) is waveform
+
+def test_waveform_cache(constant_voltage_source, geometry_coil):
+	"""The cache should own read only copies of the times, shared by every array on the same grid"""
+	t = np.linspace(0, 1, 11)
+	waveform = constant_voltage_source.waveform(geometry_coil, t)
+	t[:] = -1.0
+
+	assert waveform.t[0] == 0.0
+	assert not waveform.t.flags.writeable and not waveform.I.flags.writeable and not waveform.energy.flags.writeable
+	assert constant_voltage_source.waveform(geometry_coil, np.linspace(0, 1, 11)) is waveform
+
+	# Unevenly spaced times are sampled but not cached
+	t = np.array([0.0, 0.1, 0.3])
+	assert constant_voltage_source.waveform(geometry_coil, t) is not constant_voltage_source.waveform(geometry_coil, t)
+
+@pytest.mark.parametrize("inductance", [0.0, 1e-6, 1e-3])
+def test_CapacitorBank(inductance):
+	"""The discharge should follow the RLC circuit and take all the energy of the capacitance bank"""
+	coil = Solenoid(L=0.1, N=100, inner_diameter=0.1, wire_diameter=1e-3, resistivity=1e-7)
+	source = CapacitorBank(capacitance=1e-3, voltage=30, inductance=inductance)
+	R, C, L = coil.resistance(), source.capacitance, source.inductance
+	t = np.linspace(0, 5 * R * C + 5 * L / R, 101)
+
+	if L > 0:
+		# L dI/dt = V - RI and dV/dt = -I/C
+		sol = integrate.solve_ivp(lambda t, y: [(y[1] - R*y[0]) / L, -y[0] / C], (0, t[-1]), [0, source.voltage], t_eval=t, rtol=1e-10, atol=1e-12, method="Radau")
+		I = sol.y[0]
+	else:
+		I = source.voltage / R * np.exp(-t / (R * C))
+
+	np.testing.assert_allclose(source.current(coil=coil, t=t), I, rtol=1e-6, atol=1e-9 * np.max(np.abs(I)))
+
+	t = np.linspace(0, 50 * R * C + 50 * L / R, 1001)
+	assert np.sum(source.energy_consumption(coil=coil, t=t[:-1], dt=np.diff(t))) == pytest.approx(C * source.voltage**2 / 2, rel=1e-9)
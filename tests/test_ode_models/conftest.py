@@ -1,12 +1,38 @@
 import pytest
 
-from ode_models.inductance_models import exponential_model_of_coil_indunctance, exponential_model_of_coil_indunctance_derivative
+from GA.DNA import DNA
+from ode_models.simulation import CoilData, CoilgunSimulationODE, ProjectileData
+from utils.path import defaults_path
 
 
 @pytest.fixture
-def L():
-	return exponential_model_of_coil_indunctance(2.0, 3.0, 4.0, 5.0, 6.0)
+def coil_data():
+	return CoilData(l=2.0, r=1.0, N=10, rho=1.0, A=1.0)
 
 @pytest.fixture
-def dLdx():
-	return exponential_model_of_coil_indunctance_derivative(2.0, 3.0, 4.0, 5.0)
\ No newline at end of file
+def projectile_data():
+	return ProjectileData(m=1.0, x0=-1.0, v0=0.0, mu_r=3.0)
+
+@pytest.fixture
+def L(coil_data, projectile_data):
+	return coil_data.inductance_model(projectile_data)
+
+@pytest.fixture
+def dLdx(coil_data, projectile_data):
+	return coil_data.inductance_model_derivitive(projectile_data)
+
+@pytest.fixture
+def ode_DNA():
+	"""Return the template ODE DNA with the given genes replaced"""
+	def make_DNA(**genes) -> DNA:
+		dna = DNA.read_DNA(defaults_path() / 'dna_ode_template.yaml')
+		dna.DNA.update(genes)
+		return dna
+	return make_DNA
+
+@pytest.fixture
+def ode_simulation(ode_DNA):
+	"""Return a simulation of the template ODE DNA with the given genes replaced"""
+	def make_simulation(**genes) -> CoilgunSimulationODE:
+		return CoilgunSimulationODE.from_DNA(ode_DNA(**genes))
+	return make_simulation
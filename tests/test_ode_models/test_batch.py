@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from GA.fitness import ODECoilFitness
+from ode_models.batch import ode_solver_coilgun_batch
+from ode_models.simulation import CoilgunSimulationODE, SolverConf
+
+
+def test_batch_matches_single_solver(ode_DNA):
+	"""The batched solver should give the same efficiency as the solver for a single coilgun"""
+	generation = [
+		ode_DNA(),
+		ode_DNA(solenoid_turns=1500, capacitance=200e-6),
+		ode_DNA(capacitance_voltage=800.0, projectile_mass=5e-3, projectile_start_pos=-10e-3),
+	]
+	fitness = ODECoilFitness(max_time=100e-3)
+
+	single = [fitness(dna) for dna in generation]
+	batch = fitness.evaluate_batch(generation)
+
+	np.testing.assert_allclose(batch, single, rtol=0.05, atol=1e-3)
+
+def test_batch_termination():
+	"""Every member should end the capacitor phase with an empty bank"""
+	sol = ode_solver_coilgun_batch(
+		C=[1e-3, 2e-3],
+		R=[0.5, 1.0],
+		m=[0.1, 0.1],
+		V0=[300, 300],
+		x0=[-0.04, -0.02],
+		v0=[0, 0],
+		inductance_params=[[2e-3, 2000, 2.06, 2e-3], [2e-3, 2000, 2.06, 2e-3]],
+		t_max=0.1
+	)
+
+	assert sol.success.all()
+	np.testing.assert_allclose(sol.V, 0, atol=1e-3)
+	np.testing.assert_allclose(sol.t, sol.t_switch + 0.1)
+
+def test_batch_scaled_tolerance(ode_simulation):
+	"""The batched solver should accept a scaled atol for every member"""
+	sim = ode_simulation()
+	reference = sim.run_final(100e-3, SolverConf(rtol=1e-8, atol=1e-10))
+	batch = CoilgunSimulationODE.run_batch([sim, sim], 100e-3, SolverConf(rtol=1e-6, atol=1e-6, scaled=True))
+
+	np.testing.assert_allclose(batch.v, reference.v, rtol=1e-3)
+
+@pytest.mark.parametrize("stops", [
+	{"stop_current_fraction": 1e-2},
+	{"stop_exit_fraction": 1e-4},
+	{"stop_energy_tolerance": 1e-3},
+])
+def test_batch_stops(ode_simulation, stops):
+	"""The batched solver should end the phases early in the same way as the serial solver"""
+	sims = [ode_simulation(), ode_simulation(solenoid_turns=100, capacitance=1e-4), ode_simulation(projectile_start_pos=-10e-3)]
+	conf = SolverConf(rtol=1e-9, atol=1e-12, **stops)
+	batch = CoilgunSimulationODE.run_batch(sims, 100e-3, conf)
+	full = CoilgunSimulationODE.run_batch(sims, 100e-3, SolverConf(rtol=1e-9, atol=1e-12))
+
+	for i, sim in enumerate(sims):
+		serial = sim.run_final(100e-3, conf)
+		assert batch.t_switch[i] == pytest.approx(serial.t_switch, rel=1e-6)
+		assert batch.t[i] == pytest.approx(serial.t, rel=1e-6)
+		assert batch.v[i] == pytest.approx(serial.v, rel=1e-6)
+	assert np.all(batch.t <= full.t) and np.any(batch.t < full.t)
@@ -1,4 +1,4 @@
-from ode_models.coilgun import calculate_efficiency
+from ode_models.coilgun import calculate_efficiency, stiffness_ratio
 
 
 def test_efficiency():
@@ -6,4 +6,9 @@ def test_efficiency():
 	assert calculate_efficiency(0, 1, 1, 0, 1, 1) == 1
 	assert calculate_efficiency(1, 1, 1, 0, 1, 1) == 0
 	assert calculate_efficiency(0, 1, 2, 0, 1, 1) == 0.25
-	assert calculate_efficiency(0, 1, 1, 0, 1, 2) == 0.5
\ No newline at end of file
+	assert calculate_efficiency(0, 1, 1, 0, 1, 2) == 0.5
+
+def test_stiffness_ratio():
+	"""An underdamped circuit is not stiff while an overdamped is"""
+	assert stiffness_ratio(R=0.1, L=1e-3, C=1e-3) == 1
+	assert stiffness_ratio(R=100, L=1e-3, C=1e-3) > 1e3
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from ode_models.coilgun import calculate_efficiency
+from ode_models.inductance import InductanceModel, TabulatedInductance
+from ode_models.simulation import SolverConf
+
+
+def test_exact_model(ode_simulation):
+	"""The model object should agree with the model functions of the coil, for scalars and arrays"""
+	sim = ode_simulation()
+	model = sim.coil.inductance(sim.projectile)
+	L = sim.coil.inductance_model(sim.projectile)
+	dLdx = sim.coil.inductance_model_derivitive(sim.projectile)
+	d2Ldx2 = sim.coil.inductance_model_second_derivitive(sim.projectile)
+
+	x = np.array([-30e-3, -10e-3, 0.0, 5e-3, 20e-3])
+	L_x, dLdx_x = model.with_derivative(x)
+	np.testing.assert_allclose(L_x, L(x), rtol=1e-12)
+	np.testing.assert_allclose(dLdx_x, dLdx(x), rtol=1e-12, atol=1e-15)
+	np.testing.assert_allclose(model.second_derivative(x), d2Ldx2(x), rtol=1e-12, atol=1e-15)
+
+	for x_i in x:
+		assert model.with_derivative(x_i) == pytest.approx((L(x_i), dLdx(x_i)), rel=1e-12, abs=1e-15)
+
+def test_model_per_element():
+	"""Array parameters should give one model per element of x, like the models one at a time"""
+	params = np.array([[0.07, 2500.0, 2.06, 7e-4], [0.02, 900.0, 2.06, 3e-4], [0.05, 4000.0, 2.0, 1e-3]])
+	x = np.array([-10e-3, 0.0, 25e-3])
+
+	L_x, dLdx_x = InductanceModel(*params.T).with_derivative(x)
+	for i, x_i in enumerate(x):
+		assert (L_x[i], dLdx_x[i]) == pytest.approx(InductanceModel(*params[i]).with_derivative(x_i), rel=1e-12, abs=1e-15)
+
+def test_table_error():
+	"""The error of the table should fall with the number of points and match the scalar path"""
+	model = InductanceModel(A=0.07, B=2500.0, C=2.06, D=7e-4)
+	errors = [TabulatedInductance(0.07, 2500.0, 2.06, 7e-4, points=n).interpolation_error() for n in (501, 2001)]
+
+	assert errors[1][0] < errors[0][0] < 1e-6 * model.A
+	assert errors[1][1] < errors[0][1]
+
+	table = TabulatedInductance(0.07, 2500.0, 2.06, 7e-4)
+	x = np.linspace(-0.1, 0.1, 13)
+	L_x, dLdx_x = table.with_derivative(x)
+	for i, x_i in enumerate(x):
+		assert table.with_derivative(x_i) == pytest.approx((L_x[i], dLdx_x[i]), rel=1e-12, abs=1e-15)
+
+def test_table_edges():
+	"""Points just inside the ends of the table should use the last interval, not index past it"""
+	table = TabulatedInductance(0.07, 2500.0, 2.06, 7e-4)
+	exact = InductanceModel(0.07, 2500.0, 2.06, 7e-4)
+
+	for x in (np.nextafter(table.x_max, -np.inf), np.nextafter(table.x_min, np.inf)):
+		assert table.with_derivative(x) == pytest.approx(exact.with_derivative(x), rel=1e-6, abs=1e-12)
+		assert table.second_derivative(x) == pytest.approx(exact.second_derivative(x), rel=1e-6, abs=1e-9)
+
+def test_tabulated_simulation(ode_simulation):
+	"""The simulation with a tabulated model should give the same efficiency"""
+	sim = ode_simulation()
+
+	def efficiency(conf):
+		state = sim.run_final(100e-3, conf)
+		return calculate_efficiency(state.v0, state.v, state.V0, state.V, sim.projectile.m, sim.CB.C)
+
+	reference = efficiency(SolverConf(rtol=1e-6, atol=1e-9))
+	assert efficiency(SolverConf(rtol=1e-6, atol=1e-9, inductance_table_points=4001)) == pytest.approx(reference, rel=1e-3)
@@ -1,32 +1,32 @@
 import numpy as np
 
-from ode_models.inductance_models import solenoid_inductance
+from ode_models.simulation import CoilData
 
 
-def test_inductance_float(L):
+def test_inductance_float(L, coil_data, projectile_data):
 	"""Test if the inductance is correctly calculated for a float"""
-	assert L(4) == 8
-	assert round(L(4.1) - 7.999940000899991, 7) == 0
+	A, B, C, D = coil_data.params_for_inductance_model(projectile_data)
+	assert L(0) == A + D
+	assert round(L(0.5) - (A*np.exp(-B*0.5**C) + D), 12) == 0
+	assert L(0.5) == L(-0.5)
 
-def test_inductance_derivative_float(dLdx):
+def test_inductance_derivative_float(dLdx, L):
 	"""Test if the derivative of the inductance is correctly calculated for a float"""
-	assert round(dLdx(3.9) - 0.002999940000600, 7) == 0
-	assert round(dLdx(4.1) + 0.002999940000600, 7) == 0
-	# assert round(dLdx(3.5) - 1.761399492775267, 7) == 0 # This do not agree with matlab for some reason
-	assert dLdx(4) == 0 # Div with zero
+	h = 1e-6
+	assert round(dLdx(0.5) - (L(0.5 + h) - L(0.5 - h)) / (2*h), 7) == 0
+	assert dLdx(0.5) == -dLdx(-0.5)
+	assert dLdx(0.5) < 0
 
 def test_inductance_ndarray(L):
-	"""Test if the inductance is correctly calculated for a float"""
-	np.testing.assert_allclose(L(np.array([4, 4.1])), (8, 7.999940000899991))
+	"""Test if the inductance is correctly calculated for an array"""
+	np.testing.assert_allclose(L(np.array([0, 0.5, 1.5])), (L(0), L(0.5), L(1.5)))
 
 def test_inductance_derivative_ndarray(dLdx):
-	"""Test if the derivative of the inductance is correctly calculated for a float"""
-	np.testing.assert_allclose(dLdx(np.array([3.9, 4, 4.1])), (0.002999940000600, 0, -0.002999940000600), rtol=1e-5)
+	"""Test if the derivative of the inductance is correctly calculated for an array"""
+	np.testing.assert_allclose(dLdx(np.array([-0.5, 0.5, 1.5])), (dLdx(-0.5), dLdx(0.5), dLdx(1.5)))
 
 def test_solenoid_inductance():
 	"""Test the inductance of a solenoid"""
-	assert solenoid_inductance(1, 1, 1, 1) == np.pi
-	assert solenoid_inductance(2, 1, 1, 1) == 2*np.pi
-	assert solenoid_inductance(1, 2, 1, 1) == 4*np.pi
-	assert solenoid_inductance(1, 1, 2, 1) == 4*np.pi
-	assert solenoid_inductance(1, 1, 1, 2) == np.pi / 2
+	assert CoilData(l=1, r=1, N=1, rho=1, A=1).coil_inductance(1) == np.pi
+	assert CoilData(l=1, r=1, N=1, rho=1, A=1).coil_inductance(2) == 2*np.pi
+	assert CoilData(l=1, r=1, N=2, rho=1, A=1).coil_inductance(1) == 4*np.pi
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from scipy import integrate
+
+from ode_models.integrator import solve_ivp_lean
+from ode_models.simulation import SolverConf
+
+
+def oscillator(t, y):
+	x, v = y
+	return [v, -x - 0.1*v]
+
+def crossing(t, y):
+	return y[0]
+crossing.direction = -1
+
+def stop(t, y):
+	return y[0] + 0.5
+stop.terminal = True
+
+@pytest.mark.parametrize("t_eval", [None, np.linspace(0, 20, 41)])
+def test_same_as_solve_ivp(t_eval):
+	"""The lean integrator takes the same steps and finds the same events as RK45"""
+	args = {"t_span": (0, 20), "y0": [1.0, 0.0], "rtol": 1e-6, "atol": 1e-9, "events": [crossing, stop], "t_eval": t_eval}
+	reference = integrate.solve_ivp(oscillator, method="RK45", **args)
+	sol = solve_ivp_lean(oscillator, **args)
+
+	assert sol.status == reference.status == 1
+	np.testing.assert_allclose(sol.t, reference.t, rtol=1e-12)
+	np.testing.assert_allclose(sol.y, reference.y, rtol=1e-10, atol=1e-12)
+	for t_event, reference_event in zip(sol.t_events, reference.t_events):
+		np.testing.assert_allclose(t_event, reference_event, rtol=1e-10)
+
+def test_simulation_backend(ode_simulation):
+	"""The simulation should give the same final state with both backends"""
+	sim = ode_simulation()
+	reference = sim.run_final(100e-3, SolverConf(method="RK45", rtol=1e-4), peaks=True)
+	state = sim.run_final(100e-3, SolverConf(method="DOPRI5", rtol=1e-4), peaks=True)
+
+	assert state.t == pytest.approx(reference.t, rel=1e-9)
+	assert state.v == pytest.approx(reference.v, rel=1e-9)
+	assert state.I_peak == pytest.approx(reference.I_peak, rel=1e-9)
+	assert state.F_peak == pytest.approx(reference.F_peak, rel=1e-9)
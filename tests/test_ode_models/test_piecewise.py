@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from ode_models.coilgun import calculate_efficiency, ode_solver_coilgun
+from ode_models.inductance import InductanceModel
+from ode_models.piecewise import ode_solver_piecewise
+from ode_models.simulation import SolverConf
+
+
+@pytest.mark.parametrize("x0", [-40e-3, -200e-3])
+def test_piecewise_solver(ode_simulation, x0):
+	"""The piecewise solver should agree with the numerical solution, also when it starts far from the coil"""
+	sim = ode_simulation(projectile_start_pos=x0, projectile_velocity=5.0)
+
+	def efficiency(conf):
+		state = sim.run_final(100e-3, conf)
+		return calculate_efficiency(state.v0, state.v, state.V0, state.V, sim.projectile.m, sim.CB.C)
+
+	assert sim.far_distance(1e-4) > sim.coil.l / 2
+	reference = efficiency(SolverConf(rtol=1e-8, atol=1e-10))
+	assert efficiency(SolverConf(rtol=1e-8, atol=1e-10, analytic_tolerance=1e-6)) == pytest.approx(reference, rel=1e-3)
+
+def test_piecewise_trajectory(ode_simulation):
+	"""The trajectory should be sampled on the output grid and end like the final state"""
+	sim = ode_simulation()
+	conf = SolverConf(rtol=1e-6, analytic_tolerance=1e-4)
+	t, x, v, I, V = sim.run(100e-3, 1000, conf)
+	final_state = sim.run_final(100e-3, conf)
+
+	assert np.all(np.diff(t) > 0)
+	assert v[-1] == pytest.approx(final_state.v, rel=1e-9)
+	assert V[-1] == pytest.approx(final_state.V, rel=1e-9, abs=1e-9)
+
+def test_piecewise_current_decayed():
+	"""An overdamped capacitor phase should end at the same time as with the ODE solver"""
+	model = InductanceModel(2e-3, 2000.0, 2.06, 2e-3)
+	args = dict(C=1e-3, R=3.0, m=0.1, L=model, dLdx=model.derivative, x0=-0.04, t_max=0.1, V0=300.0, v0=0.0, rtol=1e-9, atol=1e-11, I_stop_fraction=0.05)
+
+	t = ode_solver_coilgun(**args)[0]
+	t_switch = ode_solver_piecewise(x_far=0.06, final_only=True, **args)[5]
+
+	assert t_switch == pytest.approx(t[-1], rel=1e-8)
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from ode_models.coilgun import calculate_efficiency, ode_solver_coilgun, ode_solver_hybrid
+from ode_models.inductance import InductanceModel
+from ode_models.simulation import SolverConf
+
+
+def test_final_state(ode_simulation):
+	"""The final state should be the same as the end of the full trajectory"""
+	sim = ode_simulation()
+	t, x, v, I, V = sim.run(100e-3, 1000)
+	final_state = sim.run_final(100e-3, peaks=True)
+
+	assert final_state.v0 == v[0]
+	assert final_state.V0 == V[0]
+	assert final_state.t == pytest.approx(t[-1])
+	assert final_state.x == pytest.approx(x[-1])
+	assert final_state.v == pytest.approx(v[-1])
+	assert final_state.V == pytest.approx(V[-1])
+
+	# The peaks are located exactly and not only at the stored steps
+	dLdx = sim.coil.inductance_model_derivitive(sim.projectile)
+	assert final_state.I_peak == pytest.approx(np.max(np.abs(I)), rel=1e-3)
+	assert final_state.F_peak == pytest.approx(np.max(np.abs(I**2 * dLdx(x) / 2)), rel=1e-3)
+
+def test_early_termination(ode_simulation):
+	"""Ending the RL phase early should not change the efficiency"""
+	sim = ode_simulation()
+	def efficiency(conf):
+		final_state = sim.run_final(100e-3, conf)
+		return calculate_efficiency(final_state.v0, final_state.v, final_state.V0, final_state.V, sim.projectile.m, sim.CB.C)
+
+	full = sim.run_final(100e-3, SolverConf(rtol=1e-6))
+	early = sim.run_final(100e-3, SolverConf(rtol=1e-6, stop_current_fraction=1e-3, stop_exit_fraction=1e-4, stop_energy_tolerance=1e-4))
+
+	assert early.t < full.t
+	assert efficiency(SolverConf(rtol=1e-6, stop_exit_fraction=1e-4, stop_energy_tolerance=1e-4)) == pytest.approx(efficiency(SolverConf(rtol=1e-6)), abs=1e-4)
+
+@pytest.mark.parametrize("method", ["RK45", "DOPRI5"])
+@pytest.mark.parametrize("t_steps", [None, 100])
+def test_current_decayed(method, t_steps):
+	"""An overdamped capacitor phase should end where |I| has fallen to the fraction of its peak"""
+	model = InductanceModel(2e-3, 2000.0, 2.06, 2e-3)
+	t, x, v, I, V, dIdt, I_peak, F_peak = ode_solver_coilgun(
+		C=1e-3, R=10.0, m=0.1, L=model, dLdx=model.derivative, d2Ldx2=model.second_derivative,
+		x0=-0.04, t_max=0.1, V0=300.0, v0=0.0, t_steps=t_steps, method=method,
+		rtol=1e-8, atol=1e-10, peaks=True, I_stop_fraction=0.05
+	)
+
+	assert V[-1] > 0
+	assert abs(I[-1]) == pytest.approx(0.05 * I_peak, rel=1e-6)
+	assert np.all(np.diff(t) >= 0)
+
+def test_hybrid_solver(ode_simulation):
+	"""Solving both phases in one integration should give the same result as two"""
+	sim = ode_simulation()
+	two_phase = sim.run_final(100e-3, SolverConf(rtol=1e-9, atol=1e-11))
+	hybrid = sim.run_final(100e-3, SolverConf(rtol=1e-9, atol=1e-11, hybrid=True))
+
+	assert hybrid.t_switch == pytest.approx(two_phase.t_switch, rel=1e-6)
+	assert hybrid.t == pytest.approx(two_phase.t, rel=1e-6)
+	assert hybrid.v == pytest.approx(two_phase.v, rel=1e-5)
+	assert hybrid.V == pytest.approx(two_phase.V, abs=1e-6)
+
+	# The trajectory is sampled on one evenly spaced grid and at the switch
+	t, x, v, I, V = sim.run(100e-3, 100, SolverConf(hybrid=True))
+	grid = np.isclose(t / 1e-3, np.round(t / 1e-3))
+	assert np.sum(~grid[:-1]) == 1
+	assert t[-1] == pytest.approx(two_phase.t, rel=1e-3)
+
+@pytest.mark.parametrize("method", ["LSODA", "BDF", "Radau"])
+def test_hybrid_solver_methods(method):
+	"""The hybrid solver can not rewind the implicit solvers at the switch and should refuse them"""
+	model = InductanceModel(A=0.07, B=2500.0, C=2.06, D=7e-4)
+	with pytest.raises(ValueError):
+		ode_solver_hybrid(1e-3, 1.0, 0.01, model, model.derivative, -0.05, 0.1, 100.0, 0.0, method=method)
+
+@pytest.mark.parametrize("method", ["RK45", "Radau"])
+def test_energy_ledger(ode_simulation, method):
+	"""The integrated energies should match the closed forms from the final state"""
+	sim = ode_simulation()
+	state = sim.run_final(100e-3, SolverConf(method=method, rtol=1e-7, atol=1e-10), energy=True)
+	m, C = sim.projectile.m, sim.CB.C
+
+	assert state.W == pytest.approx(m * (state.v**2 - state.v0**2) / 2, rel=1e-4)
+	assert state.E_C == pytest.approx(C * (state.V0**2 - state.V**2) / 2, rel=1e-4)
+	# The circuit model has no back EMF so the work is not drawn from the circuit
+	assert state.E_C == pytest.approx(state.E_R + state.E_L - state.W, rel=1e-4)
+
+def test_scaled_tolerance(ode_simulation):
+	"""A scaled atol should give the same result as an absolute atol"""
+	sim = ode_simulation()
+	def efficiency(conf):
+		state = sim.run_final(100e-3, conf)
+		return calculate_efficiency(state.v0, state.v, state.V0, state.V, sim.projectile.m, sim.CB.C)
+
+	scales = sim.characteristic_scales()
+	assert scales.V == sim.CB.V
+	assert scales.x == sim.coil.l
+
+	reference = efficiency(SolverConf(rtol=1e-8, atol=1e-10))
+	assert efficiency(SolverConf(rtol=1e-6, atol=1e-6, scaled=True)) == pytest.approx(reference, rel=1e-3)
+	assert efficiency(SolverConf(rtol=1e-6, atol=1e-6, scaled=True, hybrid=True)) == pytest.approx(reference, rel=1e-3)
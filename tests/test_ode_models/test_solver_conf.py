@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from ode_models.coilgun import calculate_efficiency
+from ode_models.simulation import SolverConf
+
+
+def efficiency(sim, conf):
+	t, x, v, I, V = sim.run(100e-3, None, conf)
+	return calculate_efficiency(v[0], v[-1], V[0], V[-1], sim.projectile.m, sim.CB.C)
+
+def test_second_derivative_of_inductance(ode_simulation):
+	"""Compare the second derivative with a finite difference"""
+	sim = ode_simulation()
+	dLdx = sim.coil.inductance_model_derivitive(sim.projectile)
+	d2Ldx2 = sim.coil.inductance_model_second_derivitive(sim.projectile)
+
+	x = np.array([-30e-3, -10e-3, 5e-3, 20e-3])
+	h = 1e-7
+	np.testing.assert_allclose(d2Ldx2(x), (dLdx(x + h) - dLdx(x - h)) / (2*h), rtol=1e-6)
+
+@pytest.mark.parametrize("method", ["DOP853", "Radau", "BDF", "LSODA", "auto"])
+def test_solver_methods(ode_simulation, method):
+	"""All methods should agree with a tight reference solution"""
+	sim = ode_simulation()
+	reference = efficiency(sim, SolverConf(rtol=1e-8, atol=1e-10))
+
+	assert efficiency(sim, SolverConf(method=method, rtol=1e-6, atol=1e-9)) == pytest.approx(reference, rel=1e-3)
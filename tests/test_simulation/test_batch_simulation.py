@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from coilgun.coil import GeometryCoil, Solenoid
+from coilgun.power_source import CapacitorBank, ConstantCurrent, ConstantVoltage
+from coilgun.projectile import MagneticProjectile
+from coilgun.field_map import field_map
+from simulation.batch import BatchCoilgunSimulation, _FieldTables
+from simulation.simulate import CoilgunSimulation, SimulationConf
+
+
+def designs():
+	"""Coils, power sources and projectiles of a small population"""
+	coils = [
+		Solenoid(L=0.1, N=100, inner_diameter=0.1, wire_diameter=1e-3, resistivity=1e-9),
+		GeometryCoil(coils=[1,2,4], inner_diameter=5, wire_diameter=1, resistivity=1e-6),
+		Solenoid(L=0.05, N=300, inner_diameter=0.02, wire_diameter=1e-3, resistivity=1e-8)
+	]
+	power_sources = [ConstantCurrent(current=1), ConstantVoltage(voltage=1e-3), CapacitorBank(capacitance=1e-2, voltage=1, inductance=1e-4)]
+	projectiles = [
+		MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1),
+		MagneticProjectile(mass=0.02, pos=-4, vel=0.5, m=2),
+		MagneticProjectile(mass=0.01, pos=-0.05, vel=1, m=1)
+	]
+	return coils, power_sources, projectiles
+
+@pytest.mark.parametrize("resolution, integrator", [(50, "Euler"), (200, "Euler"), (200, "Verlet")])
+def test_same_as_simulation(resolution, integrator):
+	"""Every member should end in the same state as when it is simulated alone"""
+	max_times = np.array([0.3, 0.2, 0.25])
+	conf = SimulationConf(dt=1e-3, max_time=0.3, field_map_resolution=resolution, integrator=integrator)
+	batch_data = BatchCoilgunSimulation(*designs(), conf, max_times=max_times).run()
+
+	for k, (coil, power_source, projectile) in enumerate(zip(*designs())):
+		conf = SimulationConf(dt=1e-3, max_time=max_times[k], field_map_resolution=resolution, integrator=integrator)
+		sim_data = CoilgunSimulation(coil, power_source, projectile, conf).run()
+
+		assert batch_data.frames[k] == sim_data.frames()
+		assert batch_data.time[k] == pytest.approx(sim_data.time[-1], rel=1e-12)
+		assert batch_data.pos[k] == pytest.approx(sim_data.pos[-1], rel=1e-9)
+		assert batch_data.vel[k] == pytest.approx(sim_data.vel[-1], rel=1e-9)
+		assert batch_data.energy[k] == pytest.approx(sim_data.energy_consumption(), rel=1e-9)
+
+def test_constant_voltage():
+	"""The energy from a constant voltage should be V^2/R per second"""
+	coil = Solenoid(L=0.1, N=100, inner_diameter=0.1, wire_diameter=1e-3, resistivity=1e-9)
+	batch = BatchCoilgunSimulation(
+		[coil], [ConstantVoltage(voltage=2)], [MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1)],
+		SimulationConf(dt=0.125, max_time=1, field_map_resolution=200)
+	)
+
+	assert batch.run().energy[0] == pytest.approx(2**2 / coil.resistance(), rel=1e-9)
+
+def test_needs_field_map():
+	"""The batch simulation should refuse to evaluate the exact field member by member"""
+	with pytest.raises(NotImplementedError):
+		BatchCoilgunSimulation(*designs(), SimulationConf(dt=1e-3, max_time=0.3))
+
+def test_field_tables_outside():
+	"""The tables should agree with the field maps, inside the maps and with the exact gradient outside"""
+	coils, _, _ = designs()
+	tables = _FieldTables(coils, resolution=200)
+	members = np.arange(len(coils))
+
+	for i, coil in enumerate(coils):
+		fmap = field_map(coil, 200)
+		inside = fmap.z_min + 0.37 * (fmap.z_max - fmap.z_min)
+		z = np.array([fmap.z_min - 2 * coil.length(), fmap.z_max + 3 * coil.length()])
+
+		assert tables.gradient(members[i:i+1], np.ones(1), np.array([inside]))[0] == pytest.approx(fmap.B_field_gradiant(I=1, z=inside), rel=1e-12)
+		np.testing.assert_allclose(tables.gradient(np.full(2, i), np.full(2, 2.0), z), [fmap.B_field_gradiant(I=2, z=z_i) for z_i in z], rtol=1e-12)
@@ -1,4 +1,10 @@
+import numpy as np
+import pytest
 
+from coilgun.field_map import MappedCoil
+from coilgun.power_source import ConstantCurrent
+from coilgun.projectile import MagneticProjectile
+from simulation.simulate import CoilgunSimulation, SimulationConf
 
 
 def test_simulation(test_simulation):
@@ -7,4 +13,82 @@ def test_simulation(test_simulation):
 
 	# 10 second simulation with dt=1s
 	# This will give one frame for 0, 1, ..., 10
-	assert sim_data.frames() == 11
\ No newline at end of file
+	assert sim_data.frames() == 11
+
+def test_field_mapped_simulation(solenoid, constant_current_source, magnetic_projectile):
+	"""The field map is only used for the force, the simulation keeps the coil it was given"""
+	sim = CoilgunSimulation(
+		solenoid, constant_current_source, magnetic_projectile, SimulationConf(dt=1, max_time=10, field_map_resolution=200)
+	)
+	assert sim.coil is solenoid
+	assert isinstance(sim.field_coil, MappedCoil)
+	assert sim.run().frames() == 11
+
+def run_integrator(solenoid, integrator, dt, rtol=1e-6):
+	"""Run a projectile through the solenoid and return the simulation and its data"""
+	conf = SimulationConf(dt=dt, max_time=0.5, integrator=integrator, rtol=rtol, atol=rtol*1e-3)
+	sim = CoilgunSimulation(solenoid, ConstantCurrent(current=10), MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf)
+	return sim, sim.run()
+
+def test_integrators(solenoid):
+	"""The symplectic and adaptive integrators should be more accurate than Euler with fewer force evaluations"""
+	_, reference = run_integrator(solenoid, "AdaptiveRK", 1e-4, rtol=1e-12)
+	assert reference.time[-1] == 0.5
+
+	euler, euler_data = run_integrator(solenoid, "Euler", 2**-14)
+	euler_error = abs(euler_data.vel[-1] - reference.vel[-1])
+
+	for integrator, dt in [("SymplecticEuler", 2**-10), ("Verlet", 2**-10), ("AdaptiveRK", 1e-4)]:
+		sim, data = run_integrator(solenoid, integrator, dt)
+
+		assert data.time[-1] == pytest.approx(0.5, rel=1e-12)
+		assert sim.force_evaluations < euler.force_evaluations / 10
+		assert abs(data.vel[-1] - reference.vel[-1]) < euler_error
+
+def test_recordings(solenoid):
+	"""The summary and decimated recordings should agree with the full recording"""
+	def simulation(recording, record_every=1):
+		conf = SimulationConf(dt=1e-4, max_time=0.2, recording=recording, record_every=record_every)
+		return CoilgunSimulation(solenoid, ConstantCurrent(current=10), MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf)
+
+	full = simulation("Full").run()
+	summary = simulation("Summary").run()
+	decimated = simulation("Decimate", record_every=7).run()
+
+	assert summary.frames() == full.frames()
+	assert summary.position_limits() == full.position_limits()
+	assert summary.energy_consumption() == pytest.approx(full.energy_consumption(), rel=1e-12)
+	assert summary.energy_gain(0.01) == full.energy_gain(0.01)
+	assert summary.total_time() == full.total_time()
+
+	assert decimated.frames() == len(range(0, full.frames(), 7)) + 1
+	np.testing.assert_array_equal(decimated.vel[:-1], full.vel[::7])
+	assert decimated.vel[-1] == full.vel[-1]
+	assert decimated.energy_consumption() == pytest.approx(full.energy_consumption(), rel=1e-12)
+
+def test_stream(solenoid):
+	"""The streamed chunks should make up the full simulation"""
+	conf = SimulationConf(dt=1e-3, max_time=1)
+	full = CoilgunSimulation(solenoid, ConstantCurrent(current=10), MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf).run()
+	chunks = list(CoilgunSimulation(solenoid, ConstantCurrent(current=10), MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf).stream(chunk_frames=100))
+
+	assert max(chunk.frames() for chunk in chunks) == 100
+	np.testing.assert_array_equal(np.concatenate([chunk.pos for chunk in chunks]), full.pos)
+	np.testing.assert_array_equal(np.concatenate([chunk.energy for chunk in chunks]), full.energy)
+
+def test_buffer_growth(solenoid):
+	"""The buffers should grow when the adaptive integrator takes more steps than max_time/dt"""
+	conf = SimulationConf(dt=0.5, max_time=0.5, integrator="AdaptiveRK")
+	def simulation():
+		return CoilgunSimulation(solenoid, ConstantCurrent(current=10), MagneticProjectile(mass=0.01, pos=-0.1, vel=0, m=1), conf)
+
+	# The buffers start with room for 3 frames
+	chunks = list(simulation().stream())
+	chunked = list(simulation().stream(chunk_frames=3))
+
+	assert len(chunks) == 1
+	assert chunks[0].frames() > 3
+	assert chunks[0].time[-1] == pytest.approx(0.5, rel=1e-12)
+	assert np.all(np.diff(chunks[0].time) > 0)
+	np.testing.assert_array_equal(np.concatenate([chunk.pos for chunk in chunked]), chunks[0].pos)
+	np.testing.assert_array_equal(np.concatenate([chunk.energy for chunk in chunked]), chunks[0].energy)
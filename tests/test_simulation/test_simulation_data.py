@@ -1,3 +1,5 @@
+import numpy as np
+
 from simulation.simulate import SimulationData
 
 
@@ -11,4 +13,17 @@ def test_energy_calculations():
 	)
 
 	assert sim_data.energy_consumption() == 6
-	assert sim_data.energy_gain(projectile_mass=3) == 18
\ No newline at end of file
+	assert sim_data.energy_gain(projectile_mass=3) == 18
+
+def test_data_from_lists():
+	"""Data built from lists should be stored as float arrays"""
+	sim_data = SimulationData(time=[0, 1, 2], pos=[-1, 0, 2], vel=[1, 1, 2], energy=[0, 1, 1])
+
+	for values in (sim_data.time, sim_data.pos, sim_data.vel, sim_data.energy):
+		assert isinstance(values, np.ndarray)
+		assert values.dtype == float
+
+	assert sim_data.frames() == 3
+	assert sim_data.position_limits() == (-1, 2)
+	assert sim_data.total_time() == 2
+	np.testing.assert_array_equal(sim_data.pos[1:], [0, 2])
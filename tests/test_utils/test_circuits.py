@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from scipy import integrate
+
+from utils.circuits import rlc_solution
+
+
+@pytest.mark.parametrize("R", [0.5, 2.0, 10.0])
+def test_rlc_solution(R):
+	"""The exact solution should match a numerical solution for under, critically and overdamped circuits"""
+	L, C, I0, V0 = 1e-3, 1e-4, 5.0, 100.0
+	t = np.linspace(0, 5e-3, 11)
+
+	sol = integrate.solve_ivp(
+		lambda t, y: [(y[1] - R*y[0]) / L, -y[0] / C],
+		(0, t[-1]), [I0, V0], t_eval=t, rtol=1e-10, atol=1e-12
+	)
+	I, V = rlc_solution(R, L, C, I0, V0)[0](t)
+
+	np.testing.assert_allclose(I, sol.y[0], atol=1e-6)
+	np.testing.assert_allclose(V, sol.y[1], atol=1e-6)